@@ -2,7 +2,7 @@ import React, { useState, useEffect } from "react";
 import { useMemories } from "../store/useMemories";
 
 export default function AddMemoryModal() {
-    const { modalOpen, setModal, pendingCoords, add } = useMemories();
+    const { modalOpen, setModal, pendingCoords, add, previewPoster } = useMemories();
     const [formData, setFormData] = useState({
         artist: "",
         venue: "",
@@ -14,6 +14,13 @@ export default function AddMemoryModal() {
 
     const [isGeocoding, setIsGeocoding] = useState(false);
     const [geocodedCoords, setGeocodedCoords] = useState(null);
+    const [posterPreview, setPosterPreview] = useState(null); // object URL from POST /card/preview
+
+    // the preview goes stale when the form changes; free its blob
+    useEffect(() => {
+        if (!posterPreview) return;
+        return () => URL.revokeObjectURL(posterPreview);
+    }, [posterPreview]);
 
     // --- Helpers: date formatting (unchanged) ---
     const formatDateForDisplay = (dateStr) => {
@@ -112,6 +119,21 @@ export default function AddMemoryModal() {
     const handleChange = (e) => {
         const { name, value } = e.target;
         setFormData((prev) => ({ ...prev, [name]: value }));
+        setPosterPreview(null);
+    };
+
+    // renders on the server without saving anything
+    const handlePreview = async () => {
+        try {
+            setPosterPreview(await previewPoster({
+                artist: formData.artist.trim(),
+                city: formData.city.trim(),
+                country: formData.country.trim(),
+                date: formData.date.replace(/\./g, "-"),
+            }));
+        } catch (err) {
+            console.error("Poster preview failed:", err);
+        }
     };
 
     if (!modalOpen) return null;
@@ -189,9 +211,10 @@ export default function AddMemoryModal() {
                             name="date"
                             className="form-input"
                             value={formatDateForDisplay(formData.date)}
-                            onChange={(e) =>
-                                setFormData((p) => ({ ...p, date: formatDateForSubmission(e.target.value) }))
-                            }
+                            onChange={(e) => {
+                                setFormData((p) => ({ ...p, date: formatDateForSubmission(e.target.value) }));
+                                setPosterPreview(null);
+                            }}
                             required
                         />
                         <small className="form-helper">Stored as DD-MM-YYYY.</small>
@@ -211,8 +234,17 @@ export default function AddMemoryModal() {
                         </div>
                     )}
 
+                    {posterPreview && (
+                        <div className="poster-preview" style={{ marginTop: 12 }}>
+                            <img src={posterPreview} alt="Poster preview" style={{ width: "100%", borderRadius: 8 }} />
+                        </div>
+                    )}
+
                     <div className="form-actions">
                         <button type="button" className="btn-secondary" onClick={() => setModal(false)}>Cancel</button>
+                        <button type="button" className="btn-secondary" onClick={handlePreview} disabled={!formData.artist || !formData.city || !formData.date}>
+                            🎨 Preview poster
+                        </button>
                         <button type="submit" className="btn-primary" disabled={!formData.artist || !formData.city || !formData.date || !finalCoords}>
                             ✨ Add Memory
                         </button>
@@ -6,6 +6,7 @@ export const useMemories = create((set, get) => ({
     modalOpen: false,
     loading: false,
     pendingCoords: null, // {lat, lng}
+    syncToken: null,     // from X-Sync-Token; see GET /memories/changes
 
     // UI state
     setModal: (open) => set({ modalOpen: open }),
@@ -14,13 +15,28 @@ export const useMemories = create((set, get) => ({
     // Selectors/helpers
     byId: (id) => get().items.find((m) => m.id === id) || null,
     posterUrlOf: (id) => `${api.defaults.baseURL}/card/${id}.png`,
+    // poster for fields that are not saved yet; an object URL the caller revokes when done
+    previewPoster: async (fields, size = "feed") => {
+        const { data } = await api.post(`/card/preview?size=${size}`, fields, { responseType: "blob" });
+        return URL.createObjectURL(data);
+    },
 
     // API calls
+    // first call loads everything; later calls only fetch what changed since syncToken
     fetch: async () => {
         try {
             set({ loading: true });
+            if (get().syncToken !== null) {
+                try {
+                    await get().fetchChanges();
+                    return;
+                } catch (error) {
+                    // expired token (410) or no change log (501): fall back to a full load
+                    console.warn("Delta sync failed, refetching all memories:", error);
+                }
+            }
             const response = await api.get("/memories");
-            set({ items: response.data });
+            set({ items: response.data, syncToken: response.headers["x-sync-token"] ?? null });
         } catch (error) {
             console.error("Error fetching memories:", error);
         } finally {
@@ -28,6 +44,22 @@ export const useMemories = create((set, get) => ({
         }
     },
 
+    fetchChanges: async () => {
+        let since = get().syncToken;
+        let more = true;
+        while (more) {
+            const { data } = await api.get("/memories/changes", { params: { since } });
+            set(state => {
+                const byId = new Map(state.items.map(item => [item.id, item]));
+                data.deleted.forEach(id => byId.delete(id));
+                data.changes.forEach(item => byId.set(item.id, item));
+                return { items: [...byId.values()], syncToken: data.token };
+            });
+            since = data.token;
+            more = data.more;
+        }
+    },
+
     add: async (memoryData) => {
         try {
             set({ loading: true });
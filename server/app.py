@@ -1,39 +1,70 @@
 import os
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+import click
+from datetime import date, datetime
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, send_from_directory
 from flask_cors import CORS
-from contextlib import contextmanager
-from sqlmodel import select, SQLModel, create_engine, Session
+from PIL import ImageColor
+from sqlmodel import select, func
+from sqlalchemy import String, cast, extract
 from dotenv import load_dotenv
 
-from db import init_db, get_session
-from models import Memory
+load_dotenv()  # before db: the engine is configured from the environment at import
+
+from db import init_db, get_session, engine as db_engine, pool_stats
+from models import EnrichCacheEntry, Job, Memory
 from services.enrich import (
-    infer_palette,            # simple palette from text
-    fake_setlist,            # placeholder setlist
-    fetch_tracks_for_artist, # optional real lookup (if you wire it)
-    mood_palette_from_text   # alt palette function
+    enrich_fields,           # palette + tracks, real lookup once LASTFM_API_KEY is set
+    UpstreamError,
+    UpstreamRejected,
+    lookup_cache,            # per-artist cache in front of the track lookup
+    prefetch_artists,
 )
-from services.poster import draw_poster  # generates PNG poster
-
-load_dotenv()
-
-app = Flask(__name__)
-CORS(app, resources={r"*": {"origins": os.getenv("CLIENT_ORIGIN", "*")}})
-init_db()
-
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///musemap.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+from services.poster import RENDERER_VERSION  # poster cards: see card_variants
+from services import batch_render, bulk_import, card_cache, card_variants, export, geo_index, jobs, metrics, render_pool, search_index, serialize, stats, sync, uploads
+from services.pagination import encode_cursor, keyset, parse_limit
+
+class Request(Flask.request_class):
+    @property
+    def max_content_length(self):
+        # streamed imports are read one batch at a time, so their size is not capped
+        if self.endpoint in UNCAPPED_ENDPOINTS:
+            return None
+        return super().max_content_length
+
+UNCAPPED_ENDPOINTS = {"api.bulk_import_memories"}
+
+# every route and CLI command; create_app() registers them on a new app
+api = Blueprint("api", __name__, cli_group=None)
+metrics.instrument_engine(db_engine)
+lookup_cache.bind(db_engine, EnrichCacheEntry.__table__)
+# delete tombstones are kept this long; sync tokens older than that must refetch everything
+SYNC_TOMBSTONE_DAYS = float(os.getenv("SYNC_TOMBSTONE_DAYS", "30"))
 
 # --- filesystem setup ---
 BASE_DIR = os.path.dirname(__file__)
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads", "tickets")
-CARD_DIR = os.path.join(BASE_DIR, "static", "cards")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(CARD_DIR, exist_ok=True)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(BASE_DIR, "uploads", "tickets"))
+CARD_DIR = os.getenv("CARD_DIR", os.path.join(BASE_DIR, "static", "cards"))
+
+def prepare_storage():
+    """Create tables, indexes and the SQLite side tables, compact old tombstones and make the file dirs."""
+    init_db()
+    for install in (geo_index.install, search_index.install, stats.install, sync.install):
+        install(db_engine)
+    sync.compact(db_engine, SYNC_TOMBSTONE_DAYS)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(CARD_DIR, exist_ok=True)
 
 def parse_european_date(date_str):
     """Parse European date format (DD-MM-YYYY) to datetime.date object."""
+    # fast path for the canonical zero-padded forms; strptime is slow in bulk imports
+    if isinstance(date_str, str) and len(date_str) == 10 and date_str.replace("-", "").isdigit():
+        try:
+            if date_str[2] == date_str[5] == "-":
+                return date(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
+            if date_str[4] == date_str[7] == "-":
+                return date(int(date_str[:4]), int(date_str[5:7]), int(date_str[8:]))
+        except ValueError:
+            pass
     try:
         # Try European format first (DD-MM-YYYY)
         return datetime.strptime(date_str, "%d-%m-%Y").date()
@@ -46,25 +77,261 @@ def parse_european_date(date_str):
 
 def format_european_date(date_obj):
     """Format datetime.date object to European format (DD-MM-YYYY)."""
-    return date_obj.strftime("%d-%m-%Y")
-
-@app.get("/health")
+    return serialize.format_date(date_obj)
+
+def memory_fields(data):
+    """Validated Memory column values from request fields; raises KeyError/ValueError on bad input."""
+    return dict(
+        artist=data["artist"],
+        venue=data.get("venue") or "",
+        city=data["city"],
+        country=data.get("country") or "",
+        lat=float(data["lat"]),
+        lng=float(data["lng"]),
+        date=parse_european_date(data["date"]),
+        note=data.get("note") or "",
+    )
+
+MEMORY_FIELDS = serialize.parse_fields(None, Memory.__table__)
+
+def json_response(payload, status=200):
+    """JSON body encoded by the serializer (orjson when available)."""
+    return Response(serialize.dumps(payload), status=status, mimetype="application/json")
+
+@api.app_errorhandler(413)
+def request_too_large(e):
+    return {"error": f"request too large: max {current_app.config['MAX_CONTENT_LENGTH']} bytes"}, 413
+
+@api.get("/health")
 def health():
     return {"ok": True}
 
-@app.get("/memories")
+@api.get("/health/db")
+def health_db():
+    """Connection pool usage and checkout wait times."""
+    return pool_stats(db_engine)
+
+@api.get("/health/render")
+def health_render():
+    """Card render pool: workers, queue depth, in-flight renders, rejections and timeouts."""
+    return card_renderer.snapshot()
+
+@api.get("/metrics")
+def metrics_text():
+    """Prometheus scrape: request/SQL/span histograms plus connection pool and render pool gauges."""
+    gauges = {f"musemap_db_pool_{k}": (f"Connection pool {k.replace('_', ' ')}.", v)
+              for k, v in pool_stats(db_engine).items() if isinstance(v, (int, float))}
+    gauges.update({f"musemap_render_pool_{k}": (f"Card render pool {k.replace('_', ' ')}.", v)
+                   for k, v in card_renderer.snapshot().items()})
+    return Response(metrics.render(gauges), mimetype=metrics.CONTENT_TYPE)
+
+SORT_COLUMNS = {"date": Memory.date, "artist": Memory.artist, "city": Memory.city, "id": Memory.id}
+DISTINCT_COLUMNS = {"artist": Memory.artist, "city": Memory.city}
+
+@api.get("/memories")
 def list_memories():
+    """
+    Query params (all optional):
+    limit, cursor        keyset pagination; the next cursor is sent in X-Next-Cursor
+    sort                 date | artist | city | id, prefix with '-' for descending
+    year, artist, city, country
+    distinct             artist | city -> first memory per artist/city
+    fields               comma-separated columns to return, e.g. id,lat,lng,artist
+    The X-Sync-Token header is the token to pass to GET /memories/changes next.
+    """
+    args = request.args
+    sort = args.get("sort", "id")
+    descending = sort.startswith("-")
+    sort_col = SORT_COLUMNS.get(sort.lstrip("-"))
+    if sort_col is None:
+        return {"error": f"invalid value: sort must be one of {', '.join(SORT_COLUMNS)}"}, 400
+
+    try:
+        limit = parse_limit(args.get("limit"))
+        fields = serialize.parse_fields(args.get("fields"), Memory.__table__)
+        filters = []
+        if args.get("year"):
+            year = int(args["year"])
+            filters.append(Memory.date.between(date(year, 1, 1), date(year, 12, 31)))
+        for name in ("artist", "city", "country"):
+            if args.get(name):
+                filters.append(getattr(Memory, name) == args[name])
+
+        stmt = serialize.select_rows(Memory.__table__, fields, sort_col, Memory.id).where(*filters)
+        if args.get("distinct"):
+            col = DISTINCT_COLUMNS.get(args["distinct"])
+            if col is None:
+                raise ValueError(f"distinct must be one of {', '.join(DISTINCT_COLUMNS)}")
+            firsts = select(func.min(Memory.id)).where(*filters).group_by(col)
+            stmt = stmt.where(Memory.id.in_(firsts))
+        stmt = keyset(stmt, sort_col, Memory.id, args.get("cursor"), descending)
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    with get_session() as s:
+        # read before the rows: a write in between is sent again by the next delta, never lost
+        token = sync.current_token(s.connection()) if sync.has_sync(db_engine) else None
+        rows = s.exec(stmt.limit(limit + 1) if limit else stmt).all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), last.id)
+
+    # Dates go out in European format for the frontend
+    resp = json_response(serialize.to_dicts(fields, rows))
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    if token is not None:
+        resp.headers["X-Sync-Token"] = str(token)
+    return resp
+
+@api.get("/timeline")
+def timeline_years():
+    """Year buckets with memory counts, newest first, grouped in SQL over ix_memory_date."""
+    year = extract("year", Memory.date)
     with get_session() as s:
-        memories = s.exec(select(Memory)).all()
-        # Convert dates to European format for frontend
-        memories_data = []
-        for m in memories:
-            memory_dict = m.model_dump()
-            memory_dict['date'] = format_european_date(m.date)
-            memories_data.append(memory_dict)
-        return jsonify(memories_data)
+        rows = s.exec(select(year, func.count()).group_by(year).order_by(year.desc())).all()
+    return json_response([{"year": int(y), "count": n} for y, n in rows])
 
-@app.post("/memories")
+@api.get("/timeline/<int:year>")
+def timeline_year(year: int):
+    """
+    One year's memories sorted by date (sort=-date for newest first).
+    limit, cursor and fields work as on GET /memories.
+    """
+    sort = request.args.get("sort", "date")
+    if sort not in ("date", "-date"):
+        return {"error": "invalid value: sort must be date or -date"}, 400
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        fields = serialize.parse_fields(request.args.get("fields"), Memory.__table__)
+        if not 1 <= year <= 9999:
+            raise ValueError(f"year out of range: {year}")
+        stmt = serialize.select_rows(Memory.__table__, fields, Memory.date, Memory.id).where(
+            Memory.date.between(date(year, 1, 1), date(year, 12, 31)))
+        stmt = keyset(stmt, Memory.date, Memory.id, request.args.get("cursor"), sort == "-date")
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    with get_session() as s:
+        rows = s.exec(stmt.limit(limit + 1) if limit else stmt).all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+    resp = json_response(serialize.to_dicts(fields, rows))
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp
+
+@api.get("/memories/in-bbox")
+def memories_in_bbox():
+    """Memories inside a map viewport; west > east means the box crosses the antimeridian."""
+    try:
+        south, west, north, east = (float(request.args[k]) for k in ("south", "west", "north", "east"))
+        if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+            raise ValueError(f"bbox out of range: {south},{west},{north},{east}")
+        limit = parse_limit(request.args.get("limit"))
+        fields = serialize.parse_fields(request.args.get("fields"), Memory.__table__)
+    except KeyError as e:
+        return {"error": f"missing field: {e.args[0]}"}, 400
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    stmt = serialize.select_rows(Memory.__table__, fields).where(
+        geo_index.bbox_filter(Memory, db_engine, south, west, north, east))
+    with get_session() as s:
+        rows = s.exec(stmt.limit(limit) if limit else stmt).all()
+    return json_response(serialize.to_dicts(fields, rows))
+
+@api.get("/memories/search")
+def search_memories():
+    """Ranked full-text search; words match as prefixes and accents are ignored."""
+    q = request.args.get("q", "").strip()
+    if not q:
+        return {"error": "missing field: q"}, 400
+    try:
+        limit = parse_limit(request.args.get("limit"), default=50)
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    with get_session() as s:
+        results = []
+        for m, rank, highlights in search_index.search(s, Memory, db_engine, q, limit):
+            memory_dict = serialize.model_dict(m, MEMORY_FIELDS)
+            memory_dict['rank'] = rank
+            memory_dict['highlights'] = highlights
+            results.append(memory_dict)
+        return json_response(results)
+
+@api.cli.command("rebuild-search")
+def rebuild_search():
+    """Rebuild the full-text search index from the memory table."""
+    if not search_index.install(db_engine):
+        print("Full-text search needs SQLite with FTS5; nothing to rebuild.")
+        return
+    search_index.rebuild(db_engine)
+    print("Search index rebuilt.")
+
+@api.get("/stats")
+def memory_stats():
+    """
+    Counts per year, distinct artists/cities/countries and top-N lists, read
+    from the trigger-maintained summary table. top=N (default 10), full=1
+    adds the complete per-artist/city/country counts.
+    """
+    try:
+        top = int(request.args.get("top", 10))
+        if top < 0:
+            raise ValueError("top must not be negative")
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+    with get_session() as s:
+        return jsonify(stats.summary(s, Memory, db_engine, top=top, full=request.args.get("full") == "1"))
+
+@api.cli.command("check-stats")
+@click.option("--rebuild", is_flag=True, help="Recount from the memory table when counts differ.")
+def check_stats(rebuild):
+    """Compare the stats summary table with a full recount."""
+    if not stats.install(db_engine):
+        print("Summary tables need SQLite; /stats is computed on the fly.")
+        return
+    with get_session() as s:
+        diff = stats.check(s, Memory)
+    if not diff:
+        print("Stats are consistent.")
+        return
+    for dim, values in diff.items():
+        for value, (stored, actual) in sorted(values.items()):
+            print(f"{dim} {value!r}: stored {stored}, actual {actual}")
+    if rebuild:
+        stats.rebuild(db_engine)
+        print("Stats rebuilt.")
+
+@api.get("/memories/export")
+def export_memories():
+    """
+    Stream every memory as format=ndjson|csv|geojson. The body is gzipped when
+    gzip=1 or the client accepts gzip (gzip=0 turns it off).
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return {"error": f"invalid value: format must be one of {', '.join(export.FORMATS)}"}, 400
+    gzip_arg = request.args.get("gzip")
+    use_gzip = gzip_arg == "1" or (gzip_arg != "0" and "gzip" in request.accept_encodings)
+
+    mimetype, ext = export.FORMATS[fmt]
+    body = export.stream(db_engine, Memory.__table__, fmt, format_european_date, gzip=use_gzip)
+    resp = Response(body, mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename=memories.{ext}"
+    resp.vary.add("Accept-Encoding")
+    if use_gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+@api.post("/memories")
 def create_memory():
     """
     Accepts JSON OR multipart/form-data.
@@ -72,43 +339,65 @@ def create_memory():
     """
     data = request.form if request.form else request.get_json(force=True, silent=True) or {}
 
-    # optional file upload
-    assets = []
-    if "file" in request.files:
-        f = request.files["file"]
-        safe_name = datetime.now().strftime("%Y%m%d-%H%M%S_") + f.filename
-        out_path = os.path.join(UPLOAD_DIR, safe_name)
-        f.save(out_path)
-        assets.append(f"uploads/tickets/{safe_name}")
-
     try:
-        m = Memory(
-            artist=data["artist"],
-            venue=data.get("venue", ""),
-            city=data["city"],
-            country=data.get("country", ""),
-            lat=float(data["lat"]),
-            lng=float(data["lng"]),
-            date=parse_european_date(data["date"]),
-            note=data.get("note", ""),
-            assets=assets,            # ensure your models.Memory has this field
-        )
+        fields = memory_fields(data)
     except KeyError as e:
         return {"error": f"missing field: {e.args[0]}"}, 400
     except ValueError as e:
         return {"error": f"invalid value: {str(e)}"}, 400
 
+    # optional file upload, stored by content hash (the same file twice is kept once)
+    assets = []
+    if "file" in request.files:
+        try:
+            upload = uploads.store(request.files["file"].stream, UPLOAD_DIR)
+        except uploads.UploadError as e:
+            return {"error": str(e)}, e.status
+        uploads.schedule_thumbnail(upload)
+        assets.append(f"uploads/tickets/{upload.rel_path}")
+
+    m = Memory(
+        **fields,
+        assets=assets,            # ensure your models.Memory has this field
+    )
+
     with get_session() as s:
         s.add(m)
         s.commit()
         s.refresh(m)
         
         # Return with European date format
-        memory_dict = m.model_dump()
-        memory_dict['date'] = format_european_date(m.date)
-        return jsonify(memory_dict), 201
+        return json_response(serialize.model_dict(m, MEMORY_FIELDS), 201)
+
+@api.post("/memories/bulk")
+def bulk_import_memories():
+    """
+    Streamed NDJSON (one memory object per line) or CSV (header row) import.
+    Query params: format=ndjson|csv (default from Content-Type),
+    batch_size (rows per transaction), on_conflict=error|skip|update to dedupe
+    on (artist, date, venue); without it every valid row is inserted.
+    """
+    fmt = request.args.get("format") or bulk_import.detect_format(request.content_type)
+    if fmt not in bulk_import.FORMATS:
+        return {"error": "invalid value: send format=ndjson|csv or a matching Content-Type"}, 400
+    on_conflict = request.args.get("on_conflict")   # None: no dedupe, like POST /memories
+    if on_conflict is not None and on_conflict not in bulk_import.CONFLICT_MODES:
+        return {"error": f"invalid value: on_conflict must be one of {', '.join(bulk_import.CONFLICT_MODES)}"}, 400
+    try:
+        batch_size = min(int(request.args.get("batch_size", bulk_import.DEFAULT_BATCH_SIZE)), bulk_import.MAX_BATCH_SIZE)
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
 
-@app.put("/memories/<int:mid>")
+    with get_session() as s:
+        report = bulk_import.import_records(
+            s, Memory, bulk_import.iter_records(request.stream, fmt), memory_fields,
+            batch_size=batch_size, on_conflict=on_conflict,
+        )
+    return jsonify(report.to_dict())
+
+@api.put("/memories/<int:mid>")
 def update_memory(mid: int):
     """Update an existing memory."""
     data = request.get_json(force=True, silent=True) or {}
@@ -142,13 +431,12 @@ def update_memory(mid: int):
         s.add(m)
         s.commit()
         s.refresh(m)
+        card_cache.invalidate(CARD_DIR, mid)
         
         # Return with European date format
-        memory_dict = m.model_dump()
-        memory_dict['date'] = format_european_date(m.date)
-        return jsonify(memory_dict)
+        return json_response(serialize.model_dict(m, MEMORY_FIELDS))
 
-@app.delete("/memories/<int:mid>")
+@api.delete("/memories/<int:mid>")
 def delete_memory(mid: int):
     """Delete a memory."""
     with get_session() as s:
@@ -158,82 +446,558 @@ def delete_memory(mid: int):
 
         s.delete(m)
         s.commit()
+        card_cache.invalidate(CARD_DIR, mid)
         return {"message": "Memory deleted successfully"}
 
+SYNC_PAGE_SIZE = 1000
+
+@api.get("/memories/changes")
+def memory_changes():
+    """
+    Delta sync: memories created or updated and ids deleted since a token.
+    Query params: since (required: the X-Sync-Token of GET /memories or a previous
+    response's token), limit (default 1000), fields. Follow "token" while "more" is true.
+    410 when the token is older than the tombstone retention: refetch GET /memories.
+    """
+    if not sync.has_sync(db_engine):
+        return {"error": "change tracking is not available on this database"}, 501
+    if not request.args.get("since"):
+        return {"error": "missing field: since (start from the X-Sync-Token of GET /memories)"}, 400
+    try:
+        since = sync.parse_token(request.args.get("since"))
+        limit = parse_limit(request.args.get("limit"), SYNC_PAGE_SIZE)
+        fields = serialize.parse_fields(request.args.get("fields"), Memory.__table__)
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    with get_session() as s:
+        try:
+            changed, deleted, token, more = sync.changes(s.connection(), since, limit)
+        except sync.TokenExpired as e:
+            return {"error": str(e)}, 410
+        rows = s.exec(serialize.select_rows(Memory.__table__, fields, Memory.id)
+                      .where(Memory.id.in_(changed))).all() if changed else []
+    # oldest change first, like the log
+    order = {mid: i for i, mid in enumerate(changed)}
+    rows = sorted(rows, key=lambda r: order[r.id])
+    return json_response({"changes": serialize.to_dicts(fields, rows), "deleted": deleted,
+                          "token": str(token), "more": more})
+
+@api.cli.command("compact-changes")
+@click.option("--days", type=float, help="Tombstone retention in days (default SYNC_TOMBSTONE_DAYS).")
+def compact_changes(days):
+    """Drop delete tombstones older than the retention window (clients older than that refetch)."""
+    removed = sync.compact(db_engine, SYNC_TOMBSTONE_DAYS if days is None else days)
+    print(f"Removed {removed} tombstones.")
+
 # RESTful enrich route
-@app.post("/memories/<int:mid>/enrich")
+@api.post("/memories/<int:mid>/enrich")
 def enrich_memory(mid: int):
     with get_session() as s:
         m = s.get(Memory, mid)
         if not m:
             return {"error": "not found"}, 404
 
-        # Use your preferred palette function
-        m.palette = infer_palette(m.note or m.artist)
-        # Swap fake_setlist with fetch_tracks_for_artist when you hook an API key
-        m.tracks = fake_setlist(m.artist)
+        try:
+            fields = enrich_fields(m.artist, m.note)
+        except UpstreamError as e:
+            return {"error": f"enrichment failed: {str(e)}"}, 502
+        m.palette = fields["palette"]
+        m.tracks = fields["tracks"]
 
         s.add(m)
         s.commit()
         s.refresh(m)
+        card_cache.invalidate(CARD_DIR, mid)
         
         # Return with European date format
-        memory_dict = m.model_dump()
-        memory_dict['date'] = format_european_date(m.date)
-        return jsonify(memory_dict)
+        return json_response(serialize.model_dict(m, MEMORY_FIELDS))
 
 
 # Backward-compat alias if you already called /enrich/<id> somewhere
-@app.post("/enrich/<int:mid>")
+@api.post("/enrich/<int:mid>")
 def enrich_compat(mid: int):
     return enrich_memory(mid)
 
 
-@app.get("/card/<int:mid>.png")
-def card_png(mid: int):
+# --- background enrichment ---
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "2"))
+ENRICH_QUEUE_SIZE = int(os.getenv("ENRICH_QUEUE_SIZE", "100"))
+ENRICH_RETRIES = int(os.getenv("ENRICH_RETRIES", "3"))
+ENRICH_RETRY_DELAY = float(os.getenv("ENRICH_RETRY_DELAY", "0.5"))
+
+def job_dict(job):
+    job_data = job.model_dump()
+    job_data["created_at"] = job.created_at.isoformat()
+    job_data["updated_at"] = job.updated_at.isoformat()
+    job_data["total"] = job.params.get("total", len(job.memory_ids)) if job.params else len(job.memory_ids)
+    return job_data
+
+def pending_jobs(kind: str) -> list[int]:
+    """Ids of the jobs of this kind still to run, oldest first (queued, or running when the server stopped)."""
+    with get_session() as s:
+        return list(s.exec(select(Job.id).where(
+            Job.kind == kind, Job.status.in_(["queued", "running"])).order_by(Job.id)).all())
+
+def fail_job(job_id: int, error: Exception):
+    """Record a job that crashed (anything but a per-memory upstream failure) as failed."""
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        if job:
+            job.status = "failed"
+            job.error = f"{type(error).__name__}: {error}"
+            job.updated_at = datetime.utcnow()
+            s.add(job)
+            s.commit()
+
+def run_enrich_job(job_id: int):
+    """Enrich every memory of a job; progress is committed per memory so a restart resumes."""
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        if not job or job.status in ("done", "failed"):
+            return
+        job.status = "running"
+        job.attempts += 1
+        job.updated_at = datetime.utcnow()
+        s.add(job)
+        s.commit()
+        pending = job.memory_ids[job.processed:]
+
+    for mid in pending:
+        failed = False
+        with get_session() as s:
+            m = s.get(Memory, mid)
+            source = (m.artist, m.note) if m else None
+        if source:
+            try:
+                fields = jobs.with_retries(
+                    lambda: enrich_fields(*source),
+                    retries=ENRICH_RETRIES, base_delay=ENRICH_RETRY_DELAY,
+                    retry_on=(UpstreamError,), give_up_on=(UpstreamRejected,),
+                )
+            except UpstreamError:
+                failed = True
+            else:
+                with get_session() as s:
+                    m = s.get(Memory, mid)
+                    if m:
+                        m.palette = fields["palette"]
+                        m.tracks = fields["tracks"]
+                        s.add(m)
+                        s.commit()
+                        card_cache.invalidate(CARD_DIR, mid)
+
+        with get_session() as s:
+            job = s.get(Job, job_id)
+            job.processed += 1
+            if failed:
+                job.failed_ids = [*job.failed_ids, mid]
+            job.updated_at = datetime.utcnow()
+            s.add(job)
+            s.commit()
+
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        job.status = "done"
+        if job.failed_ids:
+            job.error = f"{len(job.failed_ids)} memories could not be enriched"
+        job.updated_at = datetime.utcnow()
+        s.add(job)
+        s.commit()
+
+enrich_jobs = jobs.JobRunner(run_enrich_job, lambda: pending_jobs("enrich"), workers=ENRICH_WORKERS,
+                             name="enrich", on_error=fail_job)
+
+@api.post("/memories/enrich")
+def enrich_batch():
+    """
+    Queue background enrichment: {"ids": [1, 2, 3]} or {"unenriched": true}.
+    Returns 202 with the job; poll GET /jobs/<id> for progress.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    with get_session() as s:
+        if data.get("unenriched"):
+            empty = func.coalesce(cast(Memory.tracks, String), "null").in_(["null", "[]"])
+            ids = list(s.exec(select(Memory.id).where(empty).order_by(Memory.id)).all())
+        elif isinstance(data.get("ids"), list):
+            try:
+                ids = [int(i) for i in data["ids"]]
+            except (TypeError, ValueError):
+                return {"error": "invalid value: ids must be integers"}, 400
+        else:
+            return {"error": "missing field: ids"}, 400
+        if len(pending_jobs("enrich")) >= ENRICH_QUEUE_SIZE:
+            return {"error": "enrichment queue is full, try again later"}, 503, {"Retry-After": "30"}
+
+        job = Job(kind="enrich", memory_ids=ids)
+        s.add(job)
+        s.commit()
+        s.refresh(job)
+    enrich_jobs.wake()
+    return jsonify(job_dict(job)), 202, {"Location": f"/jobs/{job.id}"}
+
+@api.get("/enrich/cache")
+def enrich_cache_stats():
+    """Hit/miss/latency counters of the per-artist enrichment cache."""
+    return jsonify(lookup_cache.snapshot())
+
+@api.cli.command("prefetch-enrichment")
+def prefetch_enrichment():
+    """Warm the enrichment cache for every distinct artist in the database."""
+    with get_session() as s:
+        artists = s.exec(select(Memory.artist).distinct()).all()
+    failed = prefetch_artists(artists)
+    print(f"Prefetched {len(artists)} artists ({failed} failed).")
+
+@api.get("/jobs/<int:job_id>")
+def job_status(job_id: int):
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        if not job:
+            return {"error": "not found"}, 404
+        return jsonify(job_dict(job))
+
+
+# --- poster cards ---
+# public URL the QR codes point at; defaults to the URL the card was requested on
+CARD_BASE_URL = os.getenv("CARD_BASE_URL", "")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or None   # None: one per core
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# on-demand renders run here, off the request threads (RENDER_PROCESSES, RENDER_QUEUE_DEPTH, RENDER_TIMEOUT)
+card_renderer = render_pool.RenderPool()
+# renders a card request starts or joins before it gives up with 503
+CARD_RENDER_ATTEMPTS = 3
+
+def card_args(m, base_url, qr_style="mono"):
+    """render_poster inputs for a memory's print-size master; everything that affects the pixels."""
+    return dict(
+        artist=m.artist,
+        city=f"{m.city}, {m.country}".strip(", "),
+        date_str=m.date.strftime("%d %b %Y"),
+        # choose a palette fallback if not enriched yet
+        palette=m.palette or ["#222", "#333", "#444", "#ddd", "#fff"],
+        tracks=m.tracks or [],
+        # if frontend is separate, set CARD_BASE_URL to its public URL
+        qr_url=base_url.rstrip("/") + (f"/memories/{m.id}" if m.id is not None else "/"),
+        width=card_variants.BASE_WIDTH, height=card_variants.BASE_HEIGHT,
+        scale=card_variants.MASTER_SCALE, theme="dark", qr_style=qr_style,
+    )
+
+def card_master(mid, master_args):
+    """(master key, master path); the key changes whenever the pixels would."""
+    key = card_cache.card_key({**master_args, "renderer": RENDERER_VERSION})
+    return key, card_variants.master_path(CARD_DIR, mid, key)
+
+def card_variant(mid, master_key, width, fmt):
+    """(strong ETag, file name) of one size/format cut from a master."""
+    etag = card_cache.card_key({"master": master_key, "width": width, "format": fmt,
+                                "encoder": card_variants.ENCODER_OPTIONS[fmt]})
+    return etag, card_variants.variant_name(mid, master_key, width, fmt)
+
+def card_tasks(ids, widths, formats, base_url):
+    """[(mid, master_path, master_args, [(variant_path, width, fmt)])] for ids (all when None)."""
+    stmt = select(Memory).order_by(Memory.id)
+    if ids is not None:
+        stmt = stmt.where(Memory.id.in_(ids))
+    tasks = []
+    with get_session() as s:
+        for m in s.exec(stmt):
+            master_args = card_args(m, base_url)
+            key, master_path = card_master(m.id, master_args)
+            variants = [(os.path.join(CARD_DIR, card_variant(m.id, key, w, f)[1]), w, f)
+                        for w in widths for f in formats]
+            tasks.append((m.id, master_path, master_args, variants))
+    return tasks
+
+def card_params(args, ext=None):
+    """(width, format, qr style, format negotiated via Accept) from card query params; ValueError when invalid."""
+    width = card_variants.parse_width(args.get("size"), args.get("scale"))
+    negotiated = not (args.get("format") or ext)
+    if negotiated:
+        fmt = card_variants.negotiate(request.accept_mimetypes)
+    else:
+        fmt = card_variants.parse_format(args.get("format") or ext)
+    qr_style = args.get("qr", "mono")
+    if qr_style not in ("mono", "palette"):
+        raise ValueError("qr must be mono or palette")
+    return width, fmt, qr_style, negotiated
+
+def preview_memory(data):
+    """Unsaved Memory with just what a card shows; raises KeyError/ValueError on bad input."""
+    if not isinstance(data, dict):
+        raise ValueError("body must be a JSON object")
+    for name in ("artist", "city", "date"):
+        if name in data and not isinstance(data[name], str):
+            raise ValueError(f"{name} must be a string")
+    for name in ("country", "venue"):
+        if not isinstance(data.get(name) or "", str):
+            raise ValueError(f"{name} must be a string")
+    palette, tracks = data.get("palette") or [], data.get("tracks") or []
+    if not isinstance(palette, list) or not all(isinstance(c, str) for c in palette):
+        raise ValueError("palette must be a list of colors")
+    for color in palette:
+        ImageColor.getrgb(color)   # ValueError: unknown color specifier
+    if not isinstance(tracks, list) or not all(isinstance(t, str) for t in tracks):
+        raise ValueError("tracks must be a list of strings")
+    return Memory(artist=data["artist"], city=data["city"], country=data.get("country") or "",
+                  date=parse_european_date(data["date"]), palette=palette[:5], tracks=tracks[:7])
+
+@api.get("/card/<int:mid>")
+@api.get("/card/<int:mid>.<ext>")
+def card_image(mid: int, ext=None):
+    """
+    Poster card. Query params: size=thumb|feed|print (or legacy scale<=2),
+    format=png|webp|jpeg (else the extension, else the Accept header), qr=mono|palette.
+    """
+    try:
+        width, fmt, qr_style, negotiated = card_params(request.args, ext)
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
     with get_session() as s:
         m = s.get(Memory, mid)
         if not m:
             return {"error": "not found"}, 404
+        master_args = card_args(m, CARD_BASE_URL or request.host_url, qr_style)
+
+    # everything that affects the bytes goes into the key, so it is also a strong ETag
+    master_key, master_path = card_master(mid, master_args)
+    etag, out_name = card_variant(mid, master_key, width, fmt)
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        if negotiated:
+            resp.vary.add("Accept")
+        return resp
+    # CPU-bound: render in the process pool and shed load once it is full. One render per
+    # master at a time: concurrent requests for this card join the render in flight, and
+    # one that wanted another size/format then cuts its own variant from the fresh master.
+    attempts = 0
+    while card_cache.lookup(CARD_DIR, out_name) is None:
+        if attempts == CARD_RENDER_ATTEMPTS:
+            return {"error": "card is still rendering, try again shortly"}, 503, {"Retry-After": "1"}
+        attempts += 1
+        try:
+            card_renderer.run(batch_render.render_to, master_path, master_args,
+                              [(os.path.join(CARD_DIR, out_name), width, fmt)], key=master_path)
+        except render_pool.Saturated:
+            return {"error": "card renderer is busy, try again later"}, 503, {"Retry-After": "5"}
+        except render_pool.RenderTimeout:
+            # still rendering; it will be cached by the time the client retries
+            return {"error": "card is still rendering, try again shortly"}, 503, {"Retry-After": "2"}
+        card_cache.evict(CARD_DIR)
+
+    resp = send_from_directory(CARD_DIR, out_name, etag=etag, mimetype=card_variants.FORMATS[fmt][0])
+    resp.cache_control.no_cache = True
+    if negotiated:
+        resp.vary.add("Accept")
+    return resp
+
+@api.post("/card/preview")
+def card_preview():
+    """
+    Poster card for memory fields that are not saved yet (artist, city, country, date,
+    optional palette/tracks), e.g. while adding a memory. Same query params as GET /card/<id>;
+    rendered and encoded in memory: nothing is cached or written to disk.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        width, fmt, qr_style, negotiated = card_params(request.args)
+        m = preview_memory(data)
+    except KeyError as e:
+        return {"error": f"missing field: {e.args[0]}"}, 400
+    except (TypeError, ValueError) as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
 
-        date_str = m.date.strftime("%d %b %Y")
-        # if frontend is separate, you can replace with its public URL
-        qr_target = request.host_url.rstrip("/") + f"/memories/{mid}"
+    try:
+        image = card_renderer.run(card_variants.render_bytes,
+                                  card_args(m, CARD_BASE_URL or request.host_url, qr_style), width, fmt)
+    except render_pool.Saturated:
+        return {"error": "card renderer is busy, try again later"}, 503, {"Retry-After": "5"}
+    except render_pool.RenderTimeout:
+        return {"error": "card preview took too long, try again later"}, 503, {"Retry-After": "5"}
+
+    resp = Response(image, mimetype=card_variants.FORMATS[fmt][0])
+    resp.cache_control.no_store = True
+    if negotiated:
+        resp.vary.add("Accept")
+    return resp
+
+
+def render_batch(tasks, workers=None, on_card=None):
+    """Render tasks on the process pool, then trim the card cache back to its size limit."""
+    report = batch_render.render_cards([t[1:] for t in tasks], workers=workers or RENDER_WORKERS, progress=on_card)
+    card_cache.evict(CARD_DIR)
+    return report
+
+def run_render_job(job_id: int):
+    """Pre-render the cards of a job; unchanged cards are skipped, so a restart just resumes."""
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        if not job or job.status in ("done", "failed"):
+            return
+        job.status = "running"
+        job.attempts += 1
+        job.processed = 0
+        job.updated_at = datetime.utcnow()
+        s.add(job)
+        s.commit()
+        ids, params = job.memory_ids, dict(job.params)
+
+    # jobs queued before named sizes stored scale factors
+    widths = params.get("widths") or [card_variants.parse_width(scale=min(v, card_variants.MASTER_SCALE))
+                                      for v in params.get("scales", [1.0])]
+    tasks = card_tasks(ids, widths, params.get("formats") or ["png"], params["base_url"])
+    mid_of = {master_path: mid for mid, master_path, _, _ in tasks}
+
+    def on_card(done, total, master_path, seconds, error):
+        with get_session() as s:
+            job = s.get(Job, job_id)
+            job.processed = done
+            if error:
+                job.failed_ids = [*job.failed_ids, mid_of[master_path]]
+            job.updated_at = datetime.utcnow()
+            s.add(job)
+            s.commit()
+
+    report = render_batch(tasks, on_card=on_card)
+    with get_session() as s:
+        job = s.get(Job, job_id)
+        job.status = "done"
+        job.processed = report["total"]
+        job.params = {**params, "total": report["total"], **{k: report[k] for k in (
+            "rendered", "skipped", "failed", "seconds", "card_seconds")}}
+        if report["failed"]:
+            job.error = f"{report['failed']} cards could not be rendered"
+        job.updated_at = datetime.utcnow()
+        s.add(job)
+        s.commit()
 
-        out_name = f"card_{mid}.png"
-        out_path = os.path.join(CARD_DIR, out_name)
+render_jobs = jobs.JobRunner(run_render_job, lambda: pending_jobs("render"), workers=1, name="render",
+                             on_error=fail_job)
+# pending render jobs before POST /admin/cards/render answers 503
+RENDER_QUEUE_SIZE = 10
 
-        # choose a palette fallback if not enriched yet
-        palette = m.palette or ["#222", "#333", "#444", "#ddd", "#fff"]
-        tracks = m.tracks or []
-
-        scale = float(request.args.get("scale", "1.0"))
-        draw_poster(
-            artist=m.artist,
-            city=f"{m.city}, {m.country}".strip(", "),
-            date_str=date_str,
-            palette=palette,
-            tracks=tracks,
-            qr_url=qr_target,
-            out_path=out_path,
-            width=640, height=960, scale=scale
-        )
-        return send_from_directory(CARD_DIR, out_name)
+def parse_variants(sizes=(), formats=(), scales=()):
+    """(widths, formats) to pre-render; sizes are named sizes, scales the legacy factors."""
+    widths = [card_variants.parse_width(size=v) for v in sizes]
+    widths += [card_variants.parse_width(scale=v) for v in scales]
+    formats = [card_variants.parse_format(f) for f in formats] or ["png"]
+    return list(dict.fromkeys(widths or [card_variants.parse_width()])), list(dict.fromkeys(formats))
+
+@api.post("/admin/cards/render")
+def render_cards_admin():
+    """
+    Pre-render cards in the background: {"ids": [...]} (default: every memory),
+    {"sizes": ["thumb", "feed"], "formats": ["webp", "png"]} (or legacy "scales").
+    Returns 202 with the job; poll GET /jobs/<id>.
+    Requires the X-Admin-Token header when ADMIN_TOKEN is set.
+    """
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return {"error": "forbidden"}, 403
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        widths, formats = parse_variants(data.get("sizes") or [], data.get("formats") or [], data.get("scales") or [])
+        ids = None if data.get("ids") is None else [int(i) for i in data["ids"]]
+    except (TypeError, ValueError) as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
+
+    with get_session() as s:
+        if ids is None:
+            ids = list(s.exec(select(Memory.id).order_by(Memory.id)).all())
+        base_url = CARD_BASE_URL or request.host_url
+        if len(pending_jobs("render")) >= RENDER_QUEUE_SIZE:
+            return {"error": "render queue is full, try again later"}, 503, {"Retry-After": "60"}
+        job = Job(kind="render", memory_ids=ids,
+                  params={"widths": widths, "formats": formats, "base_url": base_url, "total": len(ids)})
+        s.add(job)
+        s.commit()
+        s.refresh(job)
+    render_jobs.wake()
+    return jsonify(job_dict(job)), 202, {"Location": f"/jobs/{job.id}"}
+
+@api.cli.command("render-cards")
+@click.option("--ids", help="Comma-separated memory ids (default: every memory).")
+@click.option("--size", "sizes", type=click.Choice(list(card_variants.SIZES)), multiple=True,
+              help=f"Named size; repeat for several (default {card_variants.DEFAULT_SIZE}).")
+@click.option("--format", "formats", type=click.Choice(list(card_variants.FORMATS) + ["jpg"]), multiple=True,
+              help="Image format; repeat for several (default png).")
+@click.option("--scale", "scales", type=float, multiple=True, help="Legacy scale factor instead of a named size.")
+@click.option("--workers", type=int, help="Worker processes (default RENDER_WORKERS or one per core).")
+@click.option("--base-url", help="URL the QR codes point at (default CARD_BASE_URL or http://localhost:$PORT).")
+def render_cards_command(ids, sizes, formats, scales, workers, base_url):
+    """Pre-render poster cards in parallel, skipping cards that are already current."""
+    base_url = base_url or CARD_BASE_URL or f"http://localhost:{os.getenv('PORT', 5001)}"
+    id_list = [int(i) for i in ids.split(",")] if ids else None
+    try:
+        widths, formats = parse_variants(sizes, formats, scales)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    tasks = card_tasks(id_list, widths, formats, base_url)
+
+    def on_card(done, total, master_path, seconds, error):
+        status = f"failed: {error}" if error else f"{seconds * 1000:.0f} ms"
+        print(f"[{done}/{total}] {os.path.basename(master_path)} {status}")
 
+    report = render_batch(tasks, workers=workers, on_card=on_card)
+    t = report["card_seconds"]
+    print(f"Rendered {report['rendered']}, skipped {report['skipped']} unchanged, "
+          f"failed {report['failed']} in {report['seconds']:.1f}s")
+    if t["mean"] is not None:
+        print(f"Per card: mean {t['mean'] * 1000:.0f} ms, p50 {t['p50'] * 1000:.0f} ms, max {t['max'] * 1000:.0f} ms")
 
-@app.get("/memories/<int:mid>")
+
+@api.get("/memories/<int:mid>")
 def memory_detail(mid: int):
+    try:
+        fields = serialize.parse_fields(request.args.get("fields"), Memory.__table__)
+    except ValueError as e:
+        return {"error": f"invalid value: {str(e)}"}, 400
     with get_session() as s:
-        m = s.get(Memory, mid)
-        if not m:
-            return {"error": "not found"}, 404
-        
-        # Return with European date format
-        memory_dict = m.model_dump()
-        memory_dict['date'] = format_european_date(m.date)
-        return jsonify(memory_dict)
+        row = s.exec(serialize.select_rows(Memory.__table__, fields).where(Memory.id == mid)).first()
+    if row is None:
+        return {"error": "not found"}, 404
+
+    # Return with European date format
+    return json_response(serialize.to_dicts(fields, [row])[0])
+
+
+def start_jobs():
+    """
+    Run the background jobs (enrichment, card pre-rendering) in this process,
+    including the ones a previous process left unfinished. Only one process
+    per database may do this: serve.py runs them in its parent process.
+    """
+    enrich_jobs.start()
+    render_jobs.start()
+
+
+def create_app(config=None, *, storage=True, background=False):
+    """
+    A new Flask app serving every route (config overrides the defaults).
+    storage=True first prepares the database and file dirs (prepare_storage);
+    background=True also starts the job runners here (start_jobs).
+    """
+    if storage:
+        prepare_storage()
+    app = Flask(__name__)
+    app.request_class = Request
+    # bodies over the upload limit (plus room for the other form fields) get 413 before they are read
+    app.config["MAX_CONTENT_LENGTH"] = uploads.MAX_BYTES + int(os.getenv("UPLOAD_FORM_OVERHEAD", str(64 * 1024)))
+    app.config.update(config or {})
+    CORS(app, resources={r"*": {"origins": os.getenv("CLIENT_ORIGIN", "*")}}, expose_headers=["X-Next-Cursor", "X-Sync-Token", "Server-Timing"])
+    metrics.init_app(app)
+    app.register_blueprint(api)
+    if background:
+        start_jobs()
+    return app
 
 
 if __name__ == "__main__":
+    # development only; use `python serve.py` in production
     port = int(os.getenv("PORT", 5001))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # the reloader runs this file twice, as a file watcher and as the server it
+    # restarts; only the server prepares storage and runs the background jobs
+    serving = os.getenv("WERKZEUG_RUN_MAIN") == "true"
+    create_app(storage=serving, background=serving).run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compare viewport queries: full-table transfer vs. (lat, lng) range scan vs. R*Tree.
+Usage (from the server directory): python benchmarks/bench_bbox.py --rows 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models import Memory
+from services import geo_index
+
+
+def build_db(path, rows, seed):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    rnd = random.Random(seed)
+    with engine.begin() as conn:
+        conn.execute(Memory.__table__.insert(), [
+            dict(artist=f"Artist {i % 5000}", venue="", city=f"City {i % 800}", country="",
+                 date=date(2000 + i % 25, 1 + i % 12, 1 + i % 28), lat=rnd.uniform(-60, 70),
+                 lng=rnd.uniform(-180, 180), note="", tracks=[], palette=[], assets=[])
+            for i in range(rows)
+        ])
+    return engine
+
+
+def viewports(n, seed):
+    """City-scale to country-scale boxes, like a map zoomed in on one region."""
+    rnd = random.Random(seed)
+    for _ in range(n):
+        span = rnd.uniform(0.5, 6)
+        south, west = rnd.uniform(-60, 60), rnd.uniform(-180, 175)
+        yield south, west, south + span, west + span
+
+
+def timed(fn, boxes):
+    start = time.perf_counter()
+    for box in boxes:
+        fn(*box)
+    return (time.perf_counter() - start) * 1000 / len(boxes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {args.rows} memories...")
+        engine = build_db(os.path.join(tmp, "bench.db"), args.rows, args.seed)
+        boxes = list(viewports(args.queries, args.seed))
+
+        def full_table(south, west, north, east):
+            # what the client does today: download everything, filter locally
+            with Session(engine) as s:
+                return sum(1 for m in s.exec(select(Memory)) if south <= m.lat <= north and west <= m.lng <= east)
+
+        def bbox_query(south, west, north, east):
+            with Session(engine) as s:
+                return len(s.exec(select(Memory).where(geo_index.bbox_filter(Memory, engine, south, west, north, east))).all())
+
+        results = {"full table": timed(full_table, boxes[:5])}
+        results["range scan"] = timed(bbox_query, boxes)
+        assert geo_index.install(engine), "sqlite build lacks the rtree module"
+        geo_index.RTREE_MIN_ROWS = 0
+        results["rtree"] = timed(bbox_query, boxes)
+
+        print(f"{'strategy':<12} {'ms/query':>10}")
+        for name, ms in results.items():
+            print(f"{name:<12} {ms:>10.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure POST /memories/bulk throughput into a scratch SQLite database.
+Usage (from the server directory): python benchmarks/bench_bulk_import.py --rows 50000
+
+Each batch pays a fixed cost (side-table catch-up, commit, WAL checkpoint), so the
+inserts reach the 10,000 rows/s target with --batch-size 5000 but not at the default
+1000 (about 8k plain and 6k deduped on one core). Re-imports clear it either way.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at scratch storage before it is imported
+_TMP = tempfile.mkdtemp(prefix="musemap-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'bench.db')}"
+os.environ["CARD_DIR"] = os.path.join(_TMP, "cards")
+os.environ["UPLOAD_DIR"] = os.path.join(_TMP, "uploads")
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import app as musemap
+
+TARGET_ROWS_PER_S = 10_000
+
+
+def ndjson_lines(rows, seed, offset=0):
+    rnd = random.Random(seed)
+    for i in range(rows):
+        yield (json.dumps({
+            "artist": f"Artist {i % 5000}", "venue": f"Venue {offset + i}", "city": f"City {i % 800}",
+            "country": "Benchmark", "date": f"{1 + i % 28:02d}-{1 + i % 12:02d}-{2000 + i % 25}",
+            "lat": rnd.uniform(-60, 70), "lng": rnd.uniform(-180, 180), "note": "",
+        }) + "\n").encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = musemap.create_app().test_client()
+    # (label, first venue number, query): the dedupe insert gets fresh keys, the re-import repeats them
+    passes = (("insert", 0, ""), ("insert (dedupe)", args.rows, "&on_conflict=error"),
+              ("re-import (skip)", args.rows, "&on_conflict=skip"))
+    for label, offset, query in passes:
+        body = b"".join(ndjson_lines(args.rows, args.seed, offset))
+        start = time.perf_counter()
+        res = client.post(f"/memories/bulk?batch_size={args.batch_size}{query}",
+                          data=body, content_type="application/x-ndjson")
+        elapsed = time.perf_counter() - start
+        report = res.get_json()
+        rate = args.rows / elapsed
+        verdict = "meets" if rate >= TARGET_ROWS_PER_S else "below"
+        print(f"{label:<18} {rate:>10.0f} rows/s  {verdict} the {TARGET_ROWS_PER_S:,} rows/s target  "
+              f"(inserted={report['inserted']} skipped={report['skipped']} failed={report['failed']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write load from concurrent threads: SQLite defaults (rollback
+journal, synchronous=FULL, no busy timeout) vs. the tuned engine from db.py.
+Usage (from the server directory): python benchmarks/bench_db_concurrency.py --threads 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, select
+
+from db import make_engine, pool_stats
+from models import Memory
+
+
+def build_db(engine, rows):
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Memory.__table__.insert(), [
+            dict(artist=f"Artist {i % 500}", venue=f"Venue {i}", city=f"City {i % 80}", country="",
+                 date=date(2000 + i % 25, 1 + i % 12, 1 + i % 28), lat=0.0, lng=0.0,
+                 note="", tracks=[], palette=[], assets=[])
+            for i in range(rows)
+        ])
+
+
+def worker(engine, seconds, write_ratio, seed, counts, lock):
+    rnd = random.Random(seed)
+    reads = writes = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            with Session(engine) as s:
+                if rnd.random() < write_ratio:
+                    s.add(Memory(artist=f"Bench {seed}", venue=f"v{seed}-{writes}-{rnd.random()}", city="",
+                                 country="", date=date(2024, 1, 1), lat=0.0, lng=0.0))
+                    s.commit()
+                    writes += 1
+                else:
+                    s.exec(select(Memory).where(Memory.city == f"City {rnd.randrange(80)}").limit(50)).all()
+                    reads += 1
+        except OperationalError:
+            errors += 1  # "database is locked"
+    with lock:
+        counts["reads"] += reads
+        counts["writes"] += writes
+        counts["errors"] += errors
+
+
+def run(label, pragmas, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", pragmas=pragmas,
+                             pool_size=args.threads, max_overflow=0)
+        build_db(engine, args.rows)
+        counts, lock = dict(reads=0, writes=0, errors=0), threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(engine, args.seconds, args.write_ratio, i, counts, lock))
+            for i in range(args.threads)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = pool_stats(engine)
+        engine.dispose()
+    ops = (counts["reads"] + counts["writes"]) / args.seconds
+    print(f"{label:<10} {ops:>10.0f} ops/s  reads {counts['reads']:>7}  writes {counts['writes']:>6}  "
+          f"locked errors {counts['errors']:>5}  max checkout wait {stats['max_wait_seconds'] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads, {args.write_ratio:.0%} writes, {args.seconds}s each, {args.rows} rows")
+    run("defaults", {}, args)
+    run("tuned", None, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Serialize every memory to a JSON body: ORM objects + model_dump + strftime +
+json.dumps (the old handler code) vs. column tuples + services.serialize,
+with all columns and with the map's sparse fieldset.
+Usage (from the server directory): python benchmarks/bench_serialize.py --rows 10000 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models import Memory
+from services import serialize
+
+MAP_FIELDS = "id,lat,lng,artist"
+
+
+def build_db(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Memory.__table__.insert(), [
+            dict(artist=f"Artist {i % 5000}", venue=f"Venue {i}", city=f"City {i % 800}", country="Germany",
+                 date=date(2000 + i % 25, 1 + i % 12, 1 + i % 28), lat=52.5 + i % 100 / 1000,
+                 lng=13.4 + i % 100 / 1000, note="Blue hour, goosebumps", tracks=["Numb", "In the End"],
+                 palette=["#111111", "#222222", "#333333"], assets=[])
+            for i in range(rows)
+        ])
+    return engine
+
+
+def orm_model_dump(engine, fields):
+    with Session(engine) as s:
+        out = []
+        for m in s.exec(select(Memory)).all():
+            d = m.model_dump()
+            d["date"] = m.date.strftime("%d-%m-%Y")
+            out.append(d)
+        return json.dumps(out).encode()
+
+
+def column_tuples(engine, fields):
+    with Session(engine) as s:
+        rows = s.exec(serialize.select_rows(Memory.__table__, fields)).all()
+    return serialize.dumps(serialize.to_dicts(fields, rows))
+
+
+def timed(fn, engine, fields, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(engine, fields)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    all_fields = serialize.parse_fields(None, Memory.__table__)
+    map_fields = serialize.parse_fields(MAP_FIELDS, Memory.__table__)
+    print(f"JSON backend: {'orjson' if serialize.orjson else 'json'}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_db(os.path.join(tmp, "bench.db"), rows)
+            cases = [
+                ("ORM + model_dump (before)", orm_model_dump, all_fields),
+                ("column tuples, all fields", column_tuples, all_fields),
+                (f"column tuples, {MAP_FIELDS}", column_tuples, map_fields),
+            ]
+            print(f"\n{rows} memories")
+            for label, fn, fields in cases:
+                seconds = timed(fn, engine, fields, args.repeat)
+                print(f"  {label:<32} {seconds * 1000:8.1f} ms  {rows / seconds:>10,.0f} rows/s")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
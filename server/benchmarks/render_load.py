@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Load test: does rendering cards slow down the cheap JSON endpoints?
+
+Serves the app (app.create_app, renders going through the process pool) on a
+threaded HTTP server against a throwaway database, measures GET /memories/<id>
+latency at idle, then again while --clients threads keep requesting cards for
+distinct memories (every one a cache miss). Prints p50/p95 for both phases and
+how the card requests ended (200, or 503 when the render queue was full).
+Usage (from the server directory):
+    python benchmarks/render_load.py --rows 1000 --clients 8 --seconds 10
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import synthetic
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else None
+
+
+def get(url):
+    """(status, seconds) for one GET; HTTP errors count as responses."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as res:
+            res.read()
+            status = res.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def probe(base, rows, seconds, interval=0.02):
+    """Latencies (ms) of GET /memories/<id> sampled for seconds."""
+    samples, ids = [], itertools.cycle(range(1, rows + 1))
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        status, took = get(f"{base}/memories/{next(ids)}")
+        assert status == 200, status
+        samples.append(took * 1000)
+        time.sleep(interval)
+    return samples
+
+
+def summary(samples):
+    return {"n": len(samples), "p50_ms": round(percentile(samples, 0.5), 2),
+            "p95_ms": round(percentile(samples, 0.95), 2), "max_ms": round(max(samples), 2)}
+
+
+def run(rows, clients, seconds, workdir):
+    # the app reads these at import time, so it must not be imported before this point
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ["CARD_DIR"] = os.path.join(workdir, "cards")
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    from werkzeug.serving import make_server
+
+    import app as musemap
+
+    app = musemap.create_app()
+    musemap.card_renderer.start()
+    synthetic.insert(musemap.db_engine, synthetic.memories(rows))
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    idle = probe(base, rows, seconds)
+
+    stop = threading.Event()
+    outcomes, render_ms, lock = Counter(), [], threading.Lock()
+    cards = iter(range(1, rows + 1))
+
+    def hammer():
+        while not stop.is_set():
+            with lock:
+                mid = next(cards, None)
+            if mid is None:
+                return
+            status, took = get(f"{base}/card/{mid}.png?size=feed")
+            with lock:
+                outcomes[status] += 1
+                if status == 200:
+                    render_ms.append(took * 1000)
+            if status == 503:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=hammer, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    loaded = probe(base, rows, seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    pool = musemap.card_renderer.snapshot()
+    musemap.card_renderer.shutdown()
+    musemap.db_engine.dispose()
+    return {
+        "json_idle": summary(idle),
+        "json_under_load": summary(loaded),
+        "cards": {"by_status": dict(outcomes),
+                  "render_p50_ms": round(percentile(render_ms, 0.5), 2) if render_ms else None},
+        "render_pool": pool,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=synthetic.MIN_ROWS)
+    parser.add_argument("--clients", type=int, default=8, help="Threads requesting cards concurrently.")
+    parser.add_argument("--seconds", type=float, default=10, help="Length of each phase.")
+    args = parser.parse_args()
+    try:
+        synthetic.check_rows(args.rows)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with tempfile.TemporaryDirectory(prefix="musemap-load-") as tmp:
+        result = run(args.rows, args.clients, args.seconds, tmp)
+    print(f"\n{'GET /memories/<id>':<22} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for phase in ("json_idle", "json_under_load"):
+        r = result[phase]
+        print(f"{phase:<22} {r['n']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['max_ms']:>9.2f}")
+    print(f"\ncard requests: {result['cards']['by_status']}, render p50 {result['cards']['render_p50_ms']} ms")
+    print(f"render pool: {result['render_pool']}")
+
+
+if __name__ == "__main__":
+    main()
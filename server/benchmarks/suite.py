@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmarks for the API and renderer hot paths.
+
+Seeds a throwaway database with synthetic memories (benchmarks/synthetic.py),
+then times draw_poster at several scales and list_memories, memory_detail,
+create_memory and enrich_memory through the Flask test client (enrichment
+runs offline: LASTFM_API_KEY is ignored). Results are written as JSON; pass
+--baseline to compare with an earlier run and fail on regressions.
+Usage (from the server directory):
+    python benchmarks/suite.py --rows 10000 --out benchmarks/results/new.json --baseline benchmarks/results/old.json
+    python benchmarks/suite.py --compare old.json new.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import synthetic
+
+DEFAULT_THRESHOLD = 0.15
+POSTER_SCALES = (0.5, 1.0, 2.0)
+
+
+def timed(fn, repeat, warmup=1):
+    """Call fn warmup + repeat times; stats over the timed calls, in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        "n": repeat,
+        "median_ms": round(median, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_ms": round(samples[0], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "ops_per_s": round(1000 / median, 1) if median else None,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(rows, seed, repeat, workdir):
+    """Seed a database under workdir and time every case; returns {case: stats}."""
+    # the app reads these at import time, so it must not be imported before this point
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["CARD_DIR"] = os.path.join(workdir, "cards")
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    import app as musemap
+    from services import enrich, poster
+
+    enrich.LASTFM_API_KEY = None
+    creates = repeat + 1
+    generated = synthetic.memories(rows + creates, seed)
+    client = musemap.create_app().test_client()   # creates the tables before the bulk insert
+    synthetic.insert(musemap.db_engine, (next(generated) for _ in range(rows)))
+    new_rows = [{**m, "date": m["date"].isoformat()} for m in generated]
+    rnd = random.Random(seed)
+    results = {}
+
+    def expect(res, status=200):
+        assert res.status_code == status, f"{res.request.path}: {res.status_code} {res.get_data(as_text=True)[:200]}"
+
+    card = next(synthetic.memories(1, seed))
+    for scale in POSTER_SCALES:
+        out_path = os.path.join(workdir, f"poster_{scale}.png")
+        args = dict(artist=card["artist"], city=f"{card['city']}, {card['country']}",
+                    date_str=card["date"].strftime("%d %b %Y"), palette=card["palette"] or ["#222", "#ddd"],
+                    tracks=card["tracks"], qr_url="https://musemap.example/memories/1", scale=scale)
+        results[f"draw_poster[scale={scale:g}]"] = timed(lambda: poster.draw_poster(**args, out_path=out_path),
+                                                          max(3, repeat // 10))
+
+    results["list_memories"] = timed(lambda: expect(client.get("/memories")), repeat)
+    results["list_memories[map fields]"] = timed(
+        lambda: expect(client.get("/memories?fields=id,lat,lng,artist")), repeat)
+    results["memory_detail"] = timed(lambda: expect(client.get(f"/memories/{rnd.randint(1, rows)}")), repeat)
+    pending = iter(new_rows)
+    results["create_memory"] = timed(lambda: expect(client.post("/memories", json=next(pending)), 201), repeat)
+    results["enrich_memory"] = timed(
+        lambda: expect(client.post(f"/memories/{rnd.randint(1, rows)}/enrich")), repeat)
+    musemap.db_engine.dispose()
+    return results
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """[(case, old ms, new ms, ratio, regressed)] for cases in both runs, by median time."""
+    rows = []
+    for case, new in current["results"].items():
+        old = baseline["results"].get(case)
+        if not old:
+            continue
+        ratio = new["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        rows.append((case, old["median_ms"], new["median_ms"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"\n{'case':<30} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for case, old, new, ratio, regressed in rows:
+        flag = f"  REGRESSION (> +{threshold:.0%})" if regressed else ""
+        print(f"{case:<30} {old:>10.2f} {new:>10.2f} {ratio - 1:>+8.1%}{flag}")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50, help="Timed calls per API case.")
+    parser.add_argument("--out", help="Write results JSON here (default benchmarks/results/<commit>.json).")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown of the median before a case counts as a regression (0.15 = 15%%).")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Only compare two results files.")
+    args = parser.parse_args()
+
+    if args.compare:
+        rows = compare(load(args.compare[0]), load(args.compare[1]), args.threshold)
+        print_comparison(rows, args.threshold)
+        sys.exit(1 if any(r[4] for r in rows) else 0)
+
+    try:
+        synthetic.check_rows(args.rows)
+    except ValueError as e:
+        parser.error(str(e))
+    commit = git_commit()
+    with tempfile.TemporaryDirectory(prefix="musemap-bench-") as tmp:
+        print(f"Seeding {args.rows} memories (seed {args.seed})...")
+        results = run(args.rows, args.seed, args.repeat, tmp)
+    report = {
+        "meta": {
+            "commit": commit, "rows": args.rows, "seed": args.seed, "repeat": args.repeat,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+    print(f"\n{'case':<30} {'median ms':>10} {'p95 ms':>10} {'ops/s':>10}")
+    for case, r in results.items():
+        print(f"{case:<30} {r['median_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['ops_per_s']:>10,.1f}")
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit or 'latest'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {out}")
+
+    if args.baseline:
+        rows = compare(load(args.baseline), report, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(r[4] for r in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic concert memories for benchmarks: real artist names, real
+cities with jittered coordinates, spread over 35 years of dates.
+The same (rows, seed) always yields the same rows, and (artist, date, venue)
+is unique, so the output can be inserted or POSTed as-is.
+Usage (from the server directory): python benchmarks/synthetic.py --rows 1000 > memories.ndjson
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+# Add the server directory to the path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+MIN_ROWS, MAX_ROWS = 1_000, 1_000_000
+FIRST_DAY, SPAN_DAYS = date(1990, 1, 1), 35 * 365
+
+ARTISTS = (
+    "Radiohead", "Portishead", "Massive Attack", "Björk", "Sigur Rós", "Arcade Fire", "The National",
+    "LCD Soundsystem", "Daft Punk", "Air", "Phoenix", "Justice", "Beach House", "Bon Iver", "Fleet Foxes",
+    "Tame Impala", "Nick Cave & The Bad Seeds", "PJ Harvey", "Pixies", "Sonic Youth", "Yo La Tengo",
+    "The Cure", "Depeche Mode", "New Order", "Pet Shop Boys", "Kraftwerk", "Einstürzende Neubauten",
+    "Rammstein", "Die Ärzte", "Tocotronic", "Kings of Convenience", "Röyksopp", "Robyn", "The Knife",
+    "Fever Ray", "Caribou", "Four Tet", "Jamie xx", "The xx", "Florence + The Machine", "Adele",
+    "Arctic Monkeys", "Franz Ferdinand", "Interpol", "The Strokes", "Yeah Yeah Yeahs", "TV on the Radio",
+    "Vampire Weekend", "Grizzly Bear", "Animal Collective", "Sufjan Stevens", "St. Vincent", "Feist",
+    "Metric", "Broken Social Scene", "Godspeed You! Black Emperor", "Mogwai", "Explosions in the Sky",
+    "Foals", "Wilco", "The War on Drugs", "Kendrick Lamar", "Frank Ocean", "SZA", "Solange",
+    "Beyoncé", "Rosalía", "Billie Eilish", "Lorde", "Taylor Swift", "Phoebe Bridgers", "Mitski",
+    "Big Thief", "Fontaines D.C.", "IDLES", "Wet Leg", "Little Simz", "Stormzy", "Burial",
+    "Aphex Twin", "Boards of Canada", "Moderat", "Apparat", "Nils Frahm", "Ólafur Arnalds",
+    "Max Richter", "Queens of the Stone Age", "Foo Fighters", "Nirvana", "Pearl Jam",
+    "Red Hot Chili Peppers", "Linkin Park", "Muse", "Coldplay", "Blur", "Oasis", "Pulp",
+    "Suede", "Manic Street Preachers", "Elbow", "Editors", "Placebo", "Garbage", "Hole",
+)
+# (city, country, lat, lng)
+CITIES = (
+    ("Berlin", "Germany", 52.520, 13.405), ("Hamburg", "Germany", 53.551, 9.994),
+    ("Munich", "Germany", 48.137, 11.575), ("Cologne", "Germany", 50.938, 6.960),
+    ("Leipzig", "Germany", 51.340, 12.375), ("Vienna", "Austria", 48.208, 16.374),
+    ("Zurich", "Switzerland", 47.377, 8.541), ("Paris", "France", 48.857, 2.352),
+    ("Lyon", "France", 45.764, 4.836), ("London", "United Kingdom", 51.507, -0.128),
+    ("Manchester", "United Kingdom", 53.481, -2.243), ("Glasgow", "United Kingdom", 55.864, -4.252),
+    ("Dublin", "Ireland", 53.350, -6.260), ("Amsterdam", "Netherlands", 52.368, 4.904),
+    ("Brussels", "Belgium", 50.850, 4.352), ("Copenhagen", "Denmark", 55.676, 12.568),
+    ("Stockholm", "Sweden", 59.329, 18.069), ("Oslo", "Norway", 59.914, 10.752),
+    ("Reykjavík", "Iceland", 64.147, -21.943), ("Helsinki", "Finland", 60.170, 24.938),
+    ("Warsaw", "Poland", 52.230, 21.012), ("Prague", "Czechia", 50.076, 14.438),
+    ("Budapest", "Hungary", 47.498, 19.040), ("Barcelona", "Spain", 41.385, 2.173),
+    ("Madrid", "Spain", 40.417, -3.704), ("Lisbon", "Portugal", 38.722, -9.139),
+    ("Milan", "Italy", 45.464, 9.190), ("Rome", "Italy", 41.903, 12.496),
+    ("New York", "USA", 40.713, -74.006), ("Chicago", "USA", 41.878, -87.630),
+    ("Los Angeles", "USA", 34.052, -118.244), ("Austin", "USA", 30.267, -97.743),
+    ("Montreal", "Canada", 45.502, -73.567), ("Toronto", "Canada", 43.653, -79.383),
+    ("Mexico City", "Mexico", 19.433, -99.133), ("São Paulo", "Brazil", -23.551, -46.633),
+    ("Buenos Aires", "Argentina", -34.604, -58.382), ("Tokyo", "Japan", 35.676, 139.650),
+    ("Seoul", "South Korea", 37.567, 126.978), ("Melbourne", "Australia", -37.814, 144.963),
+    ("Sydney", "Australia", -33.869, 151.209), ("Cape Town", "South Africa", -33.925, 18.424),
+)
+VENUE_KINDS = ("Arena", "Stadium", "Club", "Hall", "Theatre", "Festival Grounds", "Open Air", "Ballroom")
+NOTES = (
+    "", "", "Front row, lost my voice", "Blue hour, goosebumps", "Rain all night, worth it",
+    "Encore went on forever", "Went alone, met friends", "Sound was perfect", "Crowd sang every word",
+)
+TRACKS = ("Intro", "Opener", "The Single", "Deep Cut", "Ballad", "Fan Favourite", "Cover", "Encore")
+
+
+def memories(rows: int, seed: int = 42, enriched: float = 0.5):
+    """Yield rows memory dicts (insertable into Memory.__table__); deterministic per seed."""
+    rnd = random.Random(seed)
+    # each artist plays one show per date window, so (artist, date, venue) never repeats
+    per_artist = -(-rows // len(ARTISTS))
+    window = max(1, SPAN_DAYS // per_artist)
+    for i in range(rows):
+        artist = ARTISTS[i % len(ARTISTS)]
+        k = i // len(ARTISTS)
+        city, country, lat, lng = rnd.choice(CITIES)
+        has_enrichment = rnd.random() < enriched
+        yield dict(
+            artist=artist,
+            venue=f"{city} {rnd.choice(VENUE_KINDS)}",
+            city=city,
+            country=country,
+            date=FIRST_DAY + timedelta(days=k * window + rnd.randrange(window)),
+            lat=round(lat + rnd.uniform(-0.08, 0.08), 6),
+            lng=round(lng + rnd.uniform(-0.08, 0.08), 6),
+            note=rnd.choice(NOTES),
+            tracks=rnd.sample(TRACKS, rnd.randint(3, len(TRACKS))) if has_enrichment else [],
+            palette=[f"#{rnd.randrange(0x1000000):06x}" for _ in range(5)] if has_enrichment else [],
+            assets=[],
+        )
+
+
+def insert(engine, rows, chunk=10_000):
+    """Bulk insert an iterable of memory dicts in chunked transactions; returns the count."""
+    from models import Memory
+
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk:
+            with engine.begin() as conn:
+                conn.execute(Memory.__table__.insert(), batch)
+            count, batch = count + len(batch), []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(Memory.__table__.insert(), batch)
+        count += len(batch)
+    return count
+
+
+def check_rows(rows: int) -> int:
+    if not MIN_ROWS <= rows <= MAX_ROWS:
+        raise ValueError(f"rows must be between {MIN_ROWS} and {MAX_ROWS}, got: {rows}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=MIN_ROWS)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    try:
+        check_rows(args.rows)
+    except ValueError as e:
+        parser.error(str(e))
+    for row in memories(args.rows, args.seed):
+        print(json.dumps({**row, "date": row["date"].isoformat()}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark helpers (data generator and regression check).
+Run from the server directory: python -m pytest benchmarks/test_benchmarks.py
+"""
+
+import os
+import sys
+
+# Add the server directory to the path so we can import the benchmark modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from benchmarks import suite, synthetic
+
+
+def test_synthetic_rows_are_seeded_and_unique():
+    rows = list(synthetic.memories(5000, seed=7))
+    assert rows == list(synthetic.memories(5000, seed=7))
+    assert rows != list(synthetic.memories(5000, seed=8))
+    assert len({(m["artist"], m["date"], m["venue"]) for m in rows}) == len(rows)
+    for m in rows[:500]:
+        assert -90 <= m["lat"] <= 90 and -180 <= m["lng"] <= 180
+        assert m["venue"].startswith(m["city"])
+    with pytest.raises(ValueError):
+        synthetic.check_rows(2_000_000)
+
+
+def test_compare_flags_regressions_over_threshold():
+    before = {"results": {"a": {"median_ms": 10.0}, "b": {"median_ms": 10.0}, "gone": {"median_ms": 1.0}}}
+    after = {"results": {"a": {"median_ms": 11.0}, "b": {"median_ms": 13.0}, "new": {"median_ms": 1.0}}}
+    rows = {case: regressed for case, _, _, _, regressed in suite.compare(before, after, threshold=0.15)}
+    assert rows == {"a": False, "b": True}
@@ -1,16 +1,130 @@
-import os
+import os, logging, threading, time
 from contextlib import contextmanager
+from sqlalchemy import event, inspect
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlmodel import SQLModel, create_engine, Session
 
+log = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///musemap.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# applied to every new SQLite connection; override with SQLITE_PRAGMAS="synchronous=FULL,mmap_size=0"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # readers no longer block behind a writer
+    "synchronous": "NORMAL",        # safe with WAL, far fewer fsyncs
+    "busy_timeout": "5000",         # wait for the write lock instead of "database is locked"
+    "mmap_size": str(256 * 1024 * 1024),
+    "cache_size": "-65536",         # 64 MB page cache (negative = KiB)
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+for _item in filter(None, os.getenv("SQLITE_PRAGMAS", "").split(",")):
+    _name, _value = _item.split("=")
+    SQLITE_PRAGMAS[_name.strip()] = _value.strip()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = dict(checkouts=0, timeouts=0, wait_seconds=0.0, max_wait_seconds=0.0)
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.stats["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.stats["checkouts"] += 1
+                self.stats["wait_seconds"] += waited
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats, pool._stats_lock = self.stats, self._stats_lock
+        return pool
+
+
+def make_engine(url: str = DATABASE_URL, *, pragmas=None, pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT):
+    """Engine with a sized, instrumented pool; SQLite connections get the tuning pragmas."""
+    kwargs = dict(poolclass=InstrumentedQueuePool, pool_size=pool_size,
+                  max_overflow=max_overflow, pool_timeout=pool_timeout, pool_pre_ping=True)
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+        kwargs.pop("pool_pre_ping")
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # an in-memory database only exists on its one connection
+            kwargs = dict(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    engine = create_engine(url, **kwargs)
+
+    if engine.dialect.name == "sqlite":
+        pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return engine
+
+
+engine = make_engine()
+
+def pool_stats(engine=engine) -> dict:
+    """Pool usage (size, checked out, overflow) and checkout wait counters."""
+    pool = engine.pool
+    stats = {"pool": pool.__class__.__name__, "dialect": engine.dialect.name}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                     overflow=pool.overflow(), idle=pool.checkedin())
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(pool.stats)
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    return stats
+
+def add_missing_columns() -> None:
+    """ALTER existing tables to add columns introduced after they were created."""
+    existing = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        if not existing.has_table(table.name):
+            continue
+        present = {c["name"] for c in existing.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column.type.compile(engine.dialect)}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                ddl += f" DEFAULT {getattr(default, 'text', default)}"
+            # NOT NULL needs a default on existing rows, so columns without one are added nullable
+            with engine.begin() as conn:
+                conn.exec_driver_sql(ddl)
+            log.info("added column %s.%s", table.name, column.name)
 
 def init_db() -> None:
     """Create database tables (call once at startup)."""
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    # create_all skips tables that already exist, so add any newer indexes explicitly
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 @contextmanager
 def get_session():
     """Provide a transactional scope around a series of operations."""
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
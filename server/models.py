@@ -1,10 +1,23 @@
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, DateTime, Index, JSON
 
 
 class Memory(SQLModel, table=True):
+    __table_args__ = (
+        # back the /memories filters, sorts and keyset pagination
+        Index("ix_memory_date", "date"),
+        Index("ix_memory_artist", "artist"),
+        Index("ix_memory_city", "city"),
+        # range-scan fallback for viewport queries when the R*Tree is unavailable
+        Index("ix_memory_lat_lng", "lat", "lng"),
+        # duplicate lookups for bulk imports that ask for dedupe (on_conflict)
+        Index("ix_memory_artist_date_venue", "artist", "date", "venue"),
+        # "what changed since ..." scans for sync clients
+        Index("ix_memory_updated_at", "updated_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     artist: str
     venue: str = ""
@@ -20,6 +33,29 @@ class Memory(SQLModel, table=True):
     assets: List[str] = Field(default_factory=list, sa_column=Column(JSON))
     # optional stored image
     image_path: Optional[str] = None
+    # set on every insert/update, including core (bulk) statements
+    updated_at: Optional[datetime] = Field(
+        default=None, sa_column=Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow))
+
+class Job(SQLModel, table=True):
+    """A background job (batch enrichment or card rendering), persisted so it survives restarts."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = "enrich"
+    status: str = Field(default="queued", index=True)   # queued | running | done | failed
+    memory_ids: List[int] = Field(default_factory=list, sa_column=Column(JSON))
+    processed: int = 0
+    failed_ids: List[int] = Field(default_factory=list, sa_column=Column(JSON))
+    params: dict = Field(default_factory=dict, sa_column=Column(JSON))   # kind-specific options/results
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class EnrichCacheEntry(SQLModel, table=True):
+    """Persistent per-artist enrichment lookups (see services/enrich_cache.py)."""
+    key: str = Field(primary_key=True)        # "<kind>:<normalized artist>[@<date>]"
+    value: List[str] = Field(default_factory=list, sa_column=Column(JSON))
+    expires_at: datetime
 
 class MemoryCreate(SQLModel):
     artist: str
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Production entry point: uvicorn worker processes, each serving a Flask app
+(built by app.create_app) from a thread pool. Card renders run in each
+worker's own render process pool (RENDER_PROCESSES), so size
+workers x RENDER_PROCESSES to the cores you have. Background jobs run in
+this parent process only, so each runs once however many workers there are.
+Usage (from the server directory): python serve.py --workers 2 --threads 8
+"""
+
+import argparse
+import os
+import warnings
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()  # SERVE_* defaults below, and the database settings app reads at import
+
+
+def asgi_app():
+    """Factory uvicorn calls in every worker process."""
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+    from app import card_renderer, create_app
+
+    app = create_app(storage=False)   # main() prepared the storage once, before the workers started
+    card_renderer.start()             # spawn the render processes now, not on the first card request
+    with warnings.catch_warnings():
+        # uvicorn's WSGI adapter is deprecated upstream, but it is what lets us size the thread pool
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return WSGIMiddleware(app, workers=int(os.getenv("SERVE_THREADS", "8")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 5001)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "1")),
+                        help="Server processes (default SERVE_WORKERS or 1).")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVE_THREADS", "8")),
+                        help="Request threads per process (default SERVE_THREADS or 8).")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    import app as musemap
+
+    # once, here: started together on a fresh database, the workers would race each other's CREATE TABLE
+    musemap.prepare_storage()
+    musemap.start_jobs()
+    # read by asgi_app() in each worker process
+    os.environ["SERVE_THREADS"] = str(args.threads)
+    uvicorn.run("serve:asgi_app", factory=True, host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level, app_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    main()
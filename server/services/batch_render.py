@@ -0,0 +1,71 @@
+# server/services/batch_render.py
+"""
+Render many poster cards ahead of time on a process pool.
+
+`render_poster` is CPU-bound Pillow work, so cards are spread over worker
+processes (one per core by default). Each card is rendered once into its
+master and every requested size/format is cut from that; cards whose
+variants all exist already are skipped. Files are written to a temp name
+and renamed into place, so a half-written card is never served.
+"""
+import multiprocessing, os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from services import card_cache, card_variants
+
+
+def render_to(master_path: str, master_args: dict, variants) -> float:
+    """Render (or reuse) one master and write its missing variants; returns the time in seconds."""
+    start = time.perf_counter()
+    master = card_variants.load_or_render_master(master_path, master_args)
+    for out_path, width, fmt in variants:
+        if not os.path.exists(out_path):
+            card_variants.write_variant(master, width, fmt, out_path)
+    return time.perf_counter() - start
+
+
+def render_cards(tasks, *, workers=None, progress=None) -> dict:
+    """
+    tasks: [(master_path, master_args, [(out_path, width, fmt)])]. progress(done,
+    total, master_path, seconds, error) is called in this process as each card
+    finishes. Returns a summary report.
+    """
+    started = time.perf_counter()
+    report = dict(total=len(tasks), rendered=0, skipped=0, failed=0, errors={}, timings={})
+    todo = []
+    for master_path, master_args, variants in tasks:
+        if all(card_cache.lookup(*os.path.split(out_path)) is not None for out_path, _, _ in variants):
+            report["skipped"] += 1
+        else:
+            todo.append((master_path, master_args, variants))
+
+    done = report["skipped"]
+    if todo:
+        workers = min(workers or os.cpu_count() or 1, len(todo))
+        # spawn: the caller may be a threaded web process, where fork is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(render_to, *task): task[0] for task in todo}
+            for future in as_completed(futures):
+                master_path, name = futures[future], os.path.basename(futures[future])
+                done += 1
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    report["failed"] += 1
+                    report["errors"][name] = str(e)
+                    seconds, error = None, str(e)
+                else:
+                    report["rendered"] += 1
+                    report["timings"][name] = round(seconds, 4)
+                    error = None
+                if progress:
+                    progress(done, report["total"], master_path, seconds, error)
+
+    times = sorted(report["timings"].values())
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["card_seconds"] = {
+        "mean": round(sum(times) / len(times), 4) if times else None,
+        "p50": times[len(times) // 2] if times else None,
+        "max": times[-1] if times else None,
+    }
+    return report
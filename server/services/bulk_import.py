@@ -0,0 +1,209 @@
+# server/services/bulk_import.py
+"""
+Streaming bulk import of memories from NDJSON or CSV.
+
+Records are parsed one line at a time straight from the request stream and
+written in batched transactions, so neither the upload nor the import has
+to fit in memory. Like POST /memories, every valid row is inserted unless
+the caller opts into dedupe with on_conflict: then each batch looks up
+existing (artist, date, venue) rows first, so re-importing the same file
+is idempotent.
+
+On SQLite the search, map, stats and sync side tables are kept up to date
+by one AFTER INSERT trigger each, which together cost more than the insert
+itself. A batch therefore drops those triggers inside its transaction,
+inserts, brings each side table up to date with one set-based statement
+over the new ids, and re-creates the triggers before it commits. DDL is
+transactional in SQLite, so no other connection ever sees them missing.
+"""
+import csv, io, json
+
+from sqlalchemy import bindparam, insert, literal_column, text, tuple_, update
+from sqlmodel import select
+
+from services import geo_index, search_index, stats, sync
+
+FORMATS = ("ndjson", "csv")
+CONFLICT_MODES = ("error", "skip", "update")
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+# written on upsert; id/enrichment/assets of the existing row are kept
+UPDATE_FIELDS = ("city", "country", "lat", "lng", "note")
+# imported rows start without enrichment or assets; one SQL literal instead of JSON-encoding [] per row
+EMPTY_LISTS = {column: literal_column("'[]'") for column in ("tracks", "palette", "assets")}
+
+
+def detect_format(content_type: str):
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json"):
+        return "ndjson"
+    if ct in ("text/csv", "application/csv"):
+        return "csv"
+    return None
+
+
+def iter_records(stream, fmt):
+    """Yield (line_no, dict) or (line_no, error message) without buffering the body."""
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+        return
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, "invalid JSON: expected an object"
+            continue
+        yield line_no, record
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = self.updated = self.skipped = self.failed = 0
+        self.errors = []
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def to_dict(self):
+        return {
+            "inserted": self.inserted, "updated": self.updated,
+            "skipped": self.skipped, "failed": self.failed,
+            "errors": self.errors, "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _key(row):
+    return (row["artist"], row["date"], row["venue"])
+
+
+# (service, installed(engine)) for every side table with a deferrable insert trigger
+SIDE_TABLES = (
+    (search_index, search_index.has_fts),
+    (geo_index, geo_index.has_rtree),
+    (stats, stats.has_stats),
+    (sync, sync.has_sync),
+)
+
+
+def _deferred(engine):
+    return [service for service, installed in SIDE_TABLES if installed(engine)]
+
+
+def _insert(session, model, rows):
+    """executemany the rows; side tables catch up once for the batch instead of once per row."""
+    stmt = insert(model.__table__).values(EMPTY_LISTS)
+    deferred = _deferred(session.get_bind())
+    if not deferred:
+        session.exec(stmt, params=rows)
+        return
+    conn = session.connection()
+    if not conn.connection.dbapi_connection.in_transaction:
+        # hold the write lock from here on: the new ids are the ones above max(id), and the
+        # dropped triggers are restored before any other writer can run
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    triggers = conn.execute(
+        text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN :names")
+        .bindparams(bindparam("names", expanding=True)),
+        {"names": [service.INSERT_TRIGGER for service in deferred]},
+    ).all()
+    last_id = f"SELECT coalesce(max(id), 0) FROM {model.__table__.name}"
+    after = conn.exec_driver_sql(last_id).scalar_one()
+    for name, _ in triggers:
+        conn.exec_driver_sql(f"DROP TRIGGER {name}")
+    session.exec(stmt, params=rows)
+    last = conn.exec_driver_sql(last_id).scalar_one()
+    for service in deferred:
+        service.catch_up(conn, after, last)
+    for _, ddl in triggers:
+        conn.exec_driver_sql(ddl)
+
+
+def _existing(session, model, keys):
+    """(key, id) for every stored memory whose (artist, date, venue) is in keys."""
+    columns = (model.id, model.artist, model.date, model.venue)
+    if session.get_bind().dialect.name != "sqlite":
+        return ((tuple(r[1:]), r[0]) for r in session.exec(
+            select(*columns).where(tuple_(model.artist, model.date, model.venue).in_(keys))))
+    # SQLite scans the whole table for a row-value IN (...) list; joining the keys from one
+    # JSON parameter instead probes ix_memory_artist_date_venue once per key
+    lookup = text(f"""
+        SELECT m.id, m.artist, m.date, m.venue FROM json_each(:keys) AS k
+        JOIN {model.__table__.name} AS m ON m.artist = json_extract(k.value, '$[0]')
+            AND m.date = json_extract(k.value, '$[1]') AND m.venue = json_extract(k.value, '$[2]')
+    """).columns(*columns)
+    keys = json.dumps([(a, d.isoformat(), v) for a, d, v in keys])
+    return (((a, d, v), mid) for mid, a, d, v in session.connection().execute(lookup, {"keys": keys}))
+
+
+def _flush(session, model, batch, on_conflict, report):
+    """Write one batch of (line_no, row) in a single transaction."""
+    if on_conflict is None:
+        _insert(session, model, [row for _, row in batch])
+        session.commit()
+        report.inserted += len(batch)
+        return
+    existing = dict(_existing(session, model, {_key(r) for _, r in batch}))
+    inserts, updates, seen = [], {}, {}
+    for line_no, row in batch:
+        key = _key(row)
+        if key in existing or key in seen:
+            if on_conflict == "error":
+                report.error(line_no, "duplicate: a memory with this artist, date and venue already exists")
+            elif on_conflict == "skip":
+                report.skipped += 1
+            elif key in existing:
+                updates[key] = {"id": existing[key], **{f: row[f] for f in UPDATE_FIELDS}}
+            else:
+                inserts[seen[key]] = row  # last occurrence in the file wins
+            continue
+        seen[key] = len(inserts)
+        inserts.append(row)
+
+    if inserts:
+        # plain executemany on the table: no ORM objects per row
+        _insert(session, model, inserts)
+    if updates:
+        session.exec(update(model), params=list(updates.values()))
+    session.commit()
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+
+def import_records(session, model, records, build, *, batch_size=DEFAULT_BATCH_SIZE, on_conflict=None):
+    """
+    records: iterable from iter_records. build: dict -> validated column values,
+    raising KeyError/ValueError for invalid input (the same rules as POST /memories).
+    on_conflict: None inserts everything; error|skip|update dedupe on (artist, date, venue).
+    """
+    report = ImportReport()
+    batch = []
+    for line_no, record in records:
+        if isinstance(record, str):
+            report.error(line_no, record)
+            continue
+        try:
+            row = build(record)
+        except KeyError as e:
+            report.error(line_no, f"missing field: {e.args[0]}")
+            continue
+        except (TypeError, ValueError) as e:
+            report.error(line_no, f"invalid value: {str(e)}")
+            continue
+        batch.append((line_no, row))
+        if len(batch) >= batch_size:
+            _flush(session, model, batch, on_conflict, report)
+            batch = []
+    if batch:
+        _flush(session, model, batch, on_conflict, report)
+    return report
@@ -0,0 +1,70 @@
+# server/services/card_cache.py
+"""
+Content-addressed cache for rendered poster cards.
+
+A card is identified by a hash of every input that affects the pixels
+(see `card_key`), so an unchanged memory maps to the same file and an
+edited one to a new file. The hash doubles as a strong ETag.
+"""
+import glob, hashlib, json, os, threading
+
+CARD_CACHE_MAX_BYTES = int(os.getenv("CARD_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_lock = threading.Lock()
+
+
+def card_key(inputs: dict) -> str:
+    """Stable sha256 over the render inputs (order-independent)."""
+    payload = json.dumps(inputs, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _files(card_dir: str, pattern: str):
+    """Cached files matching pattern in card_dir and its subdirectories (masters)."""
+    return glob.glob(os.path.join(card_dir, pattern)) + glob.glob(os.path.join(card_dir, "*", pattern))
+
+
+def lookup(card_dir: str, name: str):
+    """Return the cached file path or None; a hit refreshes its LRU position."""
+    path = os.path.join(card_dir, name)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def invalidate(card_dir: str, mid: int) -> int:
+    """Drop every cached card of a memory (master and all variants). Returns files removed."""
+    removed = 0
+    for path in _files(card_dir, f"card_{mid}_*") + [os.path.join(card_dir, f"card_{mid}.png")]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def evict(card_dir: str, max_bytes: int = CARD_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used cards until the directory fits in max_bytes."""
+    with _lock:
+        entries = []
+        for path in _files(card_dir, "card_*"):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,126 @@
+# server/services/card_variants.py
+"""
+Poster card variants: named sizes x formats, all cut from one master.
+
+A card is rendered once per content key, at print size, into a lossless
+master kept next to the card cache. Every requested size/format is a
+downscale of that master, encoded with per-format settings, so a new
+variant costs a resize and an encode rather than a full render. One-off
+cards (previews of unsaved memories) skip all of that: `render_bytes`
+renders straight at the requested width and encodes in memory.
+"""
+import io, os, tempfile
+
+from PIL import Image
+
+from services import metrics
+from services.poster import render_poster
+
+BASE_WIDTH, BASE_HEIGHT = 640, 960
+SIZES = {"thumb": 320, "feed": 640, "print": 1280}   # output width; height keeps 2:3
+DEFAULT_SIZE = "feed"
+MASTER_SCALE = SIZES["print"] / BASE_WIDTH
+MASTER_DIR = "masters"
+
+FORMATS = {
+    # format -> (mimetype, file extension, Pillow format)
+    "png": ("image/png", "png", "PNG"),
+    "webp": ("image/webp", "webp", "WEBP"),
+    "jpeg": ("image/jpeg", "jpg", "JPEG"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+# encoder effort per format: higher compresses better and costs more CPU
+ENCODER_OPTIONS = {
+    "png": {"compress_level": int(os.getenv("CARD_PNG_COMPRESS_LEVEL", "6"))},
+    "webp": {"quality": int(os.getenv("CARD_WEBP_QUALITY", "85")), "method": int(os.getenv("CARD_WEBP_METHOD", "4"))},
+    "jpeg": {"quality": int(os.getenv("CARD_JPEG_QUALITY", "88")), "optimize": True, "progressive": True},
+}
+
+
+def parse_format(value):
+    """Canonical format name; ValueError when unsupported."""
+    fmt = FORMAT_ALIASES.get((value or "").lower(), (value or "").lower())
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def negotiate(accept_mimetypes, default="png"):
+    """Best format the client accepts (werkzeug MIMEAccept); ties, e.g. */*, go to default."""
+    best = accept_mimetypes.best_match([FORMATS[default][0]] + [m for m, _, _ in FORMATS.values()])
+    return next((f for f, (mime, _, _) in FORMATS.items() if mime == best), default)
+
+
+def parse_width(size=None, scale=None):
+    """Output width from a named size, or from a legacy scale factor capped at print size."""
+    if size is not None:
+        if size not in SIZES:
+            raise ValueError(f"size must be one of {', '.join(SIZES)}")
+        return SIZES[size]
+    if scale is not None:
+        scale = float(scale)
+        if not 0 < scale <= MASTER_SCALE:
+            raise ValueError(f"scale must be greater than 0 and at most {MASTER_SCALE:g}")
+        return max(1, int(BASE_WIDTH * scale))
+    return SIZES[DEFAULT_SIZE]
+
+
+def variant_name(mid: int, master_key: str, width: int, fmt: str) -> str:
+    return f"card_{mid}_{master_key[:20]}_{width}.{FORMATS[fmt][1]}"
+
+
+def master_path(card_dir: str, mid: int, master_key: str) -> str:
+    return os.path.join(card_dir, MASTER_DIR, f"card_{mid}_{master_key[:20]}.png")
+
+
+def _save_atomic(img, path, fmt, **options):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            img.save(out, fmt, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_or_render_master(path: str, master_args: dict) -> Image.Image:
+    """The print-size master from disk, rendering (and storing) it first if needed."""
+    try:
+        with metrics.span("card.load_master"), Image.open(path) as img:
+            os.utime(path)
+            return img.convert("RGB")
+    except FileNotFoundError:
+        pass
+    with metrics.span("card.render"):
+        img = render_poster(**master_args)
+    # fast, lossless: the master is read back, never served
+    with metrics.span("card.save_master"):
+        _save_atomic(img, path, "PNG", compress_level=1)
+    return img
+
+
+def write_variant(master: Image.Image, width: int, fmt: str, path: str) -> str:
+    """Downscale the master to width (2:3) and encode it to path."""
+    height = round(width * master.height / master.width)
+    with metrics.span("card.resize"):
+        img = master if width == master.width else master.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+    with metrics.span(f"card.encode.{fmt}"):
+        _save_atomic(img, path, FORMATS[fmt][2], **ENCODER_OPTIONS[fmt])
+    return path
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    """img in fmt with the card encoder settings, encoded in memory."""
+    buf = io.BytesIO()
+    with metrics.span(f"card.encode.{fmt}"):
+        img.save(buf, FORMATS[fmt][2], **ENCODER_OPTIONS[fmt])
+    return buf.getvalue()
+
+
+def render_bytes(poster_args: dict, width: int, fmt: str) -> bytes:
+    """A one-off card rendered directly at width and encoded in memory; nothing is cached or written."""
+    with metrics.span("card.preview"):
+        img = render_poster(**{**poster_args, "scale": width / poster_args.get("width", BASE_WIDTH)})
+    return encode(img, fmt)
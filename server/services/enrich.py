@@ -1,8 +1,14 @@
-import os, random
+import os, random, threading, time
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+
+from services import metrics
+from services.enrich_cache import EnrichCache, cache_key
 
 
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
+LASTFM_API_URL = os.getenv("LASTFM_API_URL", "https://ws.audioscrobbler.com/2.0/")
 MB_APP_ID = os.getenv("MUSICBRAINZ_APP_ID", "musemap")
 MB_APP_VERSION = os.getenv("MUSICBRAINZ_APP_VERSION", "0.1")
 MB_CONTACT = os.getenv("MUSICBRAINZ_CONTACT", "contact@example.com")
@@ -11,6 +17,75 @@ HEADERS_MB = {
 "User-Agent": f"{MB_APP_ID}/{MB_APP_VERSION} ({MB_CONTACT})"
 }
 
+HTTP_TIMEOUT = float(os.getenv("ENRICH_HTTP_TIMEOUT", "8"))
+# max requests per second per host (MusicBrainz asks for 1 req/s);
+# override with ENRICH_RATE_LIMITS="musicbrainz.org=1,ws.audioscrobbler.com=5"
+RATE_LIMITS = {"musicbrainz.org": 1.0, "ws.audioscrobbler.com": 5.0}
+for _item in filter(None, os.getenv("ENRICH_RATE_LIMITS", "").split(",")):
+    _host, _rate = _item.split("=")
+    RATE_LIMITS[_host.strip()] = float(_rate)
+
+# one pooled session for every outbound call (keep-alive, shared connection pool)
+_http = requests.Session()
+_http.headers.update(HEADERS_MB)
+_http.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+_http.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+
+
+class UpstreamError(Exception):
+    """A retryable failure talking to an enrichment API."""
+
+
+class UpstreamRejected(UpstreamError):
+    """The API refused the request (4xx other than 429); retrying will not help."""
+
+
+class _HostRateLimiter:
+    """Spaces requests to the same host at least 1/rate seconds apart, across threads."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, host):
+        for name, rate in self.limits.items():
+            if host == name or host.endswith("." + name):
+                return rate
+        return None
+
+    def wait(self, host):
+        rate = self._rate(host)
+        if not rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = _HostRateLimiter(RATE_LIMITS)
+
+
+def http_get_json(url: str, params: dict):
+    """
+    GET through the pooled session, rate-limited per host. Raises UpstreamRejected on
+    4xx other than 429, else UpstreamError (timeouts, connection errors, 429, 5xx).
+    """
+    host = urlsplit(url).hostname or ""
+    rate_limiter.wait(host)
+    try:
+        with metrics.span("enrich.http"):
+            r = _http.get(url, params=params, timeout=HTTP_TIMEOUT)
+            if 400 <= r.status_code < 500 and r.status_code != 429:
+                raise UpstreamRejected(f"{host}: {r.status_code} {r.reason}")
+            r.raise_for_status()
+            return r.json()
+    except (requests.RequestException, ValueError) as e:
+        raise UpstreamError(f"{host}: {e}") from e
+
 def infer_palette(text: str):
     """Return a simple hardcoded color palette (placeholder)."""
     return ["#2b2d42", "#8d99ae", "#edf2f4", "#ef233c", "#d90429"]
@@ -31,37 +106,46 @@ def mood_palette_from_text(text: str):
 
 # --- Setlist/track enrichment (stubbed with lightweight calls or fallbacks) ---
 
+# per-artist results, shared by every memory of the same band (bound to the DB by the app)
+lookup_cache = EnrichCache()
+
 def fetch_tracks_for_artist(artist: str):
+    """Last.fm top tracks when an API key is configured; raises UpstreamError on API failure."""
     if LASTFM_API_KEY:
-        # TODO: implement real API call here
-        return [f"{artist} Track A", f"{artist} Track B", f"{artist} Track C"]
+        return lookup_cache.get_or_load(cache_key("tracks", artist), lambda: _lastfm_top_tracks(artist))
     else:
         return [f"{artist} Song 1", f"{artist} Song 2", f"{artist} Song 3"]
 
-# date_str: str | None = None) -> list[str]:
-# Try Last.fm top tracks as a friendly fallback when no setlist API is used
-""" if LASTFM_API_KEY:
-try:
-r = requests.get(
-"https://ws.audioscrobbler.com/2.0/",
-params={
-"method": "artist.gettoptracks",
-"artist": artist,
-"api_key": LASTFM_API_KEY,
-"format": "json",
-"limit": 8,
-},
-timeout=8,
-)
-data = r.json()
-tracks = [t["name"] for t in data.get("toptracks", {}).get("track", [])]
-return tracks[:8] or []
-except Exception:
-pass
-# Fallback: pretend set of likely tracks
-samples = ["Intro", "Opening Track", "Fan Favorite", "Acoustic Moment", "Encore"]
-return random.sample(samples, k=min(5, len(samples)))
-""" 
+def _lastfm_top_tracks(artist: str):
+    data = http_get_json(
+        LASTFM_API_URL,
+        {
+            "method": "artist.gettoptracks",
+            "artist": artist,
+            "api_key": LASTFM_API_KEY,
+            "format": "json",
+            "limit": 8,
+        },
+    )
+    tracks = [t["name"] for t in data.get("toptracks", {}).get("track", [])]
+    return tracks[:8]
+
+def prefetch_artists(artists, workers=4):
+    """Warm the track cache for many artists at once; returns how many lookups failed."""
+    if not LASTFM_API_KEY:
+        return 0
+    unique = {cache_key("tracks", a): a for a in artists}
+    return lookup_cache.prefetch(
+        [(key, lambda a=a: _lastfm_top_tracks(a)) for key, a in unique.items()], workers=workers
+    )
+
+def enrich_fields(artist: str, note: str = ""):
+    """Palette + tracks for a memory (real track lookup once an API key is set)."""
+    with metrics.span("enrich.palette"):
+        palette = infer_palette(note or artist)
+    with metrics.span("enrich.tracks"):
+        tracks = fetch_tracks_for_artist(artist) if LASTFM_API_KEY else fake_setlist(artist)
+    return {"palette": palette, "tracks": tracks}
 
 # --- Mood palette (very simple first pass) ---
 
@@ -0,0 +1,175 @@
+# server/services/enrich_cache.py
+"""
+Two-level cache for per-artist enrichment lookups.
+
+An in-process LRU sits in front of a persistent table (bound at startup),
+both keyed by lookup kind + normalized artist name (+ date for setlist
+lookups). Empty results are cached for a shorter TTL (negative caching);
+errors are never cached. Concurrent misses for the same key share one
+upstream call (single-flight).
+"""
+import os, threading, time, unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+CACHE_SIZE = int(os.getenv("ENRICH_CACHE_SIZE", "1024"))
+TTL = float(os.getenv("ENRICH_CACHE_TTL", str(7 * 24 * 3600)))
+NEGATIVE_TTL = float(os.getenv("ENRICH_CACHE_NEGATIVE_TTL", "3600"))
+
+
+# INSERT ... ON CONFLICT DO UPDATE where the dialect has it
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def normalize_artist(artist: str) -> str:
+    """'  Björk ' and 'bjork' share a cache entry."""
+    decomposed = unicodedata.normalize("NFKD", artist or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def cache_key(kind: str, artist: str, date=None) -> str:
+    key = f"{kind}:{normalize_artist(artist)}"
+    return f"{key}@{date.isoformat() if hasattr(date, 'isoformat') else date}" if date else key
+
+
+class EnrichCache:
+    def __init__(self, size=CACHE_SIZE, ttl=TTL, negative_ttl=NEGATIVE_TTL):
+        self.size, self.ttl, self.negative_ttl = size, ttl, negative_ttl
+        self._lru = OrderedDict()        # key -> (expires_at epoch, value)
+        self._inflight = {}              # key -> Future
+        self._lock = threading.Lock()
+        self._engine = self._table = None
+        self.stats = dict(hits=0, db_hits=0, misses=0, coalesced=0, errors=0, load_seconds=0.0)
+
+    def bind(self, engine, table):
+        """Persist entries in table (key, value, expires_at)."""
+        self._engine, self._table = engine, table
+
+    # --- storage ---
+    def _get_local(self, key, now):
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return entry
+
+    def _put_local(self, key, expires_at, value):
+        self._lru[key] = (expires_at, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    def _get_db(self, key, now):
+        if self._engine is None:
+            return None
+        t = self._table
+        with self._engine.connect() as conn:
+            row = conn.execute(select(t.c.value, t.c.expires_at).where(t.c.key == key)).first()
+        if row is None or row.expires_at.timestamp() <= now:
+            return None
+        return (row.expires_at.timestamp(), row.value)
+
+    def _put_db(self, key, expires_at, value):
+        if self._engine is None:
+            return
+        t = self._table
+        values = {"value": value, "expires_at": datetime.fromtimestamp(expires_at)}
+        # atomic: another process may store the same key at the same time
+        upsert = _UPSERTS.get(self._engine.dialect.name)
+        if upsert is not None:
+            with self._engine.begin() as conn:
+                conn.execute(upsert(t).values(key=key, **values)
+                             .on_conflict_do_update(index_elements=[t.c.key], set_=values))
+            return
+        try:
+            with self._engine.begin() as conn:
+                if not conn.execute(update(t).where(t.c.key == key).values(**values)).rowcount:
+                    conn.execute(insert(t).values(key=key, **values))
+        except IntegrityError:
+            # lost the race to insert; the row exists now
+            with self._engine.begin() as conn:
+                conn.execute(update(t).where(t.c.key == key).values(**values))
+
+    # --- public API ---
+    def get_or_load(self, key, loader):
+        """Cached value for key, calling loader() once on a miss, however many threads ask."""
+        now = time.time()
+        with self._lock:
+            entry = self._get_local(key, now)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry[1]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            entry = self._get_db(key, now)
+            if entry is not None:
+                with self._lock:
+                    self.stats["db_hits"] += 1
+                    self._put_local(key, *entry)
+                value = entry[1]
+            else:
+                start = time.perf_counter()
+                try:
+                    value = loader()
+                finally:
+                    with self._lock:
+                        self.stats["misses"] += 1
+                        self.stats["load_seconds"] += time.perf_counter() - start
+                expires_at = time.time() + (self.ttl if value else self.negative_ttl)
+                self._put_db(key, expires_at, value)
+                with self._lock:
+                    self._put_local(key, expires_at, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self, persistent=False):
+        with self._lock:
+            self._lru.clear()
+        if persistent and self._engine is not None:
+            with self._engine.begin() as conn:
+                conn.execute(delete(self._table))
+
+    def snapshot(self):
+        """Counters plus derived hit ratio and mean upstream latency."""
+        with self._lock:
+            s = dict(self.stats, entries=len(self._lru), inflight=len(self._inflight))
+        lookups = s["hits"] + s["db_hits"] + s["misses"] + s["coalesced"]
+        s["hit_ratio"] = (lookups - s["misses"]) / lookups if lookups else None
+        s["avg_load_ms"] = 1000 * s["load_seconds"] / s["misses"] if s["misses"] else None
+        return s
+
+    def prefetch(self, keys_and_loaders, workers=4):
+        """Warm the cache for many (key, loader) pairs; returns how many failed."""
+        def warm(item):
+            try:
+                self.get_or_load(*item)
+                return 0
+            except Exception:
+                return 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(warm, keys_and_loaders))
@@ -0,0 +1,97 @@
+# server/services/export.py
+"""
+Streaming export of the memory table as NDJSON, CSV or GeoJSON.
+
+Rows come from a server-side cursor (`yield_per`) as plain tuples and are
+encoded into ~64 KB chunks, optionally gzip-compressed on the fly, so
+memory use stays flat however large the table is.
+"""
+import csv, io, json, zlib
+
+from sqlalchemy import select
+
+from services.serialize import format_timestamp
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "geojson": ("application/geo+json", "geojson"),
+}
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024
+# list columns are written as JSON strings in CSV
+JSON_COLUMNS = ("tracks", "palette", "assets")
+
+
+def iter_rows(engine, table, format_date):
+    """Dicts for every row in id order, fetched YIELD_PER at a time."""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=YIELD_PER).execute(select(table).order_by(table.c.id))
+        keys = list(result.keys())
+        for row in result:
+            d = dict(zip(keys, row))
+            d["date"] = format_date(d["date"])
+            if "updated_at" in d:
+                d["updated_at"] = format_timestamp(d["updated_at"])
+            for k in JSON_COLUMNS:
+                if d.get(k) is None:
+                    d[k] = []
+            yield d
+
+
+def _ndjson(rows, columns):
+    for d in rows:
+        yield json.dumps(d, ensure_ascii=False) + "\n"
+
+
+def _csv(rows, columns):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for d in rows:
+        for k in JSON_COLUMNS:
+            d[k] = json.dumps(d[k], ensure_ascii=False)
+        writer.writerow(d)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _geojson(rows, columns):
+    yield '{"type":"FeatureCollection","features":['
+    sep = ""
+    for d in rows:
+        feature = {
+            "type": "Feature",
+            "id": d["id"],
+            "geometry": {"type": "Point", "coordinates": [d.pop("lng"), d.pop("lat")]},
+            "properties": d,
+        }
+        yield sep + json.dumps(feature, ensure_ascii=False)
+        sep = ","
+    yield "]}\n"
+
+
+_ENCODERS = {"ndjson": _ndjson, "csv": _csv, "geojson": _geojson}
+
+
+def stream(engine, table, fmt, format_date, *, gzip=False):
+    """Byte chunks of the encoded export."""
+    pieces = _ENCODERS[fmt](iter_rows(engine, table, format_date), [c.name for c in table.columns])
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buf, size = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            data = "".join(buf).encode("utf-8")
+            buf, size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = "".join(buf).encode("utf-8")
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
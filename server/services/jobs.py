@@ -0,0 +1,99 @@
+# server/services/jobs.py
+"""
+Background worker pool for persisted jobs.
+
+Job state lives in the `job` table, which is also the queue: any process
+inserts a queued row, and the one process that started the runner finds
+it on its next poll (or at once, after wake()). Jobs a previous process
+left queued or running are found the same way, so a restart resumes them.
+Two processes running the same jobs against one database would run them
+twice, so only one may start() (see serve.py).
+"""
+import logging, os, queue, random, threading, time
+
+log = logging.getLogger(__name__)
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+
+def with_retries(fn, *, retries=3, base_delay=0.5, retry_on=(Exception,), give_up_on=()):
+    """Call fn(), retrying on retry_on (but not give_up_on) with exponential backoff + jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except retry_on as e:
+            if attempt == retries or isinstance(e, give_up_on):
+                raise
+            time.sleep(base_delay * (2 ** attempt) * (1 + random.random() / 2))
+
+
+class JobRunner:
+    def __init__(self, handler, pending, *, workers=2, name="jobs", on_error=None,
+                 poll_interval=JOB_POLL_INTERVAL):
+        self.handler = handler
+        self.pending = pending        # pending() -> ids of the jobs still to run, oldest first
+        self.on_error = on_error      # on_error(job_id, exc) when the handler raises
+        self.workers, self.name, self.poll_interval = workers, name, poll_interval
+        self._queue = queue.Queue()
+        self._active = set()          # ids queued or running in this process
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+
+    def start(self) -> "JobRunner":
+        """Start the worker threads and the poller (once; later calls do nothing)."""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True).start()
+        threading.Thread(target=self._poll, name=f"{self.name}-poll", daemon=True).start()
+        return self
+
+    def wake(self) -> None:
+        """Look for new jobs now instead of at the next poll."""
+        self._wake.set()
+
+    def poll(self) -> int:
+        """Queue the pending jobs not already queued or running here; returns how many."""
+        added = 0
+        for job_id in self.pending():
+            with self._lock:
+                if job_id in self._active:
+                    continue
+                self._active.add(job_id)
+            self._queue.put(job_id)
+            added += 1
+        return added
+
+    def join(self) -> None:
+        """Wait until every job pending now has been handled (tests, shutdown)."""
+        self.poll()
+        self._queue.join()
+
+    def _poll(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                log.exception("could not look for %s jobs", self.name)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self.handler(job_id)
+            except Exception as e:
+                log.exception("job %s crashed", job_id)
+                if self.on_error is not None:
+                    try:
+                        self.on_error(job_id, e)
+                    except Exception:
+                        log.exception("could not record the failure of job %s", job_id)
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+                self._queue.task_done()
@@ -0,0 +1,235 @@
+# server/services/metrics.py
+"""
+In-process metrics in the Prometheus text format.
+
+Request latency per route (Flask before/after hooks), SQL query counts and
+time (SQLAlchemy cursor events) and named spans around expensive steps
+(poster layers, encoders, enrichment lookups). Per-request totals go out in
+a Server-Timing header; `GET /metrics` renders everything for a scraper.
+
+METRICS_ENABLED=0 turns it all off: hooks are not registered and span()
+returns a shared no-op context. METRICS_PROFILE=1 additionally lets a
+request ask for `?profile=1`, which answers with a cProfile summary of
+that request instead of its body.
+"""
+import contextlib, contextvars, cProfile, io, os, pstats, threading, time
+
+from sqlalchemy import event
+
+ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+PROFILE = os.getenv("METRICS_PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_LINES = int(os.getenv("METRICS_PROFILE_LINES", "40"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            yield f"{self.name}{_labels(self.label_names, values)} {_number(total)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [per-bucket counts..., overflow, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), series):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.label_names, values, [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, values)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.label_names, values)} {series[-1]}"
+
+
+REQUEST_SECONDS = Histogram("musemap_http_request_duration_seconds", "Request latency by route.",
+                            ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("musemap_http_request_db_queries", "SQL statements per request by route.",
+                            ("method", "route"), COUNT_BUCKETS)
+DB_QUERIES = Counter("musemap_db_queries_total", "SQL statements executed.")
+DB_QUERY_SECONDS = Histogram("musemap_db_query_duration_seconds", "SQL statement latency.")
+SPAN_SECONDS = Histogram("musemap_span_duration_seconds", "Time spent in named steps (poster, encode, enrich).",
+                         ("span",))
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "query_seconds", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries, self.query_seconds, self.spans = 0, 0.0, {}
+
+
+_current = contextvars.ContextVar("musemap_request_stats", default=None)
+_noop = contextlib.nullcontext()
+
+
+def record_span(name, seconds):
+    """Add a step measured elsewhere (e.g. in a worker process) to the histograms and this request."""
+    SPAN_SECONDS.observe(seconds, name)
+    stats = _current.get()
+    if stats is not None:
+        stats.spans[name] = stats.spans.get(name, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def collect_spans(fn, args):
+    """(fn(*args), {span: seconds}) for work done outside a request, e.g. in a worker process."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        return fn(*args), stats.spans
+    finally:
+        _current.reset(token)
+
+
+def span(name):
+    """`with span("poster.blur"):` times a step; a no-op when metrics are disabled."""
+    return _span(name) if ENABLED else _noop
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement run on engine."""
+    if not ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        DB_QUERIES.inc()
+        DB_QUERY_SECONDS.observe(elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+
+def server_timing(stats) -> str:
+    """Server-Timing header value (milliseconds) for one request."""
+    parts = [f"app;dur={(time.perf_counter() - stats.started) * 1000:.1f}",
+             f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries"']
+    parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stats.spans.items()]
+    return ", ".join(parts)
+
+
+def profile_summary(profiler, lines=PROFILE_LINES) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(lines)
+    return out.getvalue()
+
+
+def init_app(app, engine=None):
+    """Register the request hooks on a Flask app (and SQL listeners on engine)."""
+    if engine is not None:
+        instrument_engine(engine)
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g.metrics_token = _current.set(RequestStats())
+        if PROFILE and request.args.get("profile") == "1":
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_request(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_SECONDS.observe(time.perf_counter() - stats.started, request.method, route, response.status_code)
+        REQUEST_QUERIES.observe(stats.queries, request.method, route)
+        response.headers["Server-Timing"] = server_timing(stats)
+        if profiler is not None:
+            response.direct_passthrough = False
+            response.set_data(profile_summary(profiler))
+            response.mimetype = "text/plain"
+            response.headers.pop("ETag", None)
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            _current.reset(token)
+
+
+def render(gauges=None) -> str:
+    """Every metric in the Prometheus text format; gauges: {name: (help, value)} sampled by the caller."""
+    out = []
+    for metric in _registry:
+        out.extend(metric.lines())
+    for name, (help, value) in (gauges or {}).items():
+        out += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return "\n".join(out) + "\n"
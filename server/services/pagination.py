@@ -0,0 +1,56 @@
+# server/services/pagination.py
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is the opaque, url-safe encoding of the last row's sort value and
+id. The next page continues strictly after that (value, id) pair, which
+is an index range scan no matter how deep the client pages.
+"""
+import base64, json
+from datetime import date
+
+from sqlalchemy import Date, tuple_
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(value, row_id: int) -> str:
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str):
+    """Return (value, id); raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, row_id = json.loads(raw)
+        return value, int(row_id)
+    except Exception:
+        raise ValueError(f"malformed cursor: {token}")
+
+
+def parse_limit(raw, default=None):
+    """Page size from a query string value, capped at MAX_PAGE_SIZE."""
+    if raw in (None, ""):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError(f"limit must be positive, got: {raw}")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset(stmt, sort_col, id_col, cursor, descending=False):
+    """Order stmt by (sort_col, id) and continue after cursor if given."""
+    cols = (id_col,) if sort_col is id_col else (sort_col, id_col)
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        if sort_col is id_col:
+            key, bound = id_col, row_id
+        else:
+            if isinstance(sort_col.type, Date):
+                value = date.fromisoformat(value)
+            key, bound = tuple_(sort_col, id_col), tuple_(value, row_id)
+        stmt = stmt.where(key < bound if descending else key > bound)
+    return stmt.order_by(*(c.desc() if descending else c.asc() for c in cols))
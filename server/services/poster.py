@@ -1,15 +1,75 @@
 # server/services/poster.py
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import qrcode, os, math
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont, ImageFilter
+import io, os, math, logging
+
+from services import metrics, qr
+
+log = logging.getLogger(__name__)
+
+# bump whenever the layout changes so cached cards are re-rendered
+RENDERER_VERSION = "5"
+
+GRADIENT_DIRECTIONS = ("vertical", "horizontal", "diagonal")
+
+# you can swap to a nicer font by shipping the .ttf in static/fonts/ (e.g., Poppins-SemiBold.ttf)
+FONT_DIR = os.path.join(os.path.dirname(__file__), "..", "static", "fonts")
+FONT_FILES = {
+    "regular": os.getenv("POSTER_FONT", "DejaVuSans.ttf"),
+    "bold": os.getenv("POSTER_FONT_BOLD", "DejaVuSans-Bold.ttf"),
+}
+FONT_CACHE_SIZE = int(os.getenv("POSTER_FONT_CACHE_SIZE", "64"))
+# composed background/card layers per (palette, size, scale, theme, gradient); each entry is a
+# full RGB canvas: ~1.8 MB at 640x960, ~7.4 MB for a scale-2 master (1280x1920)
+CHROME_CACHE_SIZE = int(os.getenv("POSTER_CHROME_CACHE_SIZE", "4"))
+# large blurs run on an image this many times smaller, then get upscaled
+BLUR_DOWNSCALE = int(os.getenv("POSTER_BLUR_DOWNSCALE", "4"))
 
 # ---------- helpers ----------
+def _resolve_font(name):
+    """Absolute path of a loadable font (bundled dir first, then system lookup), or None."""
+    for candidate in (os.path.join(FONT_DIR, name), name):
+        try:
+            return ImageFont.truetype(candidate, 12).path
+        except OSError:
+            continue
+    return None
+
+# resolved once at startup so renders never repeat the file lookup
+FONT_PATHS = {weight: _resolve_font(name) for weight, name in FONT_FILES.items()}
+FONT_PATHS["bold"] = FONT_PATHS["bold"] or FONT_PATHS["regular"]
+if FONT_PATHS["regular"] is None:
+    log.warning("poster font %r not found, falling back to Pillow's default font", FONT_FILES["regular"])
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font(path, size, weight):
+    if path is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(path, size)
+
 def _font(size, weight="regular"):
-    """Load DejaVuSans; fall back to default."""
-    try:
-        # you can swap to a nicer font if you ship the .ttf (e.g., Poppins-SemiBold.ttf)
-        return ImageFont.truetype("DejaVuSans.ttf", size)
-    except Exception:
-        return ImageFont.load_default()
+    """Loaded font for (size, weight), shared process-wide."""
+    return _load_font(FONT_PATHS.get(weight, FONT_PATHS["regular"]), size, weight)
+
+@lru_cache(maxsize=1024)
+def _text_len(text, size, weight="regular"):
+    return _font(size, weight).getlength(text)
+
+def _fit_font(text, max_w, max_size, min_size, step=2, weight="regular"):
+    """
+    Largest size on the max_size, max_size-step, ... grid whose text fits max_w,
+    stopping at the first grid size <= min_size. Binary search over the grid
+    (text width grows with size), so only ~log2(n) sizes get measured.
+    """
+    last = max(0, -(-(max_size - min_size) // step))
+    lo, hi = 0, last
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _text_len(text, max_size - mid*step, weight) <= max_w:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _font(max_size - lo*step, weight)
 
 def _text_w(draw, text, font):
     return draw.textlength(text, font=font)
@@ -20,59 +80,86 @@ def _draw_centered(draw, text, cx, y, font, fill="#fff"):
 
 def _clamp(n, a, b): return max(a, min(b, n))
 
+def _ramp(stops, n):
+    """Sample n eased colors along the color stops (parsed once)."""
+    cols = [ImageColor.getrgb(c)[:3] for c in stops] or [(0, 0, 0)]
+    if len(cols) == 1:
+        cols = cols * 2
+    segs = len(cols) - 1
+    out = []
+    for i in range(n):
+        t = i / (n-1) if n > 1 else 0.0
+        # ease
+        t = t*t*(3 - 2*t)
+        pos = t * segs
+        k = min(int(pos), segs - 1)
+        u = pos - k
+        (r0, g0, b0), (r1, g1, b1) = cols[k], cols[k+1]
+        out.append((int(r0*(1-u) + r1*u), int(g0*(1-u) + g1*u), int(b0*(1-u) + b1*u)))
+    return out
 
-def draw_poster(
-    artist: str,
-    city: str,
-    date_str: str,
-    palette: list[str],
-    tracks: list[str],
-    qr_url: str,
-    out_path: str,
-    *,
-    width: int = 640,            # flyer-ish, denser than 1080x1350
-    height: int = 960,
-    scale: float = 1.0,          # export scale (e.g., 1.25 for retina)
-    theme: str = "dark",         # "dark" | "light"
-):
+def _gradient(size, stops, direction="vertical"):
     """
-    Generates a shareable concert flyer:
-    - Large centered artist name
-    - City • Date as subtitle
-    - Soft gradient background from palette
-    - Rounded inner card + shadow
-    - Optional track list (compact)
-    - QR at the bottom
+    Eased multi-stop linear gradient built as a batched image op:
+    a single row/column of colors is computed once and stretched to the
+    full canvas, so the cost no longer grows with W*H Python calls.
+    """
+    W, H = size
+    if direction == "vertical":
+        col = Image.new("RGB", (1, H))
+        col.putdata(_ramp(stops, H))
+        return col.resize((W, H), Image.NEAREST)
+    if direction == "horizontal":
+        row = Image.new("RGB", (W, 1))
+        row.putdata(_ramp(stops, W))
+        return row.resize((W, H), Image.NEAREST)
+    if direction == "diagonal":
+        # top-left -> bottom-right: average of both ramps indexes a 256-color palette
+        xs = Image.new("L", (W, 1))
+        xs.putdata([x * 255 // max(1, W-1) for x in range(W)])
+        ys = Image.new("L", (1, H))
+        ys.putdata([y * 255 // max(1, H-1) for y in range(H)])
+        idx = ImageChops.add(xs.resize((W, H), Image.NEAREST), ys.resize((W, H), Image.NEAREST), scale=2.0)
+        idx.putpalette([v for rgb in _ramp(stops, 256) for v in rgb])
+        return idx.convert("RGB")
+    raise ValueError(f"unknown gradient direction: {direction!r}, expected one of {GRADIENT_DIRECTIONS}")
+
+def _blur(img, radius, downscale=None):
+    """
+    GaussianBlur(radius) computed at 1/downscale resolution and upscaled.
+    A wide blur leaves no detail that the smaller image cannot hold, and the
+    cost drops with the square of the factor.
+    """
+    f = BLUR_DOWNSCALE if downscale is None else downscale
+    if f <= 1 or radius < 2*f:
+        return img.filter(ImageFilter.GaussianBlur(radius=radius))
+    W, H = img.size
+    small = img.resize((max(1, -(-W // f)), max(1, -(-H // f))), Image.BOX)
+    return small.filter(ImageFilter.GaussianBlur(radius=radius / f)).resize((W, H), Image.BILINEAR)
+
+@lru_cache(maxsize=CHROME_CACHE_SIZE)
+def _chrome(pal, W, H, scale, theme, gradient):
+    """
+    Everything that does not depend on the memory's text or QR: blurred
+    gradient, card shadow, translucent card, header strip, color bands and
+    palette strip. Cached; callers must copy() before drawing.
     """
-    # --- sizes & palette ---
-    W, H = int(width*scale), int(height*scale)
     pad = int(36*scale)              # outer padding for the inner card
     r   = int(26*scale)              # card corner radius
-    pal = (palette or ["#12131b", "#2a2f3b", "#5c6a7c", "#e3e9ef", "#d81e45"])[:5]
-
-    fg_primary   = "#ffffff" if theme == "dark" else "#0e0f12"
-    fg_secondary = "#cfd6e1" if theme == "dark" else "#45505c"
 
     # --- gradient background ---
-    bg = Image.new("RGB", (W, H), pal[0])
-    grad = Image.new("RGB", (W, H), pal[-1])
-    # vertical gradient blend
-    for y in range(H):
-        t = y / (H-1)
-        # ease
-        t = t*t*(3 - 2*t)
-        r0, g0, b0 = Image.new("RGB", (1,1), pal[0]).getpixel((0,0))
-        r1, g1, b1 = Image.new("RGB", (1,1), pal[2]).getpixel((0,0))
-        r_ = int(r0*(1-t) + r1*t); g_ = int(g0*(1-t) + g1*t); b_ = int(b0*(1-t) + b1*t)
-        for x in range(W):
-            bg.putpixel((x,y), (r_, g_, b_))
-    bg = bg.filter(ImageFilter.GaussianBlur(radius=int(18*scale)))
+    with metrics.span("poster.gradient"):
+        bg = _gradient((W, H), (pal[0], pal[2 if len(pal) > 2 else -1]), gradient)
+    with metrics.span("poster.blur"):
+        bg = _blur(bg, int(18*scale))
 
     # --- inner card with shadow ---
-    canvas = Image.new("RGBA", (W, H))
+    # the shadow is plain black, so only its alpha needs blurring
+    shadow_alpha = Image.new("L", (W, H), 0)
+    ImageDraw.Draw(shadow_alpha).rounded_rectangle((pad+6, pad+8, W-pad+6, H-pad+8), r, fill=140)
     shadow = Image.new("RGBA", (W, H), (0,0,0,0))
-    ImageDraw.Draw(shadow).rounded_rectangle((pad+6, pad+8, W-pad+6, H-pad+8), r, fill=(0,0,0,140))
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=int(16*scale)))
+    with metrics.span("poster.blur"):
+        shadow.putalpha(_blur(shadow_alpha, int(16*scale)))
     canvas = Image.alpha_composite(bg.convert("RGBA"), shadow)
 
     card = Image.new("RGBA", (W - 2*pad, H - 2*pad), (255,255,255, 18 if theme=="dark" else 245))
@@ -85,29 +172,7 @@ def draw_poster(
 
     # --- header strip (subtle) ---
     header_h = int(220*scale)
-    ImageDraw.Draw(img).rounded_rectangle(
-        (pad, pad, W-pad, pad+header_h),
-        r, fill=pal[1]
-    )
-
-    # --- typography ---
-    # responsive title size
-    max_title = int(96*scale)
-    min_title = int(44*scale)
-    TITLE = _font(max_title)
-    # shrink title until it fits with side margins
-    max_text_w = W - 2*pad - int(48*scale)
-    while d.textlength(artist, font=TITLE) > max_text_w and TITLE.size > min_title:
-        TITLE = _font(TITLE.size - 2)
-
-    SUB   = _font(int(26*scale))
-    LIST  = _font(int(22*scale))
-
-    # --- centered title & subtitle ---
-    cx = W/2
-    title_y = pad + int(52*scale)
-    _draw_centered(d, artist, cx, title_y, TITLE, fill=fg_primary)
-    _draw_centered(d, f"{city} • {date_str}", cx, title_y + TITLE.size + int(8*scale), SUB, fill=fg_secondary)
+    d.rounded_rectangle((pad, pad, W-pad, pad+header_h), r, fill=pal[1])
 
     # --- decorative bands (3) under header ---
     y0 = pad + header_h + int(10*scale)
@@ -121,22 +186,95 @@ def draw_poster(
     sw = int((W - 2*pad - int(40*scale)) / max(1, len(pal)))
     for i, col in enumerate(pal):
         d.rectangle((sx0 + i*sw, sy0, sx0 + (i+1)*sw - 2, sy0 + strip_h), fill=col)
+    return img
+
+
+def render_poster(
+    artist: str,
+    city: str,
+    date_str: str,
+    palette: list[str],
+    tracks: list[str],
+    qr_url: str,
+    *,
+    width: int = 640,            # flyer-ish, denser than 1080x1350
+    height: int = 960,
+    scale: float = 1.0,          # export scale (e.g., 1.25 for retina)
+    theme: str = "dark",         # "dark" | "light"
+    gradient: str = "vertical",  # "vertical" | "horizontal" | "diagonal"
+    qr_style: str = "mono",      # "mono" (black on white) | "palette" (darkest on lightest palette color)
+):
+    """
+    Generates a shareable concert flyer:
+    - Large centered artist name
+    - City • Date as subtitle
+    - Soft gradient background from palette
+    - Rounded inner card + shadow
+    - Optional track list (compact)
+    - QR at the bottom
+    """
+    # --- sizes & palette ---
+    W, H = int(width*scale), int(height*scale)
+    pad = int(36*scale)              # outer padding for the inner card
+    r   = int(26*scale)              # card corner radius
+    pal = tuple((palette or ["#12131b", "#2a2f3b", "#5c6a7c", "#e3e9ef", "#d81e45"])[:5])
 
-    # --- tracks (compact, left aligned) ---
-    tx = pad + int(28*scale)
-    ty = y0 + int(16*scale)
-    for t in (tracks or [])[:7]:
-        d.text((tx, ty), f"• {t}", font=LIST, fill="#ffffff")
-        ty += int(30*scale)
+    fg_primary   = "#ffffff" if theme == "dark" else "#0e0f12"
+    fg_secondary = "#cfd6e1" if theme == "dark" else "#45505c"
+
+    # --- background, card, header, bands: shared by every card with this palette ---
+    with metrics.span("poster.chrome"):
+        img = _chrome(pal, W, H, scale, theme, gradient).copy()
+    d = ImageDraw.Draw(img)
+    header_h = int(220*scale)
+
+    with metrics.span("poster.text"):
+        # --- typography ---
+        # responsive title size
+        max_title = int(96*scale)
+        min_title = int(44*scale)
+        # shrink title until it fits with side margins
+        max_text_w = W - 2*pad - int(48*scale)
+        TITLE = _fit_font(artist, max_text_w, max_title, min_title)
+
+        SUB   = _font(int(26*scale))
+        LIST  = _font(int(22*scale))
+
+        # --- centered title & subtitle ---
+        cx = W/2
+        title_y = pad + int(52*scale)
+        _draw_centered(d, artist, cx, title_y, TITLE, fill=fg_primary)
+        _draw_centered(d, f"{city} • {date_str}", cx, title_y + TITLE.size + int(8*scale), SUB, fill=fg_secondary)
+
+        # --- tracks (compact, left aligned) ---
+        y0 = pad + header_h + int(10*scale)
+        tx = pad + int(28*scale)
+        ty = y0 + int(16*scale)
+        for t in (tracks or [])[:7]:
+            d.text((tx, ty), f"• {t}", font=LIST, fill="#ffffff")
+            ty += int(30*scale)
 
     # --- QR bottom-right ---
     qr_size = int(140*scale)
-    qr_img = qrcode.make(qr_url).resize((qr_size, qr_size))
-    img.paste(qr_img, (W - pad - qr_size - int(8*scale), H - pad - qr_size - int(8*scale)))
+    with metrics.span("poster.qr"):
+        qr_img = qr.qr_image(qr_url, qr_size, *(qr.palette_colors(pal) if qr_style == "palette" else qr.DEFAULT_COLORS))
+        img.paste(qr_img, (W - pad - qr_size - int(8*scale), H - pad - qr_size - int(8*scale)))
 
     # --- thin card border ---
     d.rounded_rectangle((pad, pad, W - pad, H - pad), r, outline="#0e0f12", width=int(3*scale))
+    return img
+
 
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    img.save(out_path, "PNG", optimize=True)
-    return out_path
+def draw_poster(artist, city, date_str, palette, tracks, qr_url, out_path=None, **options):
+    """
+    render_poster(...) encoded as an optimized PNG. out_path is a file path (written
+    and returned) or a writable binary file object (written to and returned); without
+    one, nothing touches the disk and the PNG bytes are returned.
+    """
+    img = render_poster(artist, city, date_str, palette, tracks, qr_url, **options)
+    target = io.BytesIO() if out_path is None else out_path
+    if isinstance(target, (str, os.PathLike)):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+    with metrics.span("poster.encode"):
+        img.save(target, "PNG", optimize=True)
+    return target.getvalue() if out_path is None else out_path
@@ -0,0 +1,72 @@
+# server/services/qr.py
+"""
+QR code bitmaps for poster cards.
+
+The module matrix is encoded once per URL, then drawn at a whole number of
+pixels per module (nearest-neighbour only, so modules stay crisp) and
+centred on an exactly size x size canvas. Both steps are LRU-cached, so a
+warm render pays nothing for its QR code.
+"""
+import os
+from functools import lru_cache
+
+import qrcode
+from PIL import Image, ImageColor
+
+QR_CACHE_SIZE = int(os.getenv("POSTER_QR_CACHE_SIZE", "512"))
+# quiet zone in modules: the spec asks for 4; 2 still scans and leaves bigger modules
+BORDERS = (4, 3, 2)
+DEFAULT_COLORS = ("#000000", "#ffffff")
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def matrix(url: str) -> tuple:
+    """Dark/light modules without a border, as a tuple of row tuples."""
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=0)
+    code.add_data(url)
+    code.make(fit=True)
+    return tuple(tuple(row) for row in code.get_matrix())
+
+
+def layout(modules: int, size: int):
+    """(pixels per module, border in modules) that gives the largest modules fitting size."""
+    return max(((size // (modules + 2*b), b) for b in BORDERS), key=lambda bb: (bb[0], bb[1]))
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_image(url: str, size: int, fg: str = DEFAULT_COLORS[0], bg: str = DEFAULT_COLORS[1]) -> Image.Image:
+    """size x size two-color ("P" mode) QR code; shared, so paste it rather than drawing on it."""
+    rows = matrix(url)
+    n = len(rows)
+    box, _ = layout(n, size)
+    box = max(1, box)
+
+    modules = Image.new("P", (n, n))
+    modules.putpalette([*ImageColor.getrgb(bg)[:3], *ImageColor.getrgb(fg)[:3]])
+    modules.putdata([1 if dark else 0 for row in rows for dark in row])
+    drawn = modules.resize((n*box, n*box), Image.NEAREST)
+    if n*box > size:
+        # too small for one pixel per module; still nearest-neighbour
+        return drawn.resize((size, size), Image.NEAREST)
+
+    img = Image.new("P", (size, size), 0)
+    img.putpalette(modules.getpalette())
+    offset = (size - n*box) // 2
+    img.paste(drawn, (offset, offset))
+    return img
+
+
+def _luminance(color):
+    r, g, b = (c / 255 for c in ImageColor.getrgb(color)[:3])
+    lin = [c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4 for c in (r, g, b)]
+    return 0.2126*lin[0] + 0.7152*lin[1] + 0.0722*lin[2]
+
+
+def palette_colors(palette, min_contrast: float = 4.5):
+    """(fg, bg) from the darkest and lightest palette colors, or black/white if they contrast too little."""
+    if not palette:
+        return DEFAULT_COLORS
+    ranked = sorted(palette, key=_luminance)
+    dark, light = ranked[0], ranked[-1]
+    contrast = (_luminance(light) + 0.05) / (_luminance(dark) + 0.05)
+    return (dark, light) if contrast >= min_contrast else DEFAULT_COLORS
@@ -0,0 +1,146 @@
+# server/services/render_pool.py
+"""
+Bounded process pool for CPU-bound card rendering on the request path.
+
+Pillow work holds the GIL for long stretches, so a render on a request
+thread stalls every other request in that process. Renders run in worker
+processes instead, started at a lower CPU priority so request threads win
+the CPU when it is short. At most `workers + queue_depth` renders are in
+flight per process; past that `submit` raises Saturated and the caller
+answers 503 with Retry-After. A caller that stops waiting (timeout) does
+not cancel the render: it finishes and lands in the card cache.
+
+Renders can be keyed (e.g. by the card's master file): a caller that finds
+a render with its key in flight waits for that one instead of starting
+another (single-flight, per process), without taking a queue slot.
+
+Named spans recorded inside a worker (see services/metrics.py) are sent
+back with the result and merged into the waiting request.
+"""
+import multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from services import metrics
+
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "0")) or os.cpu_count() or 1
+RENDER_QUEUE_DEPTH = int(os.getenv("RENDER_QUEUE_DEPTH", str(2 * RENDER_PROCESSES)))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "20"))
+RENDER_NICE = int(os.getenv("RENDER_NICE", "10"))
+
+
+class Saturated(RuntimeError):
+    """Every worker is busy and the queue is full."""
+
+
+class RenderTimeout(RuntimeError):
+    """The render did not finish in time (it keeps running in the pool)."""
+
+
+def _init_worker(nice):
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+class RenderPool:
+    def __init__(self, workers=RENDER_PROCESSES, queue_depth=RENDER_QUEUE_DEPTH,
+                 timeout=RENDER_TIMEOUT, nice=RENDER_NICE):
+        self.workers, self.queue_depth, self.timeout, self.nice = workers, queue_depth, timeout, nice
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = {}              # key -> Future
+        self._inflight_lock = threading.Lock()
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0,
+                      "coalesced": 0, "in_flight": 0}
+
+    def start(self):
+        """Create the worker processes now instead of on the first render."""
+        with self._lock:
+            if self._executor is None:
+                # spawn: the web process is threaded, where fork is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.nice,))
+            return self._executor
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def _done(self, future):
+        self._slots.release()
+        self._count("in_flight", -1)
+        self._count("failed" if future.cancelled() or future.exception() else "completed")
+
+    def submit(self, fn, *args):
+        """Future of (result, spans); raises Saturated when no slot is free."""
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise Saturated("render queue is full")
+        try:
+            future = self.start().submit(metrics.collect_spans, fn, args)
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed); start a fresh pool for the next request
+            with self._lock:
+                self._executor = None
+            self._slots.release()
+            raise Saturated("render pool restarting")
+        except BaseException:
+            self._slots.release()
+            raise
+        self._count("submitted")
+        self._count("in_flight")
+        future.add_done_callback(self._done)
+        return future
+
+    def _join_or_submit(self, key, fn, args):
+        """(future, leader): the in-flight render for key, else a new one registered under key."""
+        # held across submit (which never blocks), so two callers cannot both start a render for key
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count("coalesced")
+                return future, False
+            future = self._inflight[key] = self.submit(fn, *args)
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future, True
+
+    def _forget(self, key, future):
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def run(self, fn, *args, key=None, timeout=None):
+        """
+        fn(*args) in a worker; raises Saturated, RenderTimeout or fn's own exception.
+        With key, joins a render with the same key already in flight and returns its result.
+        """
+        if key is None:
+            future, leader = self.submit(fn, *args), True
+        else:
+            future, leader = self._join_or_submit(key, fn, args)
+        try:
+            result, spans = future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            self._count("timeouts")
+            raise RenderTimeout(f"render took longer than {self.timeout:g}s") from None
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            raise Saturated("render pool restarting") from None
+        if leader:
+            # followers share the leader's spans; recording them again would double-count
+            for name, seconds in spans.items():
+                metrics.record_span(name, seconds)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "queue_depth": self.queue_depth, "timeout": self.timeout, **self.stats}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
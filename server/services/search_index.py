@@ -0,0 +1,131 @@
+# server/services/search_index.py
+"""
+Full-text search over artist, venue, city and note.
+
+On SQLite this is an external-content FTS5 table over `memory`, kept in sync
+by triggers, tokenized with unicode61 + remove_diacritics so "bjork" finds
+"Björk", and ranked with bm25. Other backends fall back to a LIKE scan.
+"""
+import html, re
+
+from sqlalchemy import or_, text
+from sqlmodel import select
+
+FTS_TABLE = "memory_fts"
+COLUMNS = ("artist", "venue", "city", "note")
+# bm25 column weights: a hit in the artist name outranks one in a long note
+WEIGHTS = (10.0, 4.0, 4.0, 1.0)
+MARK_OPEN, MARK_CLOSE = "<mark>", "</mark>"
+# FTS5 wraps matches in these (private-use) characters; the text is HTML-escaped before they become <mark>
+_SENTINEL_OPEN, _SENTINEL_CLOSE = "\ue000", "\ue001"
+
+_cols = ", ".join(COLUMNS)
+_new = ", ".join(f"new.{c}" for c in COLUMNS)
+_old = ", ".join(f"old.{c}" for c in COLUMNS)
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_cols}, content='memory', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON memory BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON memory BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_cols} ON memory BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+]
+
+# services/bulk_import.py drops this per batch and indexes the new rows with catch_up
+INSERT_TRIGGER = f"{FTS_TABLE}_ai"
+
+_fts_engines = set()
+
+
+def install(engine) -> bool:
+    """Create the FTS5 index and its sync triggers; a new index is built from existing rows."""
+    if engine.dialect.name != "sqlite":
+        return False
+    try:
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)
+            ).first()
+            for stmt in _DDL:
+                conn.exec_driver_sql(stmt)
+            if not exists:
+                conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except Exception:
+        # sqlite compiled without fts5
+        return False
+    _fts_engines.add(engine.url)
+    return True
+
+
+def has_fts(engine) -> bool:
+    return engine.url in _fts_engines
+
+
+def rebuild(engine) -> None:
+    """Re-index every memory (e.g. after restoring a database copied without triggers)."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def catch_up(conn, after_id: int, last_id: int) -> None:
+    """Index the memories after_id < id <= last_id, inserted without the insert trigger."""
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, {_cols}) SELECT id, {_cols} FROM memory "
+        f"WHERE id > :after AND id <= :last"
+    ), {"after": after_id, "last": last_id})
+
+
+def to_match_query(q: str) -> str:
+    """User input -> FTS5 query: every word becomes a quoted prefix term, ANDed together."""
+    terms = re.findall(r"\w+", q, flags=re.UNICODE)
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def mark_up(fragment):
+    """highlight()/snippet() output -> HTML: user text escaped, only the match markers left as tags."""
+    if fragment is None:
+        return None
+    return html.escape(fragment).replace(_SENTINEL_OPEN, MARK_OPEN).replace(_SENTINEL_CLOSE, MARK_CLOSE)
+
+
+def like_pattern(q: str) -> str:
+    """Substring LIKE pattern for q, with LIKE wildcards in q matched literally (ESCAPE '\\')."""
+    return "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def search(session, model, engine, q: str, limit: int):
+    """
+    Return [(memory, rank, highlights)] best match first. highlights are HTML
+    (escaped text, matches in <mark>); rank/highlights are None on the LIKE fallback.
+    """
+    if not has_fts(engine):
+        like = like_pattern(q)
+        rows = session.exec(select(model).where(
+            or_(*(getattr(model, c).ilike(like, escape="\\") for c in COLUMNS))).limit(limit)).all()
+        return [(m, None, None) for m in rows]
+
+    match = to_match_query(q)
+    if not match:
+        return []
+    highlights = ", ".join(
+        f"highlight({FTS_TABLE}, {i}, :open, :close) AS {c}" for i, c in enumerate(COLUMNS[:-1])
+    )
+    hits = session.exec(text(
+        f"SELECT rowid AS id, bm25({FTS_TABLE}, {', '.join(map(str, WEIGHTS))}) AS rank, {highlights}, "
+        f"snippet({FTS_TABLE}, {len(COLUMNS) - 1}, :open, :close, '…', 12) AS note "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q ORDER BY rank LIMIT :limit"
+    ), params={"q": match, "open": _SENTINEL_OPEN, "close": _SENTINEL_CLOSE, "limit": limit}).mappings().all()
+
+    by_id = {m.id: m for m in session.exec(select(model).where(model.id.in_([h["id"] for h in hits])))}
+    return [
+        (by_id[h["id"]], h["rank"], {c: mark_up(h[c]) for c in COLUMNS})
+        for h in hits if h["id"] in by_id
+    ]
@@ -0,0 +1,79 @@
+# server/services/serialize.py
+"""
+Fast JSON serialization for memory responses.
+
+Reads select plain column tuples (no ORM objects, no identity map), dates
+are formatted without strftime, and the payload is encoded with orjson
+when it is installed (stdlib json otherwise). `?fields=id,lat,lng` narrows
+both the query and the output to the listed columns.
+"""
+import json
+
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# "00".."99" so a date is three lookups and a join instead of strftime
+_TWO_DIGITS = tuple(f"{i:02d}" for i in range(100))
+
+
+def format_date(d) -> str:
+    """date -> 'DD-MM-YYYY'."""
+    return f"{_TWO_DIGITS[d.day]}-{_TWO_DIGITS[d.month]}-{d.year:04d}"
+
+
+def format_timestamp(dt):
+    """datetime (UTC) -> 'YYYY-MM-DDTHH:MM:SS.mmmZ'; None stays None."""
+    return None if dt is None else dt.isoformat(timespec="milliseconds") + "Z"
+
+
+# columns that need formatting on the way out
+FORMATTERS = {"date": format_date, "updated_at": format_timestamp}
+
+
+def parse_fields(raw, table) -> tuple:
+    """Column names from a ?fields= value (all columns when empty); ValueError on unknown names."""
+    names = tuple(c.name for c in table.columns)
+    if not raw:
+        return names
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in names]
+    if unknown:
+        raise ValueError(f"unknown field: {', '.join(unknown)} (expected any of {', '.join(names)})")
+    return fields
+
+
+def select_rows(table, fields, *required):
+    """SELECT of fields followed by any required columns (cursor keys etc.) not already in it."""
+    names = list(fields) + [c.key for c in required if c.key not in fields]
+    return select(*(table.c[n] for n in names))
+
+
+def to_dicts(fields, rows) -> list:
+    """Dicts of the first len(fields) values of each row, dates formatted."""
+    formatters = [(f, FORMATTERS[f]) for f in fields if f in FORMATTERS]
+    out = []
+    for row in rows:
+        d = dict(zip(fields, row))
+        for f, fmt in formatters:
+            d[f] = fmt(d[f])
+        out.append(d)
+    return out
+
+
+def model_dict(obj, fields) -> dict:
+    """Same shape as to_dicts for an already-loaded ORM object."""
+    d = {f: getattr(obj, f) for f in fields}
+    for f, fmt in FORMATTERS.items():
+        if f in d:
+            d[f] = fmt(d[f])
+    return d
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,167 @@
+# server/services/stats.py
+"""
+Aggregate counts per year, artist, city and country.
+
+On SQLite the counts live in a small summary table, `memory_stat(dimension,
+value, count)`, kept up to date by triggers on `memory`. Every insert,
+update and delete (including bulk imports) adjusts it in the same
+transaction, so reading the stats never scans the memory table. Other
+backends fall back to GROUP BY queries.
+"""
+from datetime import date
+
+from sqlalchemy import extract, func, text
+from sqlmodel import select
+
+STAT_TABLE = "memory_stat"
+# dimension -> SQL expression over the memory row (dates are stored as 'YYYY-MM-DD')
+DIMENSIONS = {
+    "year": "substr({row}.date, 1, 4)",
+    "artist": "{row}.artist",
+    "city": "{row}.city",
+    "country": "{row}.country",
+}
+
+
+def _bump(row, delta):
+    stmts = []
+    for dim, expr in DIMENSIONS.items():
+        value = expr.format(row=row)
+        if delta > 0:
+            stmts.append(f"INSERT OR IGNORE INTO {STAT_TABLE}(dimension, value, count) VALUES ('{dim}', {value}, 0);")
+        where = f"WHERE dimension = '{dim}' AND value = {value}"
+        stmts.append(f"UPDATE {STAT_TABLE} SET count = count + ({delta}) {where};")
+        if delta < 0:
+            stmts.append(f"DELETE FROM {STAT_TABLE} {where} AND count <= 0;")
+    return "\n        ".join(stmts)
+
+
+_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {STAT_TABLE} (
+        dimension TEXT NOT NULL, value TEXT NOT NULL, count INTEGER NOT NULL,
+        PRIMARY KEY (dimension, value))""",
+    # top-N per dimension without sorting the whole table
+    f"CREATE INDEX IF NOT EXISTS ix_{STAT_TABLE}_count ON {STAT_TABLE}(dimension, count)",
+    f"""CREATE TRIGGER IF NOT EXISTS {STAT_TABLE}_ai AFTER INSERT ON memory BEGIN
+        {_bump("new", 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {STAT_TABLE}_ad AFTER DELETE ON memory BEGIN
+        {_bump("old", -1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {STAT_TABLE}_au AFTER UPDATE OF {", ".join(d for d in DIMENSIONS if d != "year")}, date ON memory BEGIN
+        {_bump("old", -1)}
+        {_bump("new", 1)}
+    END""",
+]
+
+_REBUILD = [f"DELETE FROM {STAT_TABLE}"] + [
+    f"INSERT INTO {STAT_TABLE}(dimension, value, count) "
+    f"SELECT '{dim}', {expr.format(row='memory')}, count(*) FROM memory GROUP BY 2"
+    for dim, expr in DIMENSIONS.items()
+]
+
+# bulk imports drop this per batch and count the new rows with catch_up
+INSERT_TRIGGER = f"{STAT_TABLE}_ai"
+
+_stat_engines = set()
+
+
+def install(engine) -> bool:
+    """Create the summary table and its triggers; a new table is filled from existing rows."""
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (STAT_TABLE,)
+        ).first()
+        for stmt in _DDL:
+            conn.exec_driver_sql(stmt)
+        if not exists:
+            for stmt in _REBUILD:
+                conn.exec_driver_sql(stmt)
+    _stat_engines.add(engine.url)
+    return True
+
+
+def has_stats(engine) -> bool:
+    return engine.url in _stat_engines
+
+
+def rebuild(engine) -> None:
+    """Recount everything from the memory table."""
+    with engine.begin() as conn:
+        for stmt in _REBUILD:
+            conn.exec_driver_sql(stmt)
+
+
+def catch_up(conn, after_id: int, last_id: int) -> None:
+    """Count the memories after_id < id <= last_id, inserted without the insert trigger."""
+    for dim, expr in DIMENSIONS.items():
+        conn.execute(text(
+            f"INSERT INTO {STAT_TABLE}(dimension, value, count) "
+            f"SELECT '{dim}', {expr.format(row='memory')}, count(*) FROM memory "
+            f"WHERE id > :after AND id <= :last GROUP BY 2 "
+            f"ON CONFLICT(dimension, value) DO UPDATE SET count = count + excluded.count"
+        ), {"after": after_id, "last": last_id})
+
+
+def _grouped(session, model):
+    """{dimension: {value: count}} straight from the memory table."""
+    out = {}
+    for dim in DIMENSIONS:
+        # extract works on every dialect (PostgreSQL has no substr(date)); it returns a number
+        col = extract("year", model.date) if dim == "year" else getattr(model, dim)
+        rows = session.exec(select(col, func.count()).group_by(col))
+        out[dim] = {str(int(v)) if dim == "year" else str(v): n for v, n in rows}
+    return out
+
+
+def check(session, model) -> dict:
+    """Differences between the summary table and a full recount: {dimension: {value: (stored, actual)}}."""
+    actual = _grouped(session, model)
+    stored = {dim: {} for dim in DIMENSIONS}
+    for dim, value, count in session.exec(text(f"SELECT dimension, value, count FROM {STAT_TABLE}")):
+        stored.setdefault(dim, {})[value] = count
+    diff = {}
+    for dim in stored:
+        keys = set(stored[dim]) | set(actual.get(dim, {}))
+        bad = {k: (stored[dim].get(k, 0), actual.get(dim, {}).get(k, 0)) for k in keys
+               if stored[dim].get(k, 0) != actual.get(dim, {}).get(k, 0)}
+        if bad:
+            diff[dim] = bad
+    return diff
+
+
+def summary(session, model, engine, top: int = 10, full: bool = False) -> dict:
+    """
+    Totals, counts per year, distinct counts and the top-N artists/cities/countries.
+    full=True adds the complete per-artist/city/country counts.
+    """
+    names = {"artist": "artists", "city": "cities", "country": "countries"}
+    if has_stats(engine):
+        def rows(sql, **params):
+            return session.exec(text(sql), params=params).all()
+        by_year = dict(rows(f"SELECT value, count FROM {STAT_TABLE} WHERE dimension = 'year'"))
+        unique = dict(rows(f"SELECT dimension, count(*) FROM {STAT_TABLE} GROUP BY dimension"))
+        ranked = {
+            dim: rows(f"SELECT value, count FROM {STAT_TABLE} WHERE dimension = :dim "
+                      f"ORDER BY count DESC, value" + ("" if full else " LIMIT :top"), dim=dim, top=top)
+            for dim in names
+        }
+    else:
+        counts = _grouped(session, model)
+        by_year = counts["year"]
+        unique = {dim: len(values) for dim, values in counts.items()}
+        ranked = {dim: sorted(counts[dim].items(), key=lambda kv: (-kv[1], kv[0])) for dim in names}
+
+    by_year = {int(y): n for y, n in sorted(by_year.items())}
+    result = {
+        "total": sum(by_year.values()),
+        "this_year": by_year.get(date.today().year, 0),
+        "by_year": by_year,
+        "unique": {names[dim]: unique.get(dim, 0) for dim in names},
+        "top": {dim: [{"value": v, "count": n} for v, n in ranked[dim][:top]] for dim in names},
+    }
+    if full:
+        result.update({f"by_{dim}": dict(ranked[dim]) for dim in names})
+    return result
@@ -0,0 +1,152 @@
+# server/services/sync.py
+"""
+Change tracking for delta sync (`GET /memories/changes?since=<token>`).
+
+On SQLite, triggers on `memory` write one row per memory into
+`memory_change(seq, memory_id, deleted, changed_at)`: every insert or
+update replaces that memory's row with a new, higher `seq` (AUTOINCREMENT,
+so numbers are never reused) and a delete leaves a tombstone. The log
+therefore holds at most one row per memory ever seen, and a sync token is
+just the highest `seq` a client has applied.
+
+Tombstones older than the retention window are compacted away; tokens from
+before the newest compacted tombstone can no longer be answered and the
+client has to refetch everything. Other backends have no change log.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+CHANGE_TABLE = "memory_change"
+STATE_TABLE = "memory_sync_state"
+
+
+class TokenExpired(ValueError):
+    """The token predates compacted tombstones; the client must do a full refetch."""
+
+
+def _log(row, deleted):
+    return f"""DELETE FROM {CHANGE_TABLE} WHERE memory_id = {row}.id;
+        INSERT INTO {CHANGE_TABLE}(memory_id, deleted, changed_at) VALUES ({row}.id, {deleted}, CURRENT_TIMESTAMP);"""
+
+
+_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {CHANGE_TABLE} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        memory_id INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at TEXT NOT NULL)""",
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{CHANGE_TABLE}_memory ON {CHANGE_TABLE}(memory_id)",
+    # compaction scans only tombstones, oldest first
+    f"CREATE INDEX IF NOT EXISTS ix_{CHANGE_TABLE}_tombstone ON {CHANGE_TABLE}(deleted, changed_at)",
+    f"""CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        compacted_through INTEGER NOT NULL)""",
+    f"INSERT OR IGNORE INTO {STATE_TABLE}(id, compacted_through) VALUES (1, 0)",
+    f"""CREATE TRIGGER IF NOT EXISTS {CHANGE_TABLE}_ai AFTER INSERT ON memory BEGIN
+        {_log("new", 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CHANGE_TABLE}_au AFTER UPDATE ON memory BEGIN
+        {_log("new", 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CHANGE_TABLE}_ad AFTER DELETE ON memory BEGIN
+        {_log("old", 1)}
+    END""",
+]
+
+# bulk imports drop this per batch and log the new rows with catch_up
+INSERT_TRIGGER = f"{CHANGE_TABLE}_ai"
+
+_sync_engines = set()
+
+
+def install(engine) -> bool:
+    """Create the change log and its triggers; a new log starts with every existing memory."""
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (CHANGE_TABLE,)
+        ).first()
+        # rows from before updated_at existed (before the triggers, so this is not logged as a change)
+        conn.exec_driver_sql("UPDATE memory SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+        for stmt in _DDL:
+            conn.exec_driver_sql(stmt)
+        if not exists:
+            conn.exec_driver_sql(
+                f"INSERT INTO {CHANGE_TABLE}(memory_id, deleted, changed_at) "
+                f"SELECT id, 0, CURRENT_TIMESTAMP FROM memory ORDER BY id")
+    _sync_engines.add(engine.url)
+    return True
+
+
+def has_sync(engine) -> bool:
+    return engine.url in _sync_engines
+
+
+def catch_up(conn, after_id: int, last_id: int) -> None:
+    """Log the memories after_id < id <= last_id, inserted without the insert trigger."""
+    params = {"after": after_id, "last": last_id}
+    # ids can be reused after the highest one is deleted, which leaves its tombstone behind
+    conn.execute(text(f"DELETE FROM {CHANGE_TABLE} WHERE memory_id > :after AND memory_id <= :last"), params)
+    conn.execute(text(
+        f"INSERT INTO {CHANGE_TABLE}(memory_id, deleted, changed_at) "
+        f"SELECT id, 0, CURRENT_TIMESTAMP FROM memory WHERE id > :after AND id <= :last ORDER BY id"
+    ), params)
+
+
+def parse_token(raw: str) -> int:
+    """Token from a query string value; ValueError when malformed."""
+    token = int(raw)
+    if token < 0:
+        raise ValueError(f"since must be a sync token, got: {raw}")
+    return token
+
+
+def current_token(conn) -> int:
+    """Token that covers every change committed so far."""
+    return conn.execute(text(
+        f"SELECT max(coalesce((SELECT max(seq) FROM {CHANGE_TABLE}), 0), compacted_through) "
+        f"FROM {STATE_TABLE} WHERE id = 1")).scalar_one()
+
+
+def changes(conn, since: int, limit: int):
+    """
+    (changed ids, deleted ids, next token, more) after since, oldest first,
+    at most limit entries; raises TokenExpired for compacted tokens.
+    """
+    compacted = conn.execute(text(f"SELECT compacted_through FROM {STATE_TABLE} WHERE id = 1")).scalar_one()
+    if since < compacted:
+        raise TokenExpired(f"sync token {since} has expired; refetch GET /memories")
+    # token first, and no rows past it: writes are serialized, so anything committed after
+    # this read gets a higher seq and is picked up by the next call instead of being skipped
+    upto = current_token(conn)
+    rows = conn.execute(text(
+        f"SELECT seq, memory_id, deleted FROM {CHANGE_TABLE} WHERE seq > :since AND seq <= :upto "
+        f"ORDER BY seq LIMIT :limit"
+    ), {"since": since, "upto": upto, "limit": limit + 1}).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    changed = [mid for _, mid, deleted in rows if not deleted]
+    deleted = [mid for _, mid, deleted in rows if deleted]
+    token = rows[-1][0] if more else max(upto, since)
+    return changed, deleted, token, more
+
+
+def compact(engine, retention_days: float) -> int:
+    """Drop tombstones older than the retention window; returns how many were removed."""
+    if not has_sync(engine):
+        return 0
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    with engine.begin() as conn:
+        newest = conn.execute(text(
+            f"SELECT max(seq), count(*) FROM {CHANGE_TABLE} WHERE deleted = 1 AND changed_at < :cutoff"
+        ), {"cutoff": cutoff}).one()
+        if not newest[1]:
+            return 0
+        conn.execute(text(f"DELETE FROM {CHANGE_TABLE} WHERE deleted = 1 AND changed_at < :cutoff"),
+                     {"cutoff": cutoff})
+        conn.execute(text(
+            f"UPDATE {STATE_TABLE} SET compacted_through = max(compacted_through, :seq) WHERE id = 1"
+        ), {"seq": newest[0]})
+    return newest[1]
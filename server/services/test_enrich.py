@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for the enrichment service against a local stub HTTP server.
+Run from the server directory: python -m pytest services/test_enrich.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Add the server directory to the path so we can import the enrichment service
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from services import enrich
+
+
+class StubLastFm(BaseHTTPRequestHandler):
+    """Answers artist.gettoptracks; the first `fail_first` calls get `fail_status` (503)."""
+    fail_first = 0
+    fail_status = 503
+    calls = []
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        StubLastFm.calls.append((time.monotonic(), query))
+        if len(StubLastFm.calls) <= StubLastFm.fail_first:
+            self.send_response(StubLastFm.fail_status)
+            self.end_headers()
+            return
+        artist = query["artist"][0]
+        body = {"toptracks": {"track": [{"name": f"{artist} Hit {i}"} for i in range(10)]}}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def lastfm_stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLastFm)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubLastFm.calls = []
+    StubLastFm.fail_first = 0
+    StubLastFm.fail_status = 503
+    monkeypatch.setattr(enrich, "LASTFM_API_KEY", "test-key")
+    monkeypatch.setattr(enrich, "LASTFM_API_URL", f"http://127.0.0.1:{server.server_port}/2.0/")
+    enrich.lookup_cache.clear(persistent=True)
+    yield StubLastFm
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_tracks_from_stub_server(lastfm_stub):
+    tracks = enrich.fetch_tracks_for_artist("Radiohead")
+    assert tracks == [f"Radiohead Hit {i}" for i in range(8)]
+    _, query = lastfm_stub.calls[0]
+    assert query["method"] == ["artist.gettoptracks"] and query["api_key"] == ["test-key"]
+
+    lastfm_stub.fail_first = 2
+    lastfm_stub.calls = []
+    with pytest.raises(enrich.UpstreamError):
+        enrich.fetch_tracks_for_artist("Portishead")
+
+
+def test_artist_cache_single_flight_and_negative_caching(lastfm_stub):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from services.enrich_cache import EnrichCache
+
+    # concurrent lookups for the same (differently spelled) artist share one upstream call
+    before = enrich.lookup_cache.snapshot()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(enrich.fetch_tracks_for_artist, ["Björk", "bjork ", "BJÖRK"] * 4))
+    assert len(lastfm_stub.calls) == 1
+    assert all(r == results[0] for r in results)
+    after = enrich.lookup_cache.snapshot()
+    assert after["misses"] - before["misses"] == 1
+    assert (after["hits"] + after["coalesced"]) - (before["hits"] + before["coalesced"]) == 11
+
+    # errors are not cached; empty results are, for the shorter negative TTL
+    cache = EnrichCache(ttl=60, negative_ttl=0.05)
+    calls = []
+    def empty():
+        calls.append(1)
+        return []
+    assert cache.get_or_load("tracks:nobody", empty) == []
+    assert cache.get_or_load("tracks:nobody", empty) == [] and len(calls) == 1
+    time.sleep(0.06)
+    cache.get_or_load("tracks:nobody", empty)
+    assert len(calls) == 2
+
+    def boom():
+        raise enrich.UpstreamError("down")
+    for _ in range(2):
+        with pytest.raises(enrich.UpstreamError):
+            cache.get_or_load("tracks:flaky", boom)
+    assert cache.snapshot()["errors"] == 2
+
+
+def test_cache_entries_are_upserted(tmp_path):
+    from sqlalchemy import create_engine, select
+
+    from models import EnrichCacheEntry
+    from services.enrich_cache import EnrichCache
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    table = EnrichCacheEntry.__table__
+    table.create(engine)
+    # two processes missing the same key both store it: the second write replaces the first
+    first, second = EnrichCache(), EnrichCache()
+    for cache in (first, second):
+        cache.bind(engine, table)
+    first.get_or_load("tracks:muse", lambda: ["Uprising"])
+    second._put_db("tracks:muse", time.time() + 60, ["Hysteria"])
+    with engine.connect() as conn:
+        assert conn.execute(select(table.c.value)).scalars().all() == [["Hysteria"]]
+    engine.dispose()
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = enrich._HostRateLimiter({"musicbrainz.org": 20.0})
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.wait("beta.musicbrainz.org")
+    assert time.monotonic() - start >= 0.15
+
+    # hosts without a limit are not delayed
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.wait("example.com")
+    assert time.monotonic() - start < 0.05
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics service.
+Run from the server directory: python -m pytest services/test_metrics.py
+"""
+
+import os
+import sys
+
+# Add the server directory to the path so we can import the metrics service
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from services import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry for the test's metrics, so they never reach the app's /metrics."""
+    monkeypatch.setattr(metrics, "_registry", [])
+    return metrics._registry
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    h = metrics.Histogram("test_latency_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, '/a"b')
+    lines = list(h.lines())
+    assert lines[1] == "# TYPE test_latency_seconds histogram"
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{route="/a\\"b"} 4' in lines
+    assert "test_latency_seconds_sum" in metrics.render()
+    assert registry == [h]
+
+
+def test_spans_feed_the_current_request_and_are_free_when_disabled(monkeypatch):
+    stats = metrics.RequestStats()
+    token = metrics._current.set(stats)
+    try:
+        with metrics.span("test.step"):
+            pass
+    finally:
+        metrics._current.reset(token)
+    assert "test.step" in stats.spans and "test.step;dur=" in metrics.server_timing(stats)
+
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    assert metrics.span("test.step") is metrics.span("other.step")
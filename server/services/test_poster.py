@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the poster renderer.
+Run from the server directory: python -m pytest services/test_poster.py
+"""
+
+import io
+import os
+import sys
+
+# Add the server directory to the path so we can import the poster service
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from services import poster
+from services.poster import _fit_font, _font, _gradient, draw_poster
+
+PALETTE = ["#FF6B6B", "#4ECDC4", "#45B7D1", "#96CEB4", "#FFEAA7"]
+
+
+def _reference_background(W, H, pal):
+    """The original per-pixel gradient loop, kept as the visual reference."""
+    bg = Image.new("RGB", (W, H), pal[0])
+    for y in range(H):
+        t = y / (H-1)
+        t = t*t*(3 - 2*t)
+        r0, g0, b0 = Image.new("RGB", (1,1), pal[0]).getpixel((0,0))
+        r1, g1, b1 = Image.new("RGB", (1,1), pal[2]).getpixel((0,0))
+        r_ = int(r0*(1-t) + r1*t); g_ = int(g0*(1-t) + g1*t); b_ = int(b0*(1-t) + b1*t)
+        for x in range(W):
+            bg.putpixel((x,y), (r_, g_, b_))
+    return bg
+
+
+def test_vertical_gradient_matches_reference_pixels():
+    for pal in (PALETTE, ["#222", "#333", "#444", "#ddd", "#fff"]):
+        W, H = 48, 96
+        expected = _reference_background(W, H, pal)
+        actual = _gradient((W, H), (pal[0], pal[2]))
+        assert actual.mode == "RGB" and actual.size == (W, H)
+        assert list(actual.getdata()) == list(expected.getdata())
+
+        blurred_expected = expected.filter(ImageFilter.GaussianBlur(radius=4))
+        blurred_actual = actual.filter(ImageFilter.GaussianBlur(radius=4))
+        assert blurred_actual.tobytes() == blurred_expected.tobytes()
+
+
+def test_multi_stop_and_directions():
+    stops = ("#ff0000", "#00ff00", "#0000ff")
+
+    vertical = _gradient((10, 101), stops)
+    assert vertical.getpixel((0, 0)) == (255, 0, 0)
+    assert vertical.getpixel((9, 50)) == (0, 255, 0)
+    assert vertical.getpixel((5, 100)) == (0, 0, 255)
+
+    horizontal = _gradient((101, 10), stops, "horizontal")
+    assert horizontal.getpixel((0, 5)) == (255, 0, 0)
+    assert horizontal.getpixel((50, 0)) == (0, 255, 0)
+    assert horizontal.getpixel((100, 9)) == (0, 0, 255)
+
+    diagonal = _gradient((64, 64), stops, "diagonal")
+    assert diagonal.getpixel((0, 0)) == (255, 0, 0)
+    assert diagonal.getpixel((63, 63)) == (0, 0, 255)
+    # anti-diagonal corners sit on the middle stop
+    assert diagonal.getpixel((63, 0)) == diagonal.getpixel((0, 63))
+
+
+def test_unknown_direction_is_rejected():
+    try:
+        _gradient((4, 4), PALETTE, "radial")
+    except ValueError as e:
+        assert "radial" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_font_cache_and_title_fitting():
+    assert _font(40) is _font(40)
+
+    max_w, max_size, min_size = 496, 96, 44
+    for artist in ("Muse", "Godspeed You! Black Emperor", "x" * 200):
+        # the original linear walk, 2px at a time
+        expected = _font(max_size)
+        while expected.getlength(artist) > max_w and expected.size > min_size:
+            expected = _font(expected.size - 2)
+        assert _fit_font(artist, max_w, max_size, min_size).size == expected.size
+
+
+def test_draw_poster_writes_png(tmp_path):
+    out_path = str(tmp_path / "card.png")
+    result = draw_poster(
+        artist="The Beatles",
+        city="London, UK",
+        date_str="15 Aug 1965",
+        palette=PALETTE,
+        tracks=["Help!", "Yesterday"],
+        qr_url="https://musemap.example.com/memories/1",
+        out_path=out_path,
+        scale=0.5,
+    )
+    assert result == out_path
+    with Image.open(out_path) as img:
+        assert img.size == (320, 480)
+
+
+def test_draw_poster_renders_in_memory(tmp_path):
+    args = dict(artist="The Beatles", city="London, UK", date_str="15 Aug 1965", palette=PALETTE,
+                tracks=["Help!"], qr_url="https://musemap.example.com/memories/1", scale=0.5)
+    data = draw_poster(**args)
+    buf = io.BytesIO()
+    assert draw_poster(**args, out_path=buf) is buf and buf.getvalue() == data
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == "PNG" and img.size == (320, 480)
+    assert draw_poster(**args, out_path=str(tmp_path / "card.png")) and open(tmp_path / "card.png", "rb").read() == data
+
+
+def _card(tmp_path, name, **overrides):
+    args = dict(artist="Muse", city="Paris, France", date_str="5 Jun 2010", palette=PALETTE,
+                tracks=["Uprising"], qr_url="https://musemap.example.com/memories/2",
+                out_path=str(tmp_path / name))
+    args.update(overrides)
+    draw_poster(**args)
+    return Image.open(args["out_path"]).convert("RGB")
+
+
+def test_reduced_resolution_blurs_stay_within_tolerance(tmp_path, monkeypatch):
+    for gradient in ("vertical", "diagonal"):
+        monkeypatch.setattr(poster, "BLUR_DOWNSCALE", 1)
+        poster._chrome.cache_clear()
+        reference = _card(tmp_path, "full.png", gradient=gradient)
+        monkeypatch.setattr(poster, "BLUR_DOWNSCALE", 4)
+        poster._chrome.cache_clear()
+        fast = _card(tmp_path, "fast.png", gradient=gradient)
+
+        diff = ImageChops.difference(reference, fast).convert("L")
+        assert diff.getextrema()[1] <= 8
+        assert ImageStat.Stat(diff).mean[0] < 0.5
+    poster._chrome.cache_clear()
+
+
+def test_chrome_layers_are_cached_and_not_mutated(tmp_path):
+    poster._chrome.cache_clear()
+    _card(tmp_path, "a.png", artist="First", tracks=["One"])
+    chrome = poster._chrome(tuple(PALETTE), 640, 960, 1.0, "dark", "vertical")
+    pristine = chrome.tobytes()
+    second = _card(tmp_path, "b.png", artist="Second", tracks=["Two", "Three"])
+    info = poster._chrome.cache_info()
+    assert info.misses == 1 and info.hits >= 2
+    assert chrome.tobytes() == pristine
+    # only the per-memory text and QR differ between cards with the same palette
+    assert second.size == (640, 960)
+    assert second.getpixel((5, 5)) == _card(tmp_path, "c.png", artist="Third").getpixel((5, 5))
+
+
+def test_border_is_drawn_over_overflowing_titles(tmp_path):
+    # a title too long for the minimum font size runs past the card edge; the border stays on top
+    card = _card(tmp_path, "long.png", artist="W" * 60, palette=["#ffffff"] * 5)
+    pad = 36
+    assert all(card.getpixel((x, 110)) == (14, 15, 18) for x in range(pad, pad + 3))
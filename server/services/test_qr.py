@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the QR bitmap service.
+Run from the server directory: python -m pytest services/test_qr.py
+"""
+
+import os
+import sys
+
+# Add the server directory to the path so we can import the qr service
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import ImageColor
+
+from services import qr
+
+URL = "https://musemap.example.com/memories/42"
+
+
+def test_modules_are_crisp_and_exactly_sized():
+    for size in (70, 140, 280):
+        img = qr.qr_image(URL, size)
+        assert img.size == (size, size)
+        # nearest-neighbour only: exactly two colors, no blurred edges
+        assert len(img.getcolors()) == 2
+
+        rows = qr.matrix(URL)
+        n = len(rows)
+        box, _ = qr.layout(n, size)
+        offset = (size - n*box) // 2
+        rgb = img.convert("RGB")
+        for y in range(n):
+            for x in range(n):
+                expected = (0, 0, 0) if rows[y][x] else (255, 255, 255)
+                assert rgb.getpixel((offset + x*box + box // 2, offset + y*box + box // 2)) == expected
+        # the quiet zone is at least two modules wide
+        assert offset >= 2 * box
+
+
+def test_bitmaps_are_cached_per_url_size_and_colors():
+    assert qr.qr_image(URL, 140) is qr.qr_image(URL, 140)
+    assert qr.qr_image(URL, 140) is not qr.qr_image(URL, 141)
+    before = qr.matrix.cache_info().misses
+    qr.qr_image(URL, 143, "#112233", "#eeeeee")
+    assert qr.matrix.cache_info().misses == before  # same URL: matrix reused across sizes
+
+
+def test_palette_colors_keep_contrast():
+    fg, bg = qr.palette_colors(["#12131b", "#2a2f3b", "#5c6a7c", "#e3e9ef", "#d81e45"])
+    assert (fg, bg) == ("#12131b", "#e3e9ef")
+    img = qr.qr_image(URL, 140, fg, bg).convert("RGB")
+    assert {c for _, c in img.getcolors()} == {ImageColor.getrgb(fg), ImageColor.getrgb(bg)}
+    # a washed-out palette falls back to black on white
+    assert qr.palette_colors(["#888888", "#999999", "#aaaaaa"]) == qr.DEFAULT_COLORS
+    assert qr.palette_colors([]) == qr.DEFAULT_COLORS
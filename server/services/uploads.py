@@ -0,0 +1,141 @@
+# server/services/uploads.py
+"""
+Content-addressed storage for ticket/photo uploads.
+
+The upload is copied in chunks to a temp file while its sha256 is computed,
+so size and type limits apply before anything is kept. Files are stored as
+`<aa>/<bb>/<sha256>.<ext>` under the upload directory; the same content
+uploaded twice is stored once. Image thumbnails are rendered on a small
+background thread pool so the request does not wait for them.
+"""
+import hashlib, logging, os, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+THUMB_SIZE = int(os.getenv("UPLOAD_THUMB_SIZE", "320"))
+THUMB_WORKERS = int(os.getenv("UPLOAD_THUMB_WORKERS", "2"))
+CHUNK_BYTES = 64 * 1024
+
+# extension -> leading magic bytes; the client's filename and mimetype are not trusted
+SIGNATURES = {
+    "jpg": (b"\xff\xd8\xff",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "gif": (b"GIF87a", b"GIF89a"),
+    "webp": (b"RIFF",),  # plus "WEBP" at offset 8, checked below
+    "pdf": (b"%PDF-",),
+}
+ALLOWED_TYPES = tuple(
+    t.strip() for t in os.getenv("UPLOAD_TYPES", ",".join(SIGNATURES)).split(",") if t.strip()
+)
+IMAGE_TYPES = ("jpg", "png", "gif", "webp")
+
+
+class UploadError(ValueError):
+    """Rejected upload; status is the HTTP code to answer with."""
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class StoredUpload:
+    def __init__(self, sha256, path, rel_path, size, ext, created):
+        self.sha256, self.path, self.rel_path = sha256, path, rel_path
+        self.size, self.ext, self.created = size, ext, created
+
+
+def sniff(head: bytes):
+    """File type from its first bytes, or None."""
+    for ext, magics in SIGNATURES.items():
+        if any(head.startswith(m) for m in magics):
+            if ext == "webp" and head[8:12] != b"WEBP":
+                continue
+            return ext
+    return None
+
+
+def content_path(sha256: str, ext: str) -> str:
+    """Relative, sharded location of a file with this hash."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def thumbnail_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".thumb.jpg"
+
+
+def store(stream, upload_dir, *, max_bytes=None, allowed=None) -> StoredUpload:
+    """Copy stream into the content-addressed store; raises UploadError (413/415)."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    allowed = ALLOWED_TYPES if allowed is None else allowed
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size, ext = 0, None
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = sniff(chunk[:16])
+                    if ext not in allowed:
+                        raise UploadError(f"unsupported file type: expected one of {', '.join(allowed)}", 415)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"file too large: max {max_bytes} bytes", 413)
+                digest.update(chunk)
+                out.write(chunk)
+        if ext is None:
+            raise UploadError("empty file", 400)
+
+        sha256 = digest.hexdigest()
+        rel_path = content_path(sha256, ext)
+        path = os.path.join(upload_dir, rel_path)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return StoredUpload(sha256, path, rel_path, size, ext, created)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def make_thumbnail(path: str, size: int = THUMB_SIZE) -> str:
+    """Write a JPEG thumbnail next to the image and return its path."""
+    out_path = thumbnail_path(path)
+    with Image.open(path) as img:
+        img.draft("RGB", (size, size))  # JPEG decodes straight at a reduced scale
+        img = img.convert("RGB")
+        img.thumbnail((size, size))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".thumb-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, "JPEG", quality=82, optimize=True)
+            os.replace(tmp_path, out_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return out_path
+
+
+_thumbnails = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumbnails")
+
+
+def _thumbnail_job(path):
+    try:
+        return make_thumbnail(path)
+    except Exception:
+        log.exception("thumbnail failed for %s", path)
+        return None
+
+
+def schedule_thumbnail(upload: StoredUpload):
+    """Queue a thumbnail for a stored image; returns the Future, or None when there is nothing to do."""
+    if upload.ext not in IMAGE_TYPES or os.path.exists(thumbnail_path(upload.path)):
+        return None
+    return _thumbnails.submit(_thumbnail_job, upload.path)
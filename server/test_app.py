@@ -0,0 +1,827 @@
+#!/usr/bin/env python3
+"""
+API tests for the Flask app, run against a throwaway SQLite database.
+Run from the server directory: python -m pytest test_app.py
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Point the app at scratch storage before it is imported
+_TMP = tempfile.mkdtemp(prefix="musemap-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ["CARD_DIR"] = os.path.join(_TMP, "cards")
+os.environ["UPLOAD_DIR"] = os.path.join(_TMP, "uploads")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+
+import app as musemap
+from services.test_enrich import lastfm_stub  # noqa: F401  (fixture)
+
+app = musemap.create_app({"TESTING": True}, background=True)
+
+
+@pytest.fixture()
+def client():
+    with app.test_client() as c:
+        yield c
+
+
+def _create(client, **overrides):
+    payload = {
+        "artist": "Linkin Park",
+        "venue": "Waldbühne",
+        "city": "Berlin",
+        "country": "Germany",
+        "date": "12-08-2024",
+        "lat": 52.51,
+        "lng": 13.241,
+        "note": "Blue hour",
+    }
+    payload.update(overrides)
+    res = client.post("/memories", json=payload)
+    assert res.status_code == 201, res.get_json()
+    return res.get_json()
+
+
+def _cards(mid):
+    return sorted(f for f in os.listdir(musemap.CARD_DIR) if f.startswith(f"card_{mid}_"))
+
+
+def test_card_is_cached_with_etag(client):
+    mid = _create(client)["id"]
+
+    first = client.get(f"/card/{mid}.png?scale=0.5")
+    assert first.status_code == 200
+    assert first.mimetype == "image/png"
+    etag = first.headers["ETag"]
+    assert etag and not etag.startswith("W/")
+    assert len(_cards(mid)) == 1
+
+    again = client.get(f"/card/{mid}.png?scale=0.5")
+    assert again.headers["ETag"] == etag
+    assert again.data == first.data
+
+    not_modified = client.get(f"/card/{mid}.png?scale=0.5", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+    # a different scale is a different card
+    other = client.get(f"/card/{mid}.png?scale=0.25")
+    assert other.headers["ETag"] != etag
+    assert len(_cards(mid)) == 2
+
+
+def test_card_cache_invalidated_on_change(client):
+    mid = _create(client)["id"]
+    etag = client.get(f"/card/{mid}.png?scale=0.5").headers["ETag"]
+
+    client.put(f"/memories/{mid}", json={"artist": "Linkin Park Live"})
+    assert _cards(mid) == []
+    res = client.get(f"/card/{mid}.png?scale=0.5", headers={"If-None-Match": etag})
+    assert res.status_code == 200 and res.headers["ETag"] != etag
+
+    client.post(f"/memories/{mid}/enrich")
+    assert _cards(mid) == []
+
+    client.get(f"/card/{mid}.png?scale=0.5")
+    client.delete(f"/memories/{mid}")
+    assert _cards(mid) == []
+
+
+def test_card_cache_eviction_is_lru(tmp_path):
+    from services import card_cache
+
+    for i, name in enumerate(["card_1_a.png", "card_2_b.png", "card_3_c.png"]):
+        path = tmp_path / name
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+    # touching the oldest entry makes it most recently used
+    card_cache.lookup(str(tmp_path), "card_1_a.png")
+
+    assert card_cache.evict(str(tmp_path), max_bytes=200) == 1
+    assert sorted(os.listdir(tmp_path)) == ["card_1_a.png", "card_3_c.png"]
+
+
+def test_memories_pagination_filters_and_sorting(client):
+    rows = [
+        ("Arcade Fire", "Montréal", "01-06-2023"),
+        ("Björk", "Reykjavík", "15-03-2024"),
+        ("Arcade Fire", "Paris", "20-07-2024"),
+        ("Caribou", "Montréal", "02-02-2024"),
+        ("Björk", "Paris", "30-12-2024"),
+    ]
+    for artist, city, day in rows:
+        _create(client, artist=artist, city=city, date=day, country="Pagination")
+
+    def page(**params):
+        res = client.get("/memories", query_string={"country": "Pagination", **params})
+        assert res.status_code == 200, res.get_json()
+        return res.get_json(), res.headers.get("X-Next-Cursor")
+
+    items, cursor = page(sort="date", limit=2)
+    seen = [m["date"] for m in items]
+    while cursor:
+        items, cursor = page(sort="date", limit=2, cursor=cursor)
+        seen += [m["date"] for m in items]
+    assert seen == ["01-06-2023", "02-02-2024", "15-03-2024", "20-07-2024", "30-12-2024"]
+
+    items, cursor = page(sort="-artist", limit=3)
+    assert [m["artist"] for m in items] == ["Caribou", "Björk", "Björk"]
+    items, cursor = page(sort="-artist", limit=3, cursor=cursor)
+    assert [m["artist"] for m in items] == ["Arcade Fire", "Arcade Fire"] and cursor is None
+
+    items, _ = page(year=2024, city="Paris")
+    assert [(m["artist"], m["date"]) for m in items] == [("Arcade Fire", "20-07-2024"), ("Björk", "30-12-2024")]
+
+    items, _ = page(distinct="artist", sort="artist")
+    assert [(m["artist"], m["city"]) for m in items] == [
+        ("Arcade Fire", "Montréal"), ("Björk", "Reykjavík"), ("Caribou", "Montréal")]
+    items, _ = page(distinct="city", year=2024)
+    assert sorted(m["city"] for m in items) == ["Montréal", "Paris", "Reykjavík"]
+
+    for bad in ({"sort": "venue"}, {"distinct": "note"}, {"limit": 0}, {"cursor": "%%%"}, {"year": "soon"}):
+        assert client.get("/memories", query_string=bad).status_code == 400
+
+
+def test_memories_in_bbox(client, monkeypatch):
+    from services import geo_index
+
+    tokyo = _create(client, artist="BBox Tokyo", lat=35.68, lng=139.69)["id"]
+    fiji = _create(client, artist="BBox Fiji", lat=-17.71, lng=178.06)["id"]
+    samoa = _create(client, artist="BBox Samoa", lat=-13.76, lng=-172.10)["id"]
+    lisbon = _create(client, artist="BBox Lisbon", lat=38.72, lng=-9.14)["id"]
+
+    def ids(**box):
+        res = client.get("/memories/in-bbox", query_string=box)
+        assert res.status_code == 200, res.get_json()
+        return {m["id"] for m in res.get_json()} & {tokyo, fiji, samoa, lisbon}
+
+    # this table is far below GEO_RTREE_MIN_ROWS, so lower it to query the R*Tree too
+    monkeypatch.setattr(geo_index, "RTREE_MIN_ROWS", 0)
+    for use_rtree in (True, False):
+        if not use_rtree:
+            monkeypatch.setattr(geo_index, "has_rtree", lambda engine: False)
+        assert ids(south=-30, west=120, north=40, east=180) == {tokyo, fiji}
+        # crossing the antimeridian
+        assert ids(south=-30, west=170, north=0, east=-170) == {fiji, samoa}
+        assert ids(south=30, west=-20, north=45, east=0) == {lisbon}
+
+    monkeypatch.undo()
+    assert geo_index.has_rtree(musemap.db_engine)
+    monkeypatch.setattr(geo_index, "RTREE_MIN_ROWS", 0)
+    client.put(f"/memories/{lisbon}", json={"lat": 40.42, "lng": -3.70})
+    assert ids(south=40, west=-5, north=41, east=-3) == {lisbon}
+    client.delete(f"/memories/{lisbon}")
+    assert ids(south=40, west=-5, north=41, east=-3) == set()
+
+    assert client.get("/memories/in-bbox", query_string={"south": 1}).status_code == 400
+    assert client.get("/memories/in-bbox", query_string={"south": 10, "west": 0, "north": 5, "east": 1}).status_code == 400
+
+
+def test_memories_search(client):
+    bjork = _create(client, artist="Björk", venue="Harpa", city="Reykjavík", country="Iceland",
+                    note="Utopia tour, flutes everywhere")["id"]
+    sigur = _create(client, artist="Sigur Rós", venue="Harpa", city="Reykjavík", country="Iceland",
+                    note="Björk was in the crowd")["id"]
+
+    def search(q):
+        res = client.get("/memories/search", query_string={"q": q})
+        assert res.status_code == 200, res.get_json()
+        return [h for h in res.get_json() if h["country"] == "Iceland"]
+
+    # accents ignored, artist hits rank above note hits
+    hits = search("bjork")
+    assert [h["id"] for h in hits][:2] == [bjork, sigur]
+    assert hits[0]["highlights"]["artist"] == "<mark>Björk</mark>"
+    assert "<mark>Björk</mark>" in hits[1]["highlights"]["note"]
+
+    # prefix matching across several words
+    assert [h["id"] for h in search("reyk flut")] == [bjork]
+
+    client.put(f"/memories/{bjork}", json={"note": "Cornucopia"})
+    assert [h["id"] for h in search("flutes")] == []
+    assert [h["id"] for h in search("cornucop")] == [bjork]
+    client.delete(f"/memories/{sigur}")
+    assert sigur not in [h["id"] for h in search("sigur")]
+
+    assert client.get("/memories/search").status_code == 400
+    assert search("***") == []
+
+
+def test_search_highlights_escape_user_text(client, monkeypatch):
+    mid = _create(client, artist="<img src=x onerror=alert(1)> Band", country="Escaped",
+                  note="100% <b>loud</b>")["id"]
+    hit = next(h for h in client.get("/memories/search", query_string={"q": "band"}).get_json() if h["id"] == mid)
+    assert hit["highlights"]["artist"] == "&lt;img src=x onerror=alert(1)&gt; <mark>Band</mark>"
+
+    # the LIKE fallback matches % and _ literally
+    monkeypatch.setattr(musemap.search_index, "has_fts", lambda engine: False)
+    _create(client, artist="Percent Band", country="Escaped", note="1000 people")
+
+    def like(q):
+        return [h["id"] for h in client.get("/memories/search", query_string={"q": q}).get_json()
+                if h["country"] == "Escaped"]
+
+    assert like("100%") == [mid]
+    assert like("_00") == []
+
+
+def test_rebuild_search_command():
+    result = app.test_cli_runner().invoke(args=["rebuild-search"])
+    assert result.exit_code == 0 and "rebuilt" in result.output
+
+
+def test_same_concert_can_be_saved_twice(client):
+    # dedupe is opt-in on bulk import only; plain creates are not constrained
+    first = _create(client, artist="Duplicate Check", venue="Astra")
+    second = _create(client, artist="Duplicate Check", venue="Astra")
+    assert second["id"] != first["id"]
+
+
+def test_bulk_import_ndjson_and_csv(client):
+    def ndjson(*records):
+        return "\n".join(r if isinstance(r, str) else json.dumps(r) for r in records) + "\n"
+
+    row = {"artist": "Bulk Band", "venue": "Arena", "city": "Oslo", "country": "Bulk",
+           "date": "01-05-2024", "lat": 59.9, "lng": 10.7}
+    body = ndjson(
+        row,
+        {**row, "venue": "Club", "date": "2024-05-02", "note": "second night"},
+        "{not json",
+        {**row, "date": "32-13-2024"},
+        {"artist": "Bulk Band", "city": "Oslo"},
+        "",
+        {**row, "venue": "Club", "date": "02-05-2024", "note": "same show twice"},
+    )
+    res = client.post("/memories/bulk?batch_size=2&on_conflict=error", data=body,
+                      content_type="application/x-ndjson")
+    assert res.status_code == 200
+    report = res.get_json()
+    assert (report["inserted"], report["failed"]) == (2, 4)
+    assert [e["line"] for e in report["errors"]] == [3, 4, 5, 7]
+    assert report["errors"][2]["error"] == "missing field: lat"
+    assert report["errors"][3]["error"].startswith("duplicate")
+
+    # re-importing is idempotent with skip, and update rewrites the existing rows
+    res = client.post("/memories/bulk?on_conflict=skip", data=ndjson(row), content_type="application/x-ndjson")
+    assert res.get_json()["skipped"] == 1
+    csv_body = "artist,venue,city,country,date,lat,lng,note\n" \
+               "Bulk Band,Arena,Oslo,Bulk,01-05-2024,59.9,10.7,updated via csv\n" \
+               "Bulk Band,Arena,Bergen,Bulk,03-05-2024,60.4,5.3,\n"
+    res = client.post("/memories/bulk?on_conflict=update", data=csv_body, content_type="text/csv")
+    report = res.get_json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 1, 0)
+
+    items = client.get("/memories", query_string={"country": "Bulk", "sort": "date"}).get_json()
+    assert [(m["date"], m["city"], m["note"]) for m in items] == [
+        ("01-05-2024", "Oslo", "updated via csv"),
+        ("02-05-2024", "Oslo", "second night"),
+        ("03-05-2024", "Bergen", ""),
+    ]
+    assert items[-1]["tracks"] == [] and items[-1]["palette"] == []
+    # bulk rows reach the search index and the map like any other insert, and the triggers
+    # each batch drops while it catches those up are back for the next single insert
+    assert client.get("/memories/search", query_string={"q": "bergen"}).get_json()
+    box = {"south": 60, "west": 5, "north": 61, "east": 6}
+    assert [m["city"] for m in client.get("/memories/in-bbox", query_string=box).get_json()] == ["Bergen"]
+    _create(client, artist="After Bulk", city="Tromso")
+    assert client.get("/memories/search", query_string={"q": "tromso"}).get_json()
+
+    # without on_conflict there is no dedupe: the same row is inserted again
+    res = client.post("/memories/bulk", data=ndjson(row), content_type="application/x-ndjson")
+    assert res.get_json()["inserted"] == 1
+
+    assert client.post("/memories/bulk", data="x", content_type="text/plain").status_code == 400
+    assert client.post("/memories/bulk?format=csv&on_conflict=merge", data="").status_code == 400
+
+
+def test_export_streams_all_formats(client):
+    _create(client, artist="Export Act", country="Export", note='quotes "and", commas')
+    total = len(client.get("/memories").get_json())
+
+    res = client.get("/memories/export?format=ndjson")
+    assert res.status_code == 200 and res.mimetype == "application/x-ndjson"
+    lines = res.get_data(as_text=True).splitlines()
+    assert len(lines) == total
+    row = next(json.loads(line) for line in lines if json.loads(line)["country"] == "Export")
+    assert row["note"] == 'quotes "and", commas' and row["tracks"] == []
+
+    rows = list(csv.DictReader(io.StringIO(client.get("/memories/export?format=csv").get_data(as_text=True))))
+    assert len(rows) == total
+    assert next(r for r in rows if r["country"] == "Export")["note"] == 'quotes "and", commas'
+
+    res = client.get("/memories/export?format=geojson", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    collection = json.loads(gzip.decompress(res.data))
+    assert collection["type"] == "FeatureCollection" and len(collection["features"]) == total
+    feature = next(f for f in collection["features"] if f["properties"]["country"] == "Export")
+    assert feature["geometry"] == {"type": "Point", "coordinates": [13.241, 52.51]}
+
+    assert client.get("/memories/export?format=xml").status_code == 400
+
+
+def test_background_enrichment_jobs(client, monkeypatch):
+    from services import enrich
+
+    monkeypatch.setattr(musemap, "ENRICH_RETRY_DELAY", 0.01)
+    ids = [_create(client, artist=f"Queued {i}")["id"] for i in range(3)]
+
+    res = client.post("/memories/enrich", json={"ids": ids + [999999]})
+    assert res.status_code == 202
+    job = res.get_json()
+    assert res.headers["Location"] == f"/jobs/{job['id']}" and job["total"] == 4
+
+    deadline = time.monotonic() + 10
+    while job["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.02)
+        job = client.get(f"/jobs/{job['id']}").get_json()
+    assert job["status"] == "done" and job["processed"] == 4 and job["failed_ids"] == []
+    assert client.get(f"/memories/{ids[0]}").get_json()["tracks"] == enrich.fake_setlist("Queued 0")
+
+    res = client.post("/memories/enrich", json={"unenriched": True})
+    assert not set(ids) & set(client.get(f"/jobs/{res.get_json()['id']}").get_json()["memory_ids"])
+    musemap.enrich_jobs.join()
+
+    assert client.post("/memories/enrich", json={}).status_code == 400
+    assert client.get("/jobs/999999").status_code == 404
+
+
+def test_enrichment_job_retries_against_stub_server(client, monkeypatch, lastfm_stub):
+    from services import enrich
+
+    monkeypatch.setattr(musemap, "ENRICH_RETRY_DELAY", 0.01)
+    mid = _create(client, artist="Stubbed Artist")["id"]
+    lastfm_stub.fail_first = 2   # two 503s, then success
+
+    job = client.post("/memories/enrich", json={"ids": [mid]}).get_json()
+    musemap.enrich_jobs.join()
+    job = client.get(f"/jobs/{job['id']}").get_json()
+    assert job["status"] == "done" and job["failed_ids"] == []
+    assert len(lastfm_stub.calls) == 3
+    assert client.get(f"/memories/{mid}").get_json()["tracks"][0] == "Stubbed Artist Hit 0"
+
+    # cached per artist: a second job for the same band does not call upstream again
+    job = client.post("/memories/enrich", json={"ids": [mid]}).get_json()
+    musemap.enrich_jobs.join()
+    assert len(lastfm_stub.calls) == 3
+    assert client.get("/enrich/cache").get_json()["hits"] >= 1
+
+    enrich.lookup_cache.clear(persistent=True)
+    lastfm_stub.fail_first = 100  # upstream stays down: retries exhausted
+    job = client.post("/memories/enrich", json={"ids": [mid]}).get_json()
+    musemap.enrich_jobs.join()
+    job = client.get(f"/jobs/{job['id']}").get_json()
+    assert job["status"] == "done" and job["failed_ids"] == [mid] and job["error"]
+
+    # a 4xx other than 429 is not retried
+    lastfm_stub.calls, lastfm_stub.fail_status = [], 404
+    job = client.post("/memories/enrich", json={"ids": [mid]}).get_json()
+    musemap.enrich_jobs.join()
+    job = client.get(f"/jobs/{job['id']}").get_json()
+    assert job["status"] == "done" and job["failed_ids"] == [mid] and len(lastfm_stub.calls) == 1
+    assert client.post(f"/memories/{mid}/enrich").status_code == 502
+
+
+def test_crashed_enrichment_job_is_marked_failed(client, monkeypatch):
+    def crash(*args):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(musemap, "enrich_fields", crash)
+    mid = _create(client, artist="Crashing Artist")["id"]
+    job = client.post("/memories/enrich", json={"ids": [mid]}).get_json()
+    musemap.enrich_jobs.join()
+    job = client.get(f"/jobs/{job['id']}").get_json()
+    assert job["status"] == "failed" and job["error"] == "RuntimeError: database went away"
+
+
+def test_jobs_queued_by_another_process_run_once(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(musemap, "enrich_fields", lambda artist, note: calls.append(artist) or
+                        {"palette": ["#111111"], "tracks": ["Found"]})
+    mid = _create(client, artist="Queued Elsewhere")["id"]
+    # a serve.py worker only inserts the row; the process running the jobs finds it
+    with musemap.get_session() as s:
+        job = musemap.Job(kind="enrich", memory_ids=[mid])
+        s.add(job)
+        s.commit()
+        s.refresh(job)
+    musemap.enrich_jobs.join()
+    assert musemap.enrich_jobs.poll() == 0
+    assert client.get(f"/jobs/{job.id}").get_json()["status"] == "done"
+    assert calls == ["Queued Elsewhere"] and client.get(f"/memories/{mid}").get_json()["tracks"] == ["Found"]
+
+
+def test_importing_app_touches_no_storage(tmp_path):
+    # render processes and serve.py's workers import app; only create_app() and start_jobs() act
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'fresh.db'}",
+           "CARD_DIR": str(tmp_path / "cards"), "UPLOAD_DIR": str(tmp_path / "uploads")}
+    check = "import threading, app; assert threading.active_count() == 1, threading.enumerate()"
+    subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(os.path.abspath(__file__)),
+                   env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_persistent_enrichment_cache_and_prefetch(client, lastfm_stub):
+    from services import enrich
+
+    _create(client, artist="Prefetch One")
+    _create(client, artist="Prefetch Two")
+    result = app.test_cli_runner().invoke(args=["prefetch-enrichment"])
+    assert result.exit_code == 0 and "0 failed" in result.output
+    calls = len(lastfm_stub.calls)
+    assert calls >= 2
+
+    # a fresh process (empty LRU) is served from the persistent table
+    enrich.lookup_cache.clear()
+    assert enrich.fetch_tracks_for_artist("prefetch one")[0] == "Prefetch One Hit 0"
+    assert len(lastfm_stub.calls) == calls
+    assert enrich.lookup_cache.snapshot()["db_hits"] >= 1
+
+
+def test_engine_is_tuned_and_reports_pool_stats(client):
+    with musemap.db_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+    res = client.get("/health/db")
+    assert res.status_code == 200
+    stats = res.get_json()
+    assert stats["dialect"] == "sqlite" and stats["pool"] == "InstrumentedQueuePool"
+    assert stats["checkouts"] > 0 and stats["timeouts"] == 0
+    assert stats["checked_out"] == 0 and stats["avg_wait_seconds"] >= 0
+
+
+def test_sparse_fieldsets(client):
+    _create(client, artist="Fields Other")
+    m = _create(client, artist="Fields Artist", date="03-04-2021")
+    full = client.get(f"/memories/{m['id']}").get_json()
+    assert full == m and full["date"] == "03-04-2021"
+
+    res = client.get("/memories?fields=id,lat,lng,artist&artist=Fields%20Artist")
+    assert res.status_code == 200
+    assert res.get_json() == [{"id": m["id"], "lat": m["lat"], "lng": m["lng"], "artist": "Fields Artist"}]
+
+    # cursor columns are selected even when not requested
+    page = client.get("/memories?fields=artist&sort=-date&limit=1")
+    assert list(page.get_json()[0]) == ["artist"] and page.headers.get("X-Next-Cursor")
+
+    assert client.get(f"/memories/{m['id']}?fields=date").get_json() == {"date": "03-04-2021"}
+    bad = client.get("/memories?fields=id,secret")
+    assert bad.status_code == 400 and "unknown field: secret" in bad.get_json()["error"]
+
+
+def test_stats_follow_writes_and_bulk_import(client):
+    def stats():
+        return client.get("/stats?full=1").get_json()
+
+    before = stats()
+    a = _create(client, artist="Stats Artist", city="Lisbon", country="Portugal", date="10-06-2019")
+    _create(client, artist="Stats Artist", city="Porto", country="Portugal", date="11-06-2019")
+    body = "\n".join(json.dumps({"artist": "Stats Bulk", "venue": f"Hall {i}", "city": "Lisbon",
+                                 "country": "Portugal", "date": "01-01-2018", "lat": 1, "lng": 2}) for i in range(3))
+    assert client.post("/memories/bulk", data=body, content_type="application/x-ndjson").status_code == 200
+
+    after = stats()
+    assert after["total"] == before["total"] + 5
+    assert after["by_artist"]["Stats Artist"] == 2 and after["by_artist"]["Stats Bulk"] == 3
+    assert after["by_country"]["Portugal"] == before.get("by_country", {}).get("Portugal", 0) + 5
+    assert after["by_year"]["2019"] == before["by_year"].get("2019", 0) + 2
+
+    client.put(f"/memories/{a['id']}", json={"city": "Faro", "date": "10-06-2020"})
+    client.delete(f"/memories/{a['id']}")
+    final = stats()
+    assert final["total"] == before["total"] + 4
+    assert "Faro" not in final["by_city"] and final["by_artist"]["Stats Artist"] == 1
+    assert final["top"]["artist"][0]["count"] >= 3 and len(final["top"]["city"]) <= 10
+
+    runner = app.test_cli_runner()
+    assert "consistent" in runner.invoke(args=["check-stats"]).output
+    with musemap.db_engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE memory_stat SET count = count + 7 WHERE dimension = 'artist'")
+    out = runner.invoke(args=["check-stats", "--rebuild"]).output
+    assert "'Stats Bulk': stored 10, actual 3" in out and "rebuilt" in out
+    assert "consistent" in runner.invoke(args=["check-stats"]).output
+    assert client.get("/stats?top=x").status_code == 400
+
+
+def test_timeline_buckets_and_year_pages(client):
+    for d in ("05-03-1991", "20-01-1991", "12-12-1991", "01-07-1992"):
+        _create(client, artist="Timeline Artist", date=d)
+    years = {b["year"]: b["count"] for b in client.get("/timeline").get_json()}
+    assert years[1991] == 3 and years[1992] == 1
+    assert list(years) == sorted(years, reverse=True)
+
+    first = client.get("/timeline/1991?limit=2&fields=artist,date")
+    assert [m["date"] for m in first.get_json()] == ["20-01-1991", "05-03-1991"]
+    assert list(first.get_json()[0]) == ["artist", "date"]
+    rest = client.get(f"/timeline/1991?limit=2&cursor={first.headers['X-Next-Cursor']}")
+    assert [m["date"] for m in rest.get_json()] == ["12-12-1991"] and "X-Next-Cursor" not in rest.headers
+
+    newest = client.get("/timeline/1991?sort=-date").get_json()
+    assert [m["date"] for m in newest] == ["12-12-1991", "05-03-1991", "20-01-1991"]
+    assert client.get("/timeline/1980").get_json() == []
+    assert client.get("/timeline/1991?sort=artist").status_code == 400
+
+
+def test_uploads_are_content_addressed_with_thumbnails(client, monkeypatch):
+    from services import uploads
+
+    buf = io.BytesIO()
+    Image.new("RGB", (1200, 800), "#3355aa").save(buf, "PNG")
+    png = buf.getvalue()
+
+    def post(content, name="ticket.png", **fields):
+        data = {"artist": "Upload Artist", "venue": "Hall", "city": "Rome",
+                "date": "01-02-2023", "lat": "41.9", "lng": "12.5", **fields,
+                "file": (io.BytesIO(content), name)}
+        return client.post("/memories", data=data, content_type="multipart/form-data")
+
+    first, second = post(png), post(png, name="../../same-ticket.png")
+    assert first.status_code == second.status_code == 201
+    asset = first.get_json()["assets"][0]
+    assert second.get_json()["assets"] == [asset]  # deduped by content, client filename ignored
+    sha = hashlib.sha256(png).hexdigest()
+    assert asset == f"uploads/tickets/{sha[:2]}/{sha[2:4]}/{sha}.png"
+    path = os.path.join(musemap.UPLOAD_DIR, sha[:2], sha[2:4], f"{sha}.png")
+    assert open(path, "rb").read() == png
+
+    thumb = uploads.thumbnail_path(path)
+    for _ in range(100):
+        if os.path.exists(thumb):
+            break
+        time.sleep(0.05)
+    with Image.open(thumb) as t:
+        assert max(t.size) == uploads.THUMB_SIZE
+
+    assert post(b"MZ\x90\x00 not an image", name="ticket.png").status_code == 415
+    monkeypatch.setattr(uploads, "MAX_BYTES", 1024)
+    too_big = post(png)
+    assert too_big.status_code == 413 and "too large" in too_big.get_json()["error"]
+    assert not [f for f in os.listdir(musemap.UPLOAD_DIR) if f.startswith(".upload-")]
+
+
+def test_oversized_bodies_are_rejected_before_parsing(client, monkeypatch):
+    assert app.config["MAX_CONTENT_LENGTH"] > musemap.uploads.MAX_BYTES
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 4096)
+    monkeypatch.setattr(musemap.uploads, "store", lambda *a, **kw: pytest.fail("body was parsed"))
+    data = {"artist": "Huge", "city": "Rome", "date": "01-02-2023", "lat": "41.9", "lng": "12.5",
+            "file": (io.BytesIO(b"\x89PNG\r\n\x1a\n" + bytes(8192)), "ticket.png")}
+    res = client.post("/memories", data=data, content_type="multipart/form-data")
+    assert res.status_code == 413 and res.get_json() == {"error": "request too large: max 4096 bytes"}
+
+    # streamed bulk imports are read a batch at a time and not capped
+    row = {"artist": "Big Import", "city": "Oslo", "lat": 59.9, "lng": 10.7}
+    body = "".join(json.dumps({**row, "venue": f"Hall {i}", "date": f"{i % 28 + 1:02d}-01-2020"}) + "\n"
+                   for i in range(100))
+    assert len(body) > 4096
+    res = client.post("/memories/bulk", data=body, content_type="application/x-ndjson")
+    assert res.status_code == 200 and res.get_json()["inserted"] == 100
+
+
+def test_batch_render_command_and_admin_job(client):
+    a = _create(client, artist="Render One")
+    b = _create(client, artist="Render Two")
+    runner = app.test_cli_runner()
+    args = ["render-cards", "--ids", f"{a['id']},{b['id']}", "--size", "feed", "--size", "thumb",
+            "--format", "png", "--format", "webp", "--workers", "2", "--base-url", "http://cards.example/"]
+    out = runner.invoke(args=args).output
+    # one master per card; every size/format is cut from it
+    assert "Rendered 2, skipped 0 unchanged, failed 0" in out and "[2/2]" in out
+    assert len(_cards(a["id"])) == 4 and len(_cards(b["id"])) == 4
+    assert not [f for f in os.listdir(musemap.CARD_DIR) if f.startswith(".tmp-")]
+    assert "Rendered 0, skipped 2 unchanged" in runner.invoke(args=args).output
+    assert runner.invoke(args=["render-cards", "--scale", "9"]).exit_code != 0
+
+    # the endpoint renders for the requesting host, so the lazy route then hits the same files
+    res = client.post("/admin/cards/render", json={"ids": [a["id"]], "sizes": ["feed"]})
+    assert res.status_code == 202
+    musemap.render_jobs.join()
+    job = client.get(res.headers["Location"]).get_json()
+    assert job["status"] == "done" and job["total"] == job["processed"] == 1
+    assert job["params"]["rendered"] == 1
+    before = set(_cards(a["id"]))
+    assert client.get(f"/card/{a['id']}.png").status_code == 200
+    assert set(_cards(a["id"])) == before
+
+    assert client.post("/admin/cards/render", json={"scales": [9]}).status_code == 400
+    assert client.post("/admin/cards/render", json={"sizes": ["poster"]}).status_code == 400
+    assert client.post("/admin/cards/render", json={"formats": ["gif"]}).status_code == 400
+
+
+def test_card_with_palette_qr(client):
+    m = _create(client, artist="QR Artist")
+    mono = client.get(f"/card/{m['id']}.png")
+    palette = client.get(f"/card/{m['id']}.png?qr=palette")
+    assert mono.status_code == palette.status_code == 200
+    assert mono.headers["ETag"] != palette.headers["ETag"]
+    assert client.get(f"/card/{m['id']}.png?qr=rainbow").status_code == 400
+
+
+def test_card_sizes_formats_and_negotiation(client):
+    mid = _create(client, artist="Variant Artist")["id"]
+    feed = client.get(f"/card/{mid}.png")
+    assert feed.status_code == 200 and feed.mimetype == "image/png"
+    assert Image.open(io.BytesIO(feed.data)).size == (640, 960)
+    masters = os.listdir(os.path.join(musemap.CARD_DIR, "masters"))
+
+    # other sizes and formats are cut from the same master, not re-rendered
+    thumb = client.get(f"/card/{mid}.webp?size=thumb")
+    assert thumb.mimetype == "image/webp" and Image.open(io.BytesIO(thumb.data)).size == (320, 480)
+    jpeg = client.get(f"/card/{mid}?format=jpg&size=print")
+    assert jpeg.mimetype == "image/jpeg" and Image.open(io.BytesIO(jpeg.data)).size == (1280, 1920)
+    assert os.listdir(os.path.join(musemap.CARD_DIR, "masters")) == masters
+    assert len({feed.headers["ETag"], thumb.headers["ETag"], jpeg.headers["ETag"]}) == 3
+
+    negotiated = client.get(f"/card/{mid}", headers={"Accept": "image/webp,image/*;q=0.8"})
+    assert negotiated.mimetype == "image/webp" and "Accept" in negotiated.headers["Vary"]
+    assert client.get(f"/card/{mid}", headers={"Accept": "*/*"}).mimetype == "image/png"
+    assert "Vary" not in client.get(f"/card/{mid}.png").headers
+
+    for query in ("size=poster", "format=gif", "scale=3", "scale=0", "scale=big"):
+        assert client.get(f"/card/{mid}?{query}").status_code == 400, query
+
+
+def test_card_renders_are_bounded_and_shed_load(client, monkeypatch):
+    mid = _create(client, artist="Busy Artist")["id"]
+    pool = musemap.render_pool.RenderPool(workers=1, queue_depth=0, timeout=0.05)
+    monkeypatch.setattr(musemap, "card_renderer", pool)
+    try:
+        # slower than the timeout: 503, but the render carries on and lands in the cache
+        slow = client.get(f"/card/{mid}.png?size=print&format=webp")
+        assert slow.status_code == 503 and slow.headers["Retry-After"]
+        # the only worker is still busy and there is no queue (another card: this one would join the render)
+        other = _create(client, artist="Busy Artist Too")["id"]
+        busy = client.get(f"/card/{other}.png?size=thumb")
+        assert busy.status_code == 503 and "busy" in busy.get_json()["error"]
+        deadline = time.time() + 30
+        while pool.snapshot()["in_flight"] and time.time() < deadline:
+            time.sleep(0.05)
+        assert client.get(f"/card/{mid}.png?size=print&format=webp").status_code == 200
+        stats = client.get("/health/render").get_json()
+        assert stats["timeouts"] == 1 and stats["rejected"] == 1 and stats["completed"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_concurrent_requests_for_one_card_share_a_render(client, monkeypatch):
+    mid = _create(client, artist="Stampede")["id"]
+    pool = musemap.render_pool.RenderPool(workers=2, queue_depth=16, timeout=60)
+    monkeypatch.setattr(musemap, "card_renderer", pool)
+    renders = lambda: musemap.metrics.SPAN_SECONDS._series.get(("card.render",), [0])[-1]
+    before = renders()
+    urls = [f"/card/{mid}.png?size=feed"] * 6 + [f"/card/{mid}.webp?size=thumb"] * 6
+    start = threading.Barrier(len(urls))
+    results = {}
+
+    def fetch(i, url):
+        with app.test_client() as c:
+            start.wait()
+            res = c.get(url)
+            results[i] = (url, res.status_code, res.headers.get("ETag"), res.get_data())
+
+    threads = [threading.Thread(target=fetch, args=(i, url)) for i, url in enumerate(urls)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        pool.shutdown()
+
+    assert all(status == 200 for _, status, _, _ in results.values())
+    for url, width in ((urls[0], 640), (urls[-1], 320)):
+        bodies = {body for u, _, _, body in results.values() if u == url}
+        etags = {etag for u, _, etag, _ in results.values() if u == url}
+        assert len(bodies) == 1 and len(etags) == 1
+        assert Image.open(io.BytesIO(bodies.pop())).width == width
+    # one master render; at most one render per variant, everyone else joined one
+    assert renders() - before == 1
+    stats = pool.snapshot()
+    assert stats["submitted"] <= 2 and stats["coalesced"] >= 1 and stats["failed"] == 0
+    # every file was written under a temp name and renamed into place
+    assert not [f for _, _, files in os.walk(musemap.CARD_DIR) for f in files if f.startswith(".tmp-")]
+
+
+def test_card_preview_renders_in_memory(client):
+    def files():
+        return sorted(os.path.join(d, f) for d, _, names in os.walk(musemap.CARD_DIR) for f in names)
+
+    before = files()
+    fields = {"artist": "Preview Band", "city": "Leipzig", "country": "Germany", "date": "01-05-2025",
+              "palette": ["#112233", "#445566", "#778899", "#aabbcc", "#ddeeff"], "tracks": ["One", "Two"]}
+    res = client.post("/card/preview?size=thumb&format=webp", json=fields)
+    assert res.status_code == 200 and res.mimetype == "image/webp"
+    assert "no-store" in res.headers["Cache-Control"]
+    assert Image.open(io.BytesIO(res.get_data())).size == (320, 480)
+    negotiated = client.post("/card/preview", json=fields, headers={"Accept": "image/jpeg"})
+    assert negotiated.mimetype == "image/jpeg" and "Accept" in negotiated.headers["Vary"]
+    # nothing cached or written, and no memory created
+    assert files() == before
+    assert not client.get("/memories/search?q=Preview Band").get_json()
+
+    assert client.post("/card/preview", json={"city": "Leipzig", "date": "01-05-2025"}).get_json() == \
+        {"error": "missing field: artist"}
+    bad = client.post("/card/preview", json={**fields, "palette": ["not-a-color"]})
+    assert bad.status_code == 400 and "invalid value" in bad.get_json()["error"]
+    for body in ({**fields, "artist": 5}, {**fields, "date": 20240101}, {**fields, "venue": ["x"]}, [1, 2]):
+        bad = client.post("/card/preview", json=body)
+        assert bad.status_code == 400 and "invalid value" in bad.get_json()["error"], body
+
+
+def test_metrics_endpoint_and_server_timing(client):
+    mid = _create(client, artist="Metrics Artist")["id"]
+    res = client.get("/memories")
+    assert res.status_code == 200 and 'db;dur=' in res.headers["Server-Timing"]
+    card = client.get(f"/card/{mid}.png?size=thumb")
+    assert "poster.qr;dur=" in card.headers["Server-Timing"] and "card.encode.png" in card.headers["Server-Timing"]
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'musemap_http_request_duration_seconds_count{method="GET",route="/memories",status="200"}' in text
+    assert 'route="/card/<int:mid>.<ext>"' in text
+    assert 'musemap_span_duration_seconds_bucket{span="poster.text",le="+Inf"}' in text
+    assert "musemap_db_queries_total " in text and "musemap_db_pool_checkouts " in text
+
+
+def test_profile_is_opt_in(client, monkeypatch):
+    assert client.get("/memories?profile=1").mimetype == "application/json"
+    monkeypatch.setattr(musemap.metrics, "PROFILE", True)
+    res = client.get("/memories?profile=1")
+    assert res.status_code == 200 and res.mimetype == "text/plain"
+    assert "function calls" in res.get_data(as_text=True)
+
+
+def test_delta_sync_changes_tombstones_and_compaction(client):
+    a = _create(client, artist="Sync A")
+    b = _create(client, artist="Sync B")
+    token = client.get("/memories?limit=1").headers["X-Sync-Token"]
+    assert a["updated_at"].endswith("Z")
+
+    time.sleep(0.01)
+    updated = client.put(f"/memories/{a['id']}", json={"note": "changed"}).get_json()
+    assert updated["updated_at"] > a["updated_at"]
+    c = _create(client, artist="Sync C")
+    client.delete(f"/memories/{b['id']}")
+    bulk = json.dumps({"artist": "Sync D", "venue": "V", "city": "Berlin", "date": "01-01-2020", "lat": 1, "lng": 2})
+    client.post("/memories/bulk", data=bulk + "\n", content_type="application/x-ndjson")
+
+    delta = client.get(f"/memories/changes?since={token}&fields=id,note").get_json()
+    assert [m["id"] for m in delta["changes"]][:2] == [a["id"], c["id"]]
+    assert delta["changes"][0]["note"] == "changed" and delta["changes"][-1].keys() == {"id", "note"}
+    assert len(delta["changes"]) == 3 and delta["deleted"] == [b["id"]] and not delta["more"]
+    assert int(delta["token"]) > int(token)
+    idle = client.get(f"/memories/changes?since={delta['token']}").get_json()
+    assert idle == {"changes": [], "deleted": [], "token": delta["token"], "more": False}
+
+    # paging follows the returned token
+    first = client.get(f"/memories/changes?since={token}&limit=2").get_json()
+    assert first["more"] and len(first["changes"]) + len(first["deleted"]) == 2
+    rest = client.get(f"/memories/changes?since={first['token']}&limit=2").get_json()
+    assert not rest["more"] and rest["token"] == delta["token"]
+
+    for bad in ("-1", "abc"):
+        assert client.get(f"/memories/changes?since={bad}").status_code == 400
+    # a full load comes from GET /memories, which also hands out the first token
+    for missing in ("", "?since="):
+        res = client.get(f"/memories/changes{missing}")
+        assert res.status_code == 400 and res.get_json()["error"].startswith("missing field: since")
+
+    # compacted tombstones expire older tokens; a fresh full fetch gets a usable one
+    out = app.test_cli_runner().invoke(args=["compact-changes", "--days=-1"]).output
+    assert out.startswith("Removed ") and int(out.split()[1]) >= 1
+    assert client.get(f"/memories/changes?since={token}").status_code == 410
+    fresh = client.get("/memories?limit=1").headers["X-Sync-Token"]
+    assert client.get(f"/memories/changes?since={fresh}").status_code == 200
+
+
+def test_delta_sync_keeps_writes_committed_during_a_read(client):
+    token = int(client.get("/memories?limit=1").headers["X-Sync-Token"])
+    written = []
+
+    class Racing:
+        """Connection that lets another writer commit right after each of its reads."""
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, *args, **kwargs):
+            result = self.conn.execute(*args, **kwargs)
+            written.append(_create(client, artist=f"Racer {len(written)}")["id"])
+            return result
+
+    with musemap.db_engine.connect() as conn:
+        changed, _, token, _ = musemap.sync.changes(Racing(conn), token, 100)
+    with musemap.db_engine.connect() as conn:
+        later, _, _, _ = musemap.sync.changes(conn, token, 100)
+    # no write falls between the two deltas
+    assert sorted(set(changed) & set(written) | set(later) & set(written)) == sorted(written)